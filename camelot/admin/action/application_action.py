@@ -350,6 +350,48 @@ Backup the database to disk
                                  total,
                                  text = description)
 
+class ArchiveHistory( Action ):
+    """
+Move old changes out of the memento table, according to the retention
+policies of the memento of the application.  The progress is tracked
+in a :class:`camelot.model.batch_job.BatchJob`, canceling the action or
+the batch job stops the archiving after the current batch.
+
+.. attribute:: batch_job_type_name
+
+    The name of the type of the batch job.
+    """
+
+    verbose_name = _('Archive history')
+    tooltip = _('Move old changes to the archive')
+    icon = Icon('tango/16x16/actions/document-save.png')
+    batch_job_type_name = u'Archive history'
+
+    def model_run( self, model_context ):
+        from sqlalchemy import orm
+        from camelot.model.batch_job import BatchJob, BatchJobType
+        from camelot.view.action_steps import UpdateProgress
+        memento = model_context.admin.get_memento()
+        if memento is None:
+            return
+        batch_job_type = BatchJobType.get_or_create( self.batch_job_type_name )
+        batch_job = BatchJob.create( batch_job_type )
+        with batch_job:
+            archived, canceled = 0, False
+            try:
+                for archived, total, description in memento.archive_changes():
+                    yield UpdateProgress( archived, total, text = description )
+                    if batch_job.is_canceled():
+                        canceled = True
+                        break
+            except CancelRequest:
+                canceled = True
+            batch_job.add_strings_to_message( [ ugettext('%i changes archived')%archived ] )
+            if canceled:
+                batch_session = orm.object_session( batch_job )
+                with batch_session.begin():
+                    batch_job.change_status( 'canceled' )
+
 class Refresh( Action ):
     """Reload all objects from the database and update all views in the
     application."""
@@ -34,6 +34,7 @@ various actions that are beyond the icons shown in the editors of a form.
 
 import inspect
 import os
+import shutil
 
 from ...core.qt import Qt, QtWidgets
 from ...core.utils import ugettext_lazy as _
@@ -310,6 +311,7 @@ class SaveFile(OpenFile):
         local_path = yield action_steps.SaveFile()
         with open(local_path, 'wb') as destination:
             yield action_steps.UpdateProgress(text=_('Saving file'))
-            destination.write(storage.checkout_stream(stored_file).read())
+            shutil.copyfileobj(storage.checkout_stream(stored_file), destination,
+                               storage.chunk_size)
 
 
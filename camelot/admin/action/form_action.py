@@ -86,7 +86,7 @@ class FormActionModelContext( ApplicationActionModelContext ):
             should fetched from the database at the same time.
         :return: a generator over the objects in the list
         """
-        for obj in self._model.get_collection():
+        for obj in self._model.get_collection( yield_per ):
             yield obj
             
     def get_selection( self, yield_per = None ):
@@ -154,13 +154,22 @@ class ShowHistory( Action ):
         
     def model_run( self, model_context ):
         from ..object_admin import ObjectAdmin
+        from ..validator.object_validator import ObjectValidator
         from ...view import action_steps
         from ...view.controls import delegates
             
         obj = model_context.get_object()
         memento = model_context.admin.get_memento()
         
+        class ChangeValidator( ObjectValidator ):
+            
+            def validate_all_rows( self ):
+                # changes cannot be edited, validating them would only load
+                # all changes
+                pass
+        
         class ChangeAdmin( ObjectAdmin ):
+            validator = ChangeValidator
             verbose_name = _('Change')
             verbose_name_plural = _('Changes')
             list_display = ['at', 'by', 'memento_type', 'changes']
@@ -176,9 +185,8 @@ class ShowHistory( Action ):
             primary_key = model_context.admin.primary_key( obj )
             if primary_key is not None:
                 if None not in primary_key:
-                    changes = list( memento.get_changes( model = six.text_type( model_context.admin.entity.__name__ ),
-                                                         primary_key = primary_key,
-                                                         current_attributes = {} ) )
+                    changes = memento.get_change_collection( model = six.text_type( model_context.admin.entity.__name__ ),
+                                                             primary_key = primary_key )
                     admin = ChangeAdmin( model_context.admin, object )
                     step = action_steps.ChangeObjects( changes, admin )
                     step.icon = Icon('tango/16x16/actions/format-justify-fill.png')
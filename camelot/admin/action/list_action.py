@@ -27,7 +27,6 @@
 #
 #  ============================================================================
 
-import codecs
 import copy
 import datetime
 import logging
@@ -113,8 +112,8 @@ class ListActionModelContext( ApplicationActionModelContext ):
         # change, while the selection remains the same, so we should
         # be careful when using the collection to generate selection data
         for (first_row, last_row) in self.selected_rows:
-            for row in range( first_row, last_row + 1 ):
-                yield self._model._get_object( row )
+            for obj in self._model.get_objects( first_row, last_row, yield_per ):
+                yield obj
     
     def get_collection( self, yield_per = None ):
         """
@@ -122,7 +121,7 @@ class ListActionModelContext( ApplicationActionModelContext ):
             should fetched from the database at the same time.
         :return: a generator over the objects in the list
         """
-        for obj in self._model.get_collection():
+        for obj in self._model.get_collection( yield_per ):
             yield obj
             
     def get_object( self ):
@@ -239,7 +238,7 @@ class CallMethod( Action ):
                                                 FlushSession,
                                                 UpdateObject )
         step = max( 1, model_context.selection_count / 100 )
-        for i, obj in enumerate( model_context.get_selection() ):
+        for i, obj in enumerate( model_context.get_selection( yield_per = 100 ) ):
             if i%step == 0:
                 yield UpdateProgress( i, model_context.selection_count )
             self.method( obj )
@@ -333,7 +332,7 @@ class DuplicateSelection( EditAction ):
     
     def model_run( self, model_context ):
         from camelot.view import action_steps
-        for i, obj in enumerate( model_context.get_selection() ):
+        for i, obj in enumerate( model_context.get_selection( yield_per = 100 ) ):
             yield action_steps.UpdateProgress( i, 
                                                model_context.selection_count,
                                                self.verbose_name )
@@ -363,11 +362,23 @@ class DeleteSelection( EditAction ):
         gui_context.item_view.clearSelection()
 
     def model_run( self, model_context ):
+        from camelot.admin.entity_admin import EntityAdmin
         from camelot.view import action_steps
         if model_context.selection_count <= 0:
             raise StopIteration
         admin = model_context.admin
-        objects_to_remove = list( model_context.get_selection() )
+        objects_to_remove = list( model_context.get_selection( yield_per = 100 ) )
+        # the bulk delete replaces handle_object, so it cannot be used by
+        # subclasses that do not delete the objects, such as RemoveSelection,
+        # and it relies on the refresh of a query
+        if isinstance( admin, EntityAdmin ) and admin.allows_bulk_delete() and \
+           six.get_unbound_function( type( self ).handle_object ) is \
+           six.get_unbound_function( DeleteSelection.handle_object ) and \
+           hasattr( model_context._model, 'get_query' ):
+            yield action_steps.UpdateProgress( text = _('Removing') )
+            admin.bulk_delete( objects_to_remove )
+            # the gui is refreshed once the objects have been deleted
+            return
         #
         # it might be impossible to determine the depending objects once
         # the object has been removed from the collection
@@ -591,19 +602,24 @@ class RemoveExportMapping( SaveExportMapping ):
             self.write_mappings(mappings)
 
 class ExportSpreadsheet( ListContextAction ):
-    """Export all rows in a table to a spreadsheet"""
+    """Export all rows in a table to a spreadsheet.  The rows are streamed to
+    an xlsx file, so the number of rows is not limited by the available
+    memory."""
     
     icon = Icon('tango/16x16/mimetypes/x-office-spreadsheet.png')
     tooltip = _('Export to MS Excel')
     verbose_name = _('Export to MS Excel')
 
-    # xlwt options
+    # spreadsheet options
     max_width = 10000
     font_name = 'Arial'
+    # number of rows used to determine the width of the columns
+    sample_size = 100
     
     def model_run( self, model_context ):
+        import itertools
         from decimal import Decimal
-        from xlwt import Font, Borders, XFStyle, Pattern, Workbook
+        from camelot.view.export_utils import XlsxWriter
         from camelot.view.import_utils import ( ColumnMapping,
                                                 ColumnSelectionAdmin )
         from camelot.view.utils import ( local_date_format, 
@@ -646,151 +662,290 @@ class ExportSpreadsheet( ListContextAction ):
         # setup worksheet
         #
         yield action_steps.UpdateProgress( text = _('Create worksheet') )
-        workbook = Workbook()
-        worksheet = workbook.add_sheet('Sheet1')
-        #
-        # keep a global cache of styles, since the number of styles that
-        # can be used is limited.
-        #
-        styles = dict()
-        freeze = lambda d:tuple(sorted(six.iteritems(d)))
-        
-        def get_style( font_specs=dict(), 
-                       border_specs = dict(), 
-                       pattern = None,
-                       num_format_str = None, ):
-            
-            style_key = ( freeze(font_specs), 
-                          freeze(border_specs), 
-                          pattern, 
-                          num_format_str )
-            
-            try:
-                return styles[style_key]
-            except KeyError:
-                style = XFStyle()
-                style.font = Font()
-                for key, value in six.iteritems(font_specs):
-                    setattr( style.font, key, value )
-                style.borders = Borders()
-                for key, value in six.iteritems(border_specs):
-                    setattr( style.borders, key, value )
-                if pattern:
-                    style.pattern = pattern
-                if num_format_str:
-                    style.num_format_str = num_format_str
-                styles[ style_key ] = style
-                return style
-        
-        #
-        # write style
-        #
-        title_style = get_style( dict( font_name = self.font_name,
-                                       bold = True,
-                                       height = 240 ) )
-        worksheet.write( 0, 0, admin.get_verbose_name_plural(), title_style )
-        #
-        # create some patterns and formats
-        #
-        date_format = local_date_format()
-        datetime_format = local_datetime_format()
-        time_format = local_time_format()
-        header_pattern = Pattern()
-        header_pattern.pattern = Pattern.SOLID_PATTERN
-        header_pattern.pattern_fore_colour = 0x16
-        #
-        # write headers
-        #
-        field_names = []
-        for i, (name, field_attributes) in enumerate( columns ):
-            verbose_name = six.text_type( field_attributes.get( 'name', name ) )
-            field_names.append( name )
-            font_specs = dict( font_name = self.font_name, 
-                               bold = True, 
-                               height = 200 )
-            border_specs = dict( top = 0x01 )
-            name = six.text_type( name )
-            if i == 0:
-                border_specs[ 'left' ] = 0x01                
-            elif i == len( columns ) - 1:
-                border_specs[ 'right' ] = 0x01 
-            header_style = get_style( font_specs, border_specs, header_pattern )
-            worksheet.write( 2, i, verbose_name, header_style)
-                
-            if len( name ) < 8:
-                worksheet.col( i ).width = 8 *  375
-            else:
-                worksheet.col( i ).width = len( verbose_name ) *  375
-        #
-        # write data
-        #
-        offset = 3
-        static_attributes = list(admin.get_static_field_attributes(field_names)) 
-        for j, obj in enumerate( model_context.get_collection( yield_per = 100 ) ):
-            dynamic_attributes = admin.get_dynamic_field_attributes( obj, 
-                                                                     field_names )
-            row = offset + j
-            if j % 100 == 0:
-                yield action_steps.UpdateProgress( j, model_context.collection_count )
-            fields = enumerate(six.moves.zip(field_names, 
-                                             static_attributes,
-                                             dynamic_attributes))
-            for i, (name, attributes, delta_attributes) in fields:
-                attributes.update( delta_attributes )
-                value = getattr( obj, name )
-                format_string = '0'
-                if value != None:
-                    if isinstance( value, Decimal ):
-                        value = float( str( value ) )
-                    if isinstance( value, six.string_types ):
-                        if attributes.get( 'translate_content', False ) == True:
-                            value = ugettext( value )
-                    elif isinstance( value, list ):
-                        separator = attributes.get('separator', u', ')
-                        value = separator.join([six.text_type(el) for el in value])
-                    elif isinstance( value, float ):
-                        precision = attributes.get( 'precision', 2 )
-                        format_string = '0.' + '0'*precision
-                    elif isinstance( value, int ):
-                        format_string = '0'
-                    elif isinstance( value, datetime.date ):
-                        format_string = date_format
-                    elif isinstance( value, datetime.datetime ):
-                        format_string = datetime_format
-                    elif isinstance( value, datetime.time ):
-                        format_string = time_format
-                    else:
-                        value = six.text_type( value )
-                else:
-                    # empty cells should be filled as well, to get the
-                    # borders right
-                    value = ''
-                        
-                font_specs = dict( font_name = self.font_name, height = 200 )
-                border_specs = dict()
+        filename = action_steps.OpenFile.create_temporary_file( '.xlsx' )
+        writer = XlsxWriter( filename )
+        try:
+            last_column = len( columns ) - 1
+            #
+            # write style
+            #
+            title_style = writer.add_style( font_name = self.font_name,
+                                            font_size = 12,
+                                            bold = True )
+            #
+            # create some formats
+            #
+            date_format = local_date_format()
+            datetime_format = local_datetime_format()
+            time_format = local_time_format()
+            header_styles = []
+            field_names = []
+            widths = []
+            for i, (name, field_attributes) in enumerate( columns ):
+                verbose_name = six.text_type( field_attributes.get( 'name', name ) )
+                field_names.append( name )
+                borders = ['top']
                 if i == 0:
-                    border_specs[ 'left' ] = 0x01
-                elif i == len( columns ) - 1:
-                    border_specs[ 'right' ] = 0x01
-                if (row - offset + 1) == model_context.collection_count:
-                    border_specs[ 'bottom' ] = 0x01
-                style = get_style( font_specs, 
-                                   border_specs, 
-                                   None, 
-                                   format_string )
-                worksheet.write( row, i, value, style )
-                min_width = len( six.text_type( value ) ) * 300
-                worksheet.col( i ).width = min(self.max_width, max(
-                    min_width,
-                    worksheet.col( i ).width)
-                )
-
-        yield action_steps.UpdateProgress( text = _('Saving file') )
-        filename = action_steps.OpenFile.create_temporary_file( '.xls' )
-        workbook.save( filename )
+                    borders.append( 'left' )
+                elif i == last_column:
+                    borders.append( 'right' )
+                header_styles.append( writer.add_style( font_name = self.font_name,
+                                                        bold = True,
+                                                        fill_color = 'C0C0C0',
+                                                        borders = borders ) )
+                name = six.text_type( name )
+                if len( name ) < 8:
+                    widths.append( 8 *  375 )
+                else:
+                    widths.append( len( verbose_name ) *  375 )
+            #
+            # the style of a cell only depends on the column, the format and
+            # whether it is in the last row
+            #
+            cell_styles = dict()
+
+            def get_cell_style( i, format_string, last_row ):
+                key = ( i, format_string, last_row )
+                try:
+                    return cell_styles[ key ]
+                except KeyError:
+                    borders = []
+                    if i == 0:
+                        borders.append( 'left' )
+                    elif i == last_column:
+                        borders.append( 'right' )
+                    if last_row:
+                        borders.append( 'bottom' )
+                    style = writer.add_style( font_name = self.font_name,
+                                              borders = borders,
+                                              num_format = format_string )
+                    cell_styles[ key ] = style
+                    return style
+            #
+            # convert the data
+            #
+            static_attributes = list(admin.get_static_field_attributes(field_names)) 
+
+            def get_values( obj ):
+                dynamic_attributes = admin.get_dynamic_field_attributes( obj, 
+                                                                         field_names )
+                fields = six.moves.zip(field_names, 
+                                       static_attributes,
+                                       dynamic_attributes)
+                for name, attributes, delta_attributes in fields:
+                    attributes.update( delta_attributes )
+                    value = getattr( obj, name )
+                    format_string = '0'
+                    if value != None:
+                        if isinstance( value, Decimal ):
+                            value = float( str( value ) )
+                        if isinstance( value, six.string_types ):
+                            if attributes.get( 'translate_content', False ) == True:
+                                value = ugettext( value )
+                        elif isinstance( value, list ):
+                            separator = attributes.get('separator', u', ')
+                            value = separator.join([six.text_type(el) for el in value])
+                        elif isinstance( value, float ):
+                            precision = attributes.get( 'precision', 2 )
+                            format_string = '0.' + '0'*precision
+                        elif isinstance( value, int ):
+                            format_string = '0'
+                        elif isinstance( value, datetime.datetime ):
+                            format_string = datetime_format
+                        elif isinstance( value, datetime.date ):
+                            format_string = date_format
+                        elif isinstance( value, datetime.time ):
+                            format_string = time_format
+                        else:
+                            value = six.text_type( value )
+                    else:
+                        # empty cells should be filled as well, to get the
+                        # borders right
+                        value = ''
+                    yield value, format_string
+            #
+            # determine the column widths from the first rows
+            #
+            objects = iter( model_context.get_collection( yield_per = 100 ) )
+            sample = [ ( obj, list( get_values( obj ) ) ) for obj in 
+                       itertools.islice( objects, self.sample_size ) ]
+            for _obj, values in sample:
+                for i, (value, _format_string) in enumerate( values ):
+                    min_width = len( six.text_type( value ) ) * 300
+                    widths[i] = min( self.max_width, max( min_width, widths[i] ) )
+            # xlwt widths are expressed in 1/256 of a character
+            writer.set_column_widths( [ width / 256.0 for width in widths ] )
+            writer.write_row( 0, [ ( admin.get_verbose_name_plural(), title_style ) ] )
+            #
+            # write headers
+            #
+            writer.write_row( 2, [ ( six.text_type( field_attributes.get( 'name', name ) ), header_styles[i] )
+                                   for i, (name, field_attributes) in enumerate( columns ) ] )
+            #
+            # write data
+            #
+            offset = 3
+            rows = itertools.chain( sample,
+                                    ( ( obj, get_values( obj ) ) for obj in objects ) )
+            for j, (_obj, values) in enumerate( rows ):
+                row = offset + j
+                if j % 100 == 0:
+                    yield action_steps.UpdateProgress( j, model_context.collection_count )
+                last_row = (row - offset + 1) == model_context.collection_count
+                writer.write_row( row, [ ( value, get_cell_style( i, format_string, last_row ) )
+                                         for i, (value, format_string) in enumerate( values ) ] )
+
+            yield action_steps.UpdateProgress( text = _('Saving file') )
+            writer.close()
+        finally:
+            # the temporary sheet is removed when the export fails or is canceled
+            writer.discard()
         yield action_steps.UpdateProgress( text = _('Opening file') )
         yield action_steps.OpenFile( filename )
     
+class ExportCSV( ListContextAction ):
+    """Export all rows in a table to a csv file.
+
+    When the list is a query and all columns are mapped to table columns,
+    the rows are fetched with a single select of those columns, without
+    creating objects.  Otherwise the objects in the list are exported.
+    """
+
+    icon = Icon('tango/16x16/mimetypes/text-x-generic.png')
+    tooltip = _('Export to CSV')
+    verbose_name = _('Export to CSV')
+
+    # number of rows fetched and written at once
+    batch_size = 1000
+    extension = '.csv'
+
+    def get_batches( self, model_context, field_names ):
+        """
+        :return: a generator of lists of tuples, with the values of the
+            fields for each row
+        """
+        from sqlalchemy import inspect, orm
+        from camelot.view.import_utils import chunks
+        admin = model_context.admin
+        model = model_context._model
+        mapper = inspect( admin.entity, raiseerr = False )
+        query = None
+        if isinstance( mapper, orm.Mapper ) and hasattr( model, 'get_query' ):
+            column_keys = set( prop.key for prop in mapper.column_attrs )
+            if set( field_names ).issubset( column_keys ):
+                query = model.get_query()
+        if query is not None:
+            query = query.enable_eagerloads( False )
+            query = query.with_entities( *[ getattr( admin.entity, field_name ) for
+                                            field_name in field_names ] )
+            connection = model_context.session.connection( mapper = mapper )
+            result = connection.execution_options( stream_results = True ).execute( query.statement )
+            try:
+                while True:
+                    rows = result.fetchmany( self.batch_size )
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                result.close()
+        else:
+            objects = model_context.get_collection( yield_per = self.batch_size )
+            for chunk in chunks( objects, self.batch_size ):
+                yield [ tuple( getattr( obj, field_name ) for field_name in field_names )
+                        for obj in chunk ]
+
+    def write( self, filename, columns, batches ):
+        """Write the batches of rows to a file, this is a generator that
+        yields the number of rows written after each batch"""
+        from camelot.view.export_utils import UnicodeWriter
+
+        def to_text( value ):
+            if value is None:
+                return u''
+            if isinstance( value, ( datetime.date, datetime.time ) ):
+                return six.text_type( value.isoformat() )
+            return six.text_type( value )
+
+        with open( filename, 'wb' ) as stream:
+            writer = UnicodeWriter( stream )
+            writer.writerows( [ [ six.text_type( field_attributes['name'] ) for
+                                  _field_name, field_attributes in columns ] ] )
+            written = 0
+            for rows in batches:
+                writer.writerows( [ [ to_text( value ) for value in row ] for row in rows ] )
+                written += len( rows )
+                yield written
+
+    def model_run( self, model_context ):
+        from camelot.view import action_steps
+        yield action_steps.UpdateProgress( text = _('Prepare export') )
+        columns = model_context.admin.get_columns()
+        field_names = [ field_name for field_name, _fa in columns ]
+        filename = action_steps.OpenFile.create_temporary_file( self.extension )
+        batches = self.get_batches( model_context, field_names )
+        for written in self.write( filename, columns, batches ):
+            yield action_steps.UpdateProgress( written, model_context.collection_count )
+        yield action_steps.UpdateProgress( text = _('Opening file') )
+        yield action_steps.OpenFile( filename )
+
+class ExportParquet( ExportCSV ):
+    """Export all rows in a table to a parquet file, this requires
+    `pyarrow` to be installed."""
+
+    tooltip = _('Export to Parquet')
+    verbose_name = _('Export to Parquet')
+    extension = '.parquet'
+
+    def get_arrow_type( self, field_attributes ):
+        """:return: the arrow type in which a field will be stored"""
+        import decimal
+        import pyarrow
+        python_type = field_attributes.get( 'python_type' )
+        if python_type is bool:
+            return pyarrow.bool_()
+        if python_type in six.integer_types:
+            return pyarrow.int64()
+        if python_type in ( float, decimal.Decimal ):
+            return pyarrow.float64()
+        if python_type is datetime.datetime:
+            return pyarrow.timestamp( 'us' )
+        if python_type is datetime.date:
+            return pyarrow.date32()
+        if python_type is datetime.time:
+            return pyarrow.time64( 'us' )
+        return pyarrow.string()
+
+    def write( self, filename, columns, batches ):
+        try:
+            import pyarrow
+            from pyarrow import parquet
+        except ImportError:
+            raise UserException( _('Parquet export is not available'),
+                                 resolution = _('Install pyarrow to export to parquet') )
+        types = [ self.get_arrow_type( field_attributes ) for 
+                  _field_name, field_attributes in columns ]
+        schema = pyarrow.schema( [ pyarrow.field( field_name, arrow_type ) for 
+                                   ( field_name, _fa ), arrow_type in zip( columns, types ) ] )
+        converters = []
+        for arrow_type in types:
+            if arrow_type == pyarrow.string():
+                converters.append( lambda v: None if v is None else six.text_type( v ) )
+            elif arrow_type == pyarrow.float64():
+                converters.append( lambda v: None if v is None else float( v ) )
+            else:
+                converters.append( lambda v: v )
+        writer = parquet.ParquetWriter( filename, schema )
+        try:
+            written = 0
+            for rows in batches:
+                arrays = [ pyarrow.array( [ convert( row[i] ) for row in rows ], type = arrow_type ) for 
+                           i, ( convert, arrow_type ) in enumerate( zip( converters, types ) ) ]
+                writer.write_table( pyarrow.Table.from_arrays( arrays, schema = schema ) )
+                written += len( rows )
+                yield written
+        finally:
+            writer.close()
+
 class PrintPreview( ListContextAction ):
     """Print all rows in a table"""
     
@@ -827,101 +982,232 @@ class SelectAll( ListContextAction ):
         gui_context.item_view.selectAll()
         
 class ImportFromFile( EditAction ):
-    """Import a csv file in the current table"""
+    """Import a csv file in the current table.
+
+    The file is streamed : only the first :attr:`preview_rows` rows are read
+    to select the columns and to validate the data, the rest of the file is
+    imported in chunks of :attr:`chunk_size` rows.
+
+    When :attr:`bulk_insert` is `True`, and all selected fields are columns
+    of the mapped table, the rows are inserted with
+    :meth:`sqlalchemy.orm.Session.bulk_insert_mappings` instead of creating
+    an object for each row.  This is much faster, but the objects are not
+    passed through the admin, and the gui is only refreshed at the end.
+
+    The conversion and validation of the chunks can be done in a pool of
+    :attr:`processes` worker processes, when the `from_string` field
+    attributes can be pickled.
+
+    The valid rows are imported and committed while the file is read.  At
+    most :attr:`max_invalid_rows` rows with invalid data are kept, these are
+    presented to the user at the end, to be corrected or deleted.  The user
+    is informed about the number of invalid rows that were not kept.
+
+    When the table displays a query, the imported objects are not appended
+    to the table one by one, the table is refreshed at the end of the import.
+    """
     
     verbose_name = _('Import from file')
     icon = Icon('tango/16x16/mimetypes/text-x-generic.png')
     tooltip = _('Import from file')
+    preview_rows = 100
+    chunk_size = 1000
+    bulk_insert = False
+    processes = None
+    max_invalid_rows = 1000
+
+    def _use_bulk_insert( self, admin, original_fields ):
+        """:return: `True` if the rows can be inserted in bulk"""
+        from sqlalchemy import inspect, orm
+        if not self.bulk_insert:
+            return False
+        mapper = inspect( admin.entity, raiseerr = False )
+        if not isinstance( mapper, orm.Mapper ):
+            return False
+        column_keys = set( prop.key for prop in mapper.column_attrs )
+        return set( original_fields ).issubset( column_keys )
+
+    def _insert_values( self, model_context, admin, values, bulk ):
+        """Insert a chunk of converted rows
+
+        :return: a generator of action steps
+        """
+        from camelot.view import action_steps
+        if not len( values ):
+            return
+        if bulk:
+            model_context.session.bulk_insert_mappings( admin.entity,
+                                                        [ dict( row_values ) for row_values in values ] )
+            return
+        new_entity_instances = []
+        for row_values in values:
+            new_entity_instance = admin.entity()
+            for original_field, value in row_values:
+                setattr( new_entity_instance, original_field, value )
+            admin.add( new_entity_instance )
+            new_entity_instances.append( new_entity_instance )
+        # flush each chunk, to release the imported objects
+        yield action_steps.FlushSession( model_context.session )
+        # a table that displays a query is refreshed at the end
+        if hasattr( model_context._model, 'get_query' ):
+            return
+        for new_entity_instance in new_entity_instances:
+            # in case the model is a collection proxy, the new objects should
+            # be appended
+            model_context._model.append( new_entity_instance )
 
     def model_run( self, model_context ):
-        import os.path
-        import chardet
+        import collections
+        import itertools
         from camelot.view import action_steps
-        from camelot.view.import_utils import ( UnicodeReader, 
+        from camelot.core.orm.query_cache import query_cache
+        from camelot.view.import_utils import ( FileReader,
                                                 RowData, 
                                                 RowDataAdmin,
-                                                XlsReader,
                                                 ColumnMapping,
-                                                ColumnMappingAdmin )
+                                                ColumnMappingAdmin,
+                                                chunks,
+                                                convert_chunks,
+                                                convert_rows )
         file_names = yield action_steps.SelectFile()
         for file_name in file_names:
             yield action_steps.UpdateProgress( text = _('Reading data') )
-            #
-            # read the data into temporary row_data objects
-            #
-            if os.path.splitext( file_name )[-1] in ('.xls', '.xlsx'):
-                items = list(XlsReader(file_name))
-            else:
-                detected = chardet.detect(open(file_name, 'rb').read())['encoding']
-                enc = detected or 'utf-8'
-                items = list(UnicodeReader(codecs.open(file_name, encoding=enc), encoding = enc ))
-            collection = [ RowData(i, row_data) for i, row_data in enumerate( items ) ]
-            if len( collection ) < 1:
-                raise UserException( _('No data in file' ) )
-            #
-            # select columns to import
-            #
-            admin = model_context.admin
-            default_fields = [field for field, fa in admin.get_columns() 
-                              if fa.get('editable', True)]
-            mappings = []
-            # 
-            # it should be possible to select not editable fields, to be able to
-            # import foreign keys, these are not editable by default, it might
-            # be better to explicitly allow foreign keys, but this info is not
-            # in the field attributes
-            #
-            all_fields = [(f,six.text_type(entity_fa['name'])) for f,entity_fa in 
-                         six.iteritems(admin.get_all_fields_and_attributes())]
-            all_fields.sort(key=lambda field_tuple:field_tuple[1])
-            for i, default_field in six.moves.zip_longest(six.moves.range(len(all_fields)),
-                                                          default_fields):
-                mappings.append(ColumnMapping(i, items, default_field))
-            
-    
-            column_mapping_admin = ColumnMappingAdmin(admin,
-                                                      field_choices=all_fields)
-    
-            change_mappings = action_steps.ChangeObjects(mappings, 
-                                                         column_mapping_admin)
-            change_mappings.title = _('Select import column')
-            change_mappings.subtitle = _('Select for each column in which field it should be imported')
-            yield change_mappings
-            #
-            # validate the temporary data
-            #
-            row_data_admin = RowDataAdmin(admin, mappings)
-            yield action_steps.ChangeObjects( collection, row_data_admin )
-            #
-            # Ask confirmation
-            #
-            yield action_steps.MessageBox( icon = QtWidgets.QMessageBox.Warning, 
-                                           title = _('Proceed with import'), 
-                                           text = _('Importing data cannot be undone,\n'
-                                                    'are you sure you want to continue') )
-            #
-            # import the temporary objects into real objects
-            #
-            with model_context.session.begin():
-                for i,row in enumerate( collection ):
-                    new_entity_instance = admin.entity()
-                    for field_name, attributes in row_data_admin.get_columns():
-                        try:
-                            from_string = attributes['from_string']
-                        except KeyError:
-                            LOGGER.warn( 'field %s has no from_string field attribute, dont know how to import it properly'%attributes['original_field'] )
-                            from_string = lambda _a:None
-                        setattr(
-                            new_entity_instance,
-                            attributes['original_field'],
-                            from_string(getattr(row, field_name))
-                        )
-                    admin.add( new_entity_instance )
-                    # in case the model is a collection proxy, the new objects should
-                    # be appended
-                    model_context._model.append( new_entity_instance )
-                    yield action_steps.UpdateProgress( i, len( collection ), _('Importing data') )
-                yield action_steps.FlushSession( model_context.session )
+            reader = FileReader( file_name )
+            try:
+                #
+                # read the first rows into temporary row_data objects
+                #
+                collection = [ RowData( i, row_data ) for i, row_data in
+                               enumerate( itertools.islice( reader, self.preview_rows ) ) ]
+                if len( collection ) < 1:
+                    raise UserException( _('No data in file' ) )
+                previewed = len( collection )
+                #
+                # select columns to import
+                #
+                admin = model_context.admin
+                default_fields = [field for field, fa in admin.get_columns() 
+                                  if fa.get('editable', True)]
+                mappings = []
+                # 
+                # it should be possible to select not editable fields, to be able to
+                # import foreign keys, these are not editable by default, it might
+                # be better to explicitly allow foreign keys, but this info is not
+                # in the field attributes
+                #
+                all_fields = [(f,six.text_type(entity_fa['name'])) for f,entity_fa in 
+                             six.iteritems(admin.get_all_fields_and_attributes())]
+                all_fields.sort(key=lambda field_tuple:field_tuple[1])
+                for i, default_field in six.moves.zip_longest(six.moves.range(len(all_fields)),
+                                                              default_fields):
+                    mappings.append(ColumnMapping(i, collection, default_field))
+                
+        
+                column_mapping_admin = ColumnMappingAdmin(admin,
+                                                          field_choices=all_fields)
+        
+                change_mappings = action_steps.ChangeObjects(mappings, 
+                                                             column_mapping_admin)
+                change_mappings.title = _('Select import column')
+                change_mappings.subtitle = _('Select for each column in which field it should be imported')
+                yield change_mappings
+                #
+                # validate the temporary data
+                #
+                row_data_admin = RowDataAdmin(admin, mappings)
+                yield action_steps.ChangeObjects( collection, row_data_admin )
+                #
+                # Ask confirmation
+                #
+                yield action_steps.MessageBox( icon = QtWidgets.QMessageBox.Warning, 
+                                               title = _('Proceed with import'), 
+                                               text = _('Importing data cannot be undone,\n'
+                                                        'are you sure you want to continue') )
+                #
+                # import the previewed objects and the rest of the file
+                # into real objects
+                #
+                columns = row_data_admin.get_columns()
+                converters = []
+                for field_name, attributes in columns:
+                    from_string = attributes.get( 'from_string' )
+                    if from_string is None:
+                        LOGGER.warn( 'field %s has no from_string field attribute, dont know how to import it properly'%attributes['original_field'] )
+                    converters.append( ( row_data_admin.get_column_index( field_name ),
+                                         attributes['original_field'],
+                                         from_string,
+                                         attributes.get( 'nullable', True ) ) )
+                bulk = self._use_bulk_insert( admin, [c[1] for c in converters] )
+                remaining = ( RowData(i, row_data) for i, row_data in 
+                              enumerate( reader, previewed ) )
+                row_chunks = chunks( itertools.chain( collection, remaining ),
+                                     self.chunk_size )
+                #
+                # the chunks are converted in order, so the rows of a
+                # chunk can be looked up once its conversion is done
+                #
+                pending_chunks = collections.deque()
+                def remember_chunks():
+                    for chunk in row_chunks:
+                        pending_chunks.append( chunk )
+                        yield chunk
+                # the invalid rows are kept to be corrected at the end, of
+                # the rows that are not kept, only the first ids are kept
+                invalid_rows = []
+                skipped_ids = []
+                skipped_count = 0
+                with model_context.session.begin():
+                    for values, errors in convert_chunks( converters,
+                                                          remember_chunks(),
+                                                          self.processes ):
+                        chunk = pending_chunks.popleft()
+                        if len( errors ):
+                            error_ids = set( errors )
+                            for row in chunk:
+                                if row.id not in error_ids:
+                                    continue
+                                if len( invalid_rows ) < self.max_invalid_rows:
+                                    invalid_rows.append( row )
+                                    continue
+                                skipped_count += 1
+                                if len( skipped_ids ) < 100:
+                                    skipped_ids.append( row.id )
+                        for step in self._insert_values( model_context, admin, values, bulk ):
+                            yield step
+                        done, total = reader.progress()
+                        yield action_steps.UpdateProgress( done, total, _('Importing data') )
+                #
+                # the valid rows are committed and shown before the user
+                # corrects or deletes the invalid rows, canceling only skips
+                # those
+                #
+                if len( invalid_rows ):
+                    if bulk:
+                        query_cache.bump( admin.entity )
+                    yield action_steps.Refresh()
+                    correct_rows = action_steps.ChangeObjects( invalid_rows, row_data_admin )
+                    correct_rows.title = _('Invalid data in file')
+                    correct_rows.subtitle = _('Correct or delete the rows with invalid data to finish the import')
+                    corrected_rows = yield correct_rows
+                    values, errors = convert_rows( converters, [ ( row.id, row.values ) for row in corrected_rows ] )
+                    if len( errors ):
+                        raise UserException( _('Invalid data in file'),
+                                             resolution = _('The valid rows have been imported, correct the invalid rows in the file and import them again'),
+                                             detail = _('Rows with invalid data : %s')%u', '.join( six.text_type( r ) for r in errors[:100] ) )
+                    with model_context.session.begin():
+                        for step in self._insert_values( model_context, admin, values, bulk ):
+                            yield step
+                if skipped_count:
+                    yield action_steps.MessageBox( icon = QtWidgets.QMessageBox.Warning,
+                                                   title = _('Invalid data in file'),
+                                                   text = _('%i more rows with invalid data were not imported, starting with rows : %s')%(
+                                                       skipped_count, u', '.join( six.text_type( r ) for r in skipped_ids ) ),
+                                                   standard_buttons = QtWidgets.QMessageBox.Ok )
+            finally:
+                reader.close()
+            if bulk:
+                # the bulk inserted rows bypassed the session
+                query_cache.bump( admin.entity )
             yield action_steps.Refresh()
         
 
@@ -936,12 +1222,24 @@ class ReplaceFieldContents( EditAction ):
     shortcut = QtGui.QKeySequence.Replace
 
     def model_run( self, model_context ):
+        from camelot.admin.entity_admin import EntityAdmin
         from camelot.view import action_steps
         field_name, value = yield action_steps.ChangeField(
             model_context.admin,
             field_name = model_context.current_field_name
         )
         yield action_steps.UpdateProgress( text = _('Replacing field') )
+        admin = model_context.admin
+        if isinstance( admin, EntityAdmin ) and admin.allows_bulk_update( field_name ):
+            if admin.get_field_attributes( field_name ).get( 'editable', True ) == False:
+                raise UserException(self.message, resolution=self.resolution)
+            # the selection is fetched before the update, since the update
+            # might change the order of the rows
+            objects = list( model_context.get_selection( yield_per = 100 ) )
+            with model_context.session.begin():
+                admin.bulk_update( objects, field_name, value )
+            yield action_steps.Refresh()
+            return
         dynamic_field_attributes = model_context.admin.get_dynamic_field_attributes
         with model_context.session.begin():
             for obj in model_context.get_selection():
@@ -32,11 +32,14 @@ Actions to filter table views
 """
 
 import copy
+import time
 
 import six
 
 from sqlalchemy import sql
 
+from ...core.qt import QtCore
+from ...core.threading import synchronized
 from ...core.utils import ugettext
 from .base import Action, Mode
 
@@ -52,8 +55,97 @@ class FilterMode(Mode):
 class All(object):
     pass
 
+class More(object):
+    pass
+
+class FilterValues(QtCore.QObject):
+    """Cache of the values a filter presents to the user, to avoid a query
+    each time a filter is rendered.  The values are kept for a limited time,
+    and are removed from the cache as soon as an object that might change
+    them is created, updated or deleted.
+
+    :param ttl: the number of seconds the values are kept in the cache
+    """
+
+    def __init__(self, ttl=300):
+        super(FilterValues, self).__init__()
+        self._mutex = QtCore.QMutex()
+        self._values = dict()
+        self._connected = False
+        self.ttl = ttl
+
+    @synchronized
+    def get(self, key, limit):
+        """
+        :param key: the key of the filter values, a tuple of the admin and
+            the attribute on which is filtered
+        :param limit: the maximum number of values needed, `None` if all
+            values are needed
+        :return: a list with at most limit + 1 values, or `None` if the
+            values are not in the cache
+        """
+        if not self._connected:
+            from ...view.remote_signals import get_signal_handler
+            get_signal_handler().connect_signals(self)
+            self._connected = True
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        timestamp, _entities, values, complete = entry
+        if (time.time() - timestamp) > self.ttl:
+            del self._values[key]
+            return None
+        if (complete == False) and (limit is None):
+            return None
+        if limit is not None:
+            values = values[:limit+1]
+        return values
+
+    @synchronized
+    def set(self, key, entities, values, complete):
+        """
+        :param key: the key of the filter values
+        :param entities: the classes of which a change might change the values
+        :param values: the list of values
+        :param complete: `True` if values contains all values
+        """
+        self._values[key] = (time.time(), tuple(entities), values, complete)
+
+    @synchronized
+    def invalidate(self, entity=None):
+        """Remove the values that might be changed by an entity from the
+        cache, or all values if no entity is given"""
+        if entity is None:
+            self._values.clear()
+            return
+        for key, entry in list(six.iteritems(self._values)):
+            if isinstance(entity, entry[1]):
+                del self._values[key]
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_update(self, sender, entity):
+        self.invalidate(entity)
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_delete(self, sender, entity):
+        self.invalidate(entity)
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_create(self, sender, entity):
+        self.invalidate(entity)
+
+filter_values = FilterValues()
+
 class Filter(Action):
-    """Base class for filters"""
+    """Base class for filters
+
+    .. attribute:: max_modes
+
+        The maximum number of values presented to the user, when there are
+        more values, a 'More...' mode is presented to request all of them.
+    """
+
+    max_modes = 25
 
     def __init__(self, attribute, default=All, verbose_name=None):
         """
@@ -74,6 +166,7 @@ class Filter(Action):
         self.joins = None
         self.column = None
         self.attributes = None
+        self.entities = None
         self.filter_names = []
 
     def gui_run(self, gui_context, value):
@@ -103,6 +196,39 @@ class Filter(Action):
             query = query.filter(where_clause)
         return query
 
+    def get_limit(self, model_context):
+        """
+        :return: the maximum number of values to present to the user, or
+            `None` if all values should be presented
+        """
+        if model_context.mode_name == More:
+            return None
+        return self.max_modes
+
+    def get_values(self, model_context, entities, query):
+        """Get the values to present to the user from the cache, or from the
+        database if they are not in the cache.
+
+        :param entities: the classes of which a change might change the values
+        :param query: a function returning a query of the values, the query
+            will be limited if needed
+        :return: a tuple with the list of values and a boolean indicating if
+            there are more values than those in the list
+        """
+        limit = self.get_limit(model_context)
+        key = (model_context.admin, self.attribute)
+        values = filter_values.get(key, limit)
+        if values is None:
+            values_query = query()
+            if limit is not None:
+                values_query = values_query.limit(limit+1)
+            values = list(values_query)
+            complete = (limit is None) or (len(values) <= limit)
+            filter_values.set(key, entities, values, complete)
+        if (limit is not None) and (len(values) > limit):
+            return values[:limit], True
+        return values, False
+
     def get_state(self, model_context):
         """
         :return:  a :class:`filter_data` object
@@ -113,6 +239,7 @@ class Filter(Action):
 
         if self.joins is None:
             self.joins = []
+            self.entities = [entity]
             related_admin = model_context.admin
             for field_name in self.attribute.split('.'):
                 attributes = related_admin.get_field_attributes(field_name)
@@ -122,15 +249,18 @@ class Filter(Action):
                 if 'target' in attributes:
                     self.joins.append(getattr(related_admin.entity, field_name))
                     related_admin = attributes['admin']
+                    self.entities.append(related_admin.entity)
             self.column = getattr(related_admin.entity, field_name)
             self.attributes = attributes
         
-        query = session.query(self.column).select_from(entity).join(*self.joins)
-        query = query.distinct()
+        def query():
+            query = session.query(self.column).select_from(entity).join(*self.joins)
+            return query.distinct().order_by(self.column)
 
+        values, more = self.get_values(model_context, self.entities, query)
         modes = list()
 
-        for value in query:
+        for value in values:
             if 'to_string' in self.attributes:
                 verbose_name = self.attributes['to_string'](value[0])
             else:
@@ -160,6 +290,9 @@ class Filter(Action):
                                    verbose_name=ugettext('None'),
                                    checked=True)
             modes.append(none_mode)
+        if more:
+            modes.append(FilterMode(value=More,
+                                    verbose_name=ugettext('More...')))
         state.modes = modes
         return state
 
@@ -108,7 +108,9 @@ shortcut confusion and reduce the number of status updates.
                      list_action.DuplicateSelection(),]
     help_actions = [ application_action.ShowHelp(), ]
     export_actions = [ list_action.PrintPreview(),
-                       list_action.ExportSpreadsheet() ]
+                       list_action.ExportSpreadsheet(),
+                       list_action.ExportCSV(),
+                       list_action.ExportParquet() ]
     form_toolbar_actions = [ form_action.CloseForm(),
                              form_action.ToFirstForm(),
                              form_action.ToPreviousForm(),
@@ -175,6 +177,8 @@ shortcut confusion and reduce the number of status updates.
         can be used to store changes made to objects.  Overwrite this method to
         make it return `None` if no changes should be stored to the database, or
         to return another instance if the changes should be stored elsewhere.
+        To write the changes on a background thread, return an instance
+        with a :class:`camelot.core.memento.MementoWriter`.
 
         :return: `None` or an :class:`camelot.core.memento.SqlMemento` instance
         """
@@ -257,11 +261,13 @@ shortcut confusion and reduce the number of status updates.
             return [ list_action.AddNewObject(),
                      list_action.DeleteSelection(),
                      list_action.DuplicateSelection(),
-                     list_action.ExportSpreadsheet(), ]
+                     list_action.ExportSpreadsheet(),
+                     list_action.ExportCSV(), ]
         if toolbar_area == Qt.RightToolBarArea and direction == 'manytomany':
             return [ list_action.AddExistingObject(),
                      list_action.RemoveSelection(),
-                     list_action.ExportSpreadsheet(), ]
+                     list_action.ExportSpreadsheet(),
+                     list_action.ExportCSV(), ]
 
     def get_form_actions( self ):
         """Specify the action buttons that should appear on each form in the
@@ -38,6 +38,7 @@ from camelot.admin.validator.entity_validator import EntityValidator
 from camelot.core.memento import memento_change
 from camelot.core.orm import Session
 from camelot.core.orm.entity import entity_to_dict
+from camelot.core.orm.query_cache import CachedQuery
 from camelot.types import PrimaryKey
 from camelot.core.qt import Qt
 
@@ -103,11 +104,40 @@ If the user interaction during the copy process needs to be customized as well,
 :class:`camelot.admin.action.list_action.DuplicateSelection` class can be subclassed
 and used as a custom action.
 
+**Caching**
+
+.. attribute:: cache_query
+
+    When set to `True`, the query returned by :meth:`get_query` keeps the
+    primary keys of its results and the number of rows in the
+    :data:`camelot.core.orm.query_cache.query_cache`.  Repeated queries then
+    take their objects from the session instead of from the database.  This
+    is meant for lookup tables that rarely change.  The cached results are
+    discarded when objects of the entity are changed through the gui, other
+    changes should bump the version of the entity ::
+
+        query_cache.bump(Country)
+
+**Bulk operations**
+
+.. attribute:: bulk_operations
+
+    When set to `True`, actions such as
+    :class:`camelot.admin.action.list_action.DeleteSelection` and
+    :class:`camelot.admin.action.list_action.ReplaceFieldContents` use
+    `DELETE` and `UPDATE` statements on chunks of primary keys instead of
+    handling the objects one by one.  The objects are then not passed through
+    :meth:`delete`, and mapper events are not triggered.  The actions fall
+    back to handling each object when the admin reimplements the per object
+    methods, or when the ORM needs to handle related objects.
 
     """
 
     copy_deep = {}
     copy_exclude = []
+    cache_query = False
+    bulk_operations = False
+    bulk_chunk_size = 500
     validator = EntityValidator
 
     def __init__(self, app_admin, entity):
@@ -123,6 +153,7 @@ and used as a custom action.
             raise exception
         # caching
         self._search_fields = None
+        self._search_plan = None
 
     @classmethod
     def get_sql_field_attributes( cls, columns ):
@@ -175,6 +206,8 @@ and used as a custom action.
         displayed in the table or the selection view.  Overwrite this method to
         change the default query, which selects all rows in the database.
         """
+        if self.cache_query:
+            return CachedQuery( self.entity, session = Session() )
         return Session().query( self.entity )
 
     def get_verbose_identifier(self, obj):
@@ -434,6 +467,146 @@ and used as a custom action.
                 session.delete( entity_instance )
                 session.flush()
 
+    def _overrides(self, method_name):
+        """:return: `True` if a method of `EntityAdmin` is reimplemented"""
+        method = getattr(type(self), method_name)
+        return six.get_unbound_function(method) is not \
+               six.get_unbound_function(getattr(EntityAdmin, method_name))
+
+    def allows_bulk_delete(self):
+        """:return: `True` if the objects of this admin can be deleted with a
+        `DELETE` statement, see :attr:`bulk_operations`"""
+        if not self.bulk_operations:
+            return False
+        for method_name in ('delete', 'get_depending_objects', 'get_compounding_objects'):
+            if self._overrides(method_name):
+                return False
+        if len(self.mapper.primary_key) != 1 or len(self.mapper.tables) != 1:
+            return False
+        for relationship_property in self.mapper.relationships:
+            if relationship_property.cascade.delete:
+                return False
+            # the orm would update the foreign keys of the related objects
+            if relationship_property.direction != orm.interfaces.MANYTOONE and \
+               not relationship_property.passive_deletes:
+                return False
+        return True
+
+    def allows_bulk_update(self, field_name):
+        """:return: `True` if a field of the objects of this admin can be
+        changed with an `UPDATE` statement, see :attr:`bulk_operations`"""
+        if not self.bulk_operations:
+            return False
+        for method_name in ('flush', 'get_depending_objects', 'get_compounding_objects'):
+            if self._overrides(method_name):
+                return False
+        if len(self.mapper.primary_key) != 1 or len(self.mapper.tables) != 1:
+            return False
+        if field_name not in self.mapper.column_attrs:
+            return False
+        # relationships depending on the column would be out of date
+        for column in self.mapper.column_attrs[field_name].columns:
+            if column.primary_key or column.foreign_keys:
+                return False
+        return not six.callable(self.get_field_attributes(field_name).get('editable', True))
+
+    def _bulk_chunks(self, session, entity_instances):
+        """Split the persistent instances in chunks, and expunge the pending
+        instances.
+
+        :param session: the session of the instances
+        :return: a generator of lists of instances
+        """
+        iterator = iter(entity_instances)
+        while True:
+            chunk = list(itertools.islice(iterator, self.bulk_chunk_size))
+            if not chunk:
+                break
+            persistent = []
+            for entity_instance in chunk:
+                entity_session = Session.object_session(entity_instance)
+                if entity_session is None:
+                    continue
+                if entity_session is not session:
+                    raise Exception('Bulk operations require all objects to be in the same session')
+                if entity_instance in session.new:
+                    session.expunge(entity_instance)
+                elif entity_instance not in session.deleted:
+                    persistent.append(entity_instance)
+            if persistent:
+                yield persistent
+
+    def _bulk_changed(self):
+        """Discard the cached results that might be changed by a bulk
+        operation, as no signals are sent for the individual objects"""
+        from camelot.core.orm.query_cache import query_cache
+        query_cache.bump(self.entity)
+        list_filter.filter_values.invalidate(self.entity)
+
+    def bulk_delete(self, entity_instances):
+        """Delete entity instances with a `DELETE` statement for each chunk of
+        :attr:`bulk_chunk_size` instances, registering their history per
+        chunk as well.  All chunks are deleted within a single transaction.
+        Use :meth:`allows_bulk_delete` to verify if this is possible.
+        """
+        primary_key_column = self.mapper.primary_key[0]
+        memento = self.get_memento()
+        session = Session()
+        deleted = []
+        with session.begin(subtransactions=True):
+            for persistent in self._bulk_chunks(session, entity_instances):
+                session.flush()
+                primary_keys = [self.primary_key(o)[0] for o in persistent]
+                if memento is not None:
+                    memento.register_changes([
+                        memento_change(model=six.text_type(self.entity.__name__),
+                                       memento_type='before_delete',
+                                       primary_key=(primary_key,),
+                                       previous_attributes=entity_to_dict(o))
+                        for primary_key, o in six.moves.zip(primary_keys, persistent)
+                    ])
+                session.query(self.entity).filter(
+                    primary_key_column.in_(primary_keys)
+                ).delete(synchronize_session=False)
+                deleted.extend(persistent)
+        # the instances are only expunged once the delete succeeded
+        for entity_instance in deleted:
+            session.expunge(entity_instance)
+        self._bulk_changed()
+
+    def bulk_update(self, entity_instances, field_name, value):
+        """Set a field of entity instances to a value with an `UPDATE`
+        statement for each chunk of :attr:`bulk_chunk_size` instances,
+        registering their history per chunk as well.  All chunks are updated
+        within a single transaction.  Use :meth:`allows_bulk_update` to
+        verify if this is possible.
+        """
+        primary_key_column = self.mapper.primary_key[0]
+        memento = self.get_memento()
+        session = Session()
+        updated = []
+        with session.begin(subtransactions=True):
+            for persistent in self._bulk_chunks(session, entity_instances):
+                session.flush()
+                primary_keys = [self.primary_key(o)[0] for o in persistent]
+                if memento is not None:
+                    memento.register_changes([
+                        memento_change(model=six.text_type(self.entity.__name__),
+                                       memento_type='before_update',
+                                       primary_key=(primary_key,),
+                                       previous_attributes={field_name: getattr(o, field_name)})
+                        for primary_key, o in six.moves.zip(primary_keys, persistent)
+                        if getattr(o, field_name) != value
+                    ])
+                session.query(self.entity).filter(
+                    primary_key_column.in_(primary_keys)
+                ).update({field_name: value}, synchronize_session=False)
+                updated.extend(persistent)
+        # the instances are only changed once the update succeeded
+        for entity_instance in updated:
+            orm.attributes.set_committed_value(entity_instance, field_name, value)
+        self._bulk_changed()
+
     def expunge(self, entity_instance):
         """Expunge the entity from the session"""
         session = orm.object_session( entity_instance )
@@ -575,6 +748,16 @@ and used as a custom action.
                     self._search_fields.append(field_name)
         return self._search_fields
 
+    def get_search_plan(self):
+        """
+        :return: a :class:`camelot.view.search.SearchPlan` object that keeps
+            track of how to search in the search fields of this admin.
+        """
+        if self._search_plan is None:
+            from camelot.view.search import SearchPlan
+            self._search_plan = SearchPlan(self)
+        return self._search_plan
+
     def copy(self, obj, new_obj=None):
         """Duplicate an object.  If no new object is given to copy to, a new
         one will be created.  This function will be called every time the
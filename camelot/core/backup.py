@@ -26,13 +26,24 @@
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 #  ============================================================================
+import collections
+import contextlib
+import functools
+import hashlib
+import itertools
 import logging
+import binascii
+import datetime
+import io
+import threading
+import zlib
 
 import six
-from sqlalchemy import types, sql
+from sqlalchemy import schema, types, sql
 
 from .qt import QtGui
 
+from camelot.core.exception import UserException
 from camelot.core.utils import ugettext as _
 from camelot.core.sql import metadata as default_metadata
 
@@ -48,9 +59,82 @@ class BackupMechanism(object):
     from the the database to backup.  When a restore is done, the schema of the
     database is not touched, but the tables are emptied and the data from the
     backup is copied into the existing schema.
+
+    The data of a table is copied in batches of :attr:`batch_size` rows, so
+    the size of a table is not limited by the available memory.
+
+    When :attr:`workers` is larger than 1, that number of tables is copied at
+    the same time, each on its own connection.  A parallel backup no longer
+    reads all tables within the same transaction.  A parallel restore is no
+    longer atomic : the existing data is deleted and committed first, then
+    each table is copied in its own transaction, after the tables it refers
+    to.  When the restore of a table fails, the data of all tables is deleted,
+    so the database is left empty instead of partially restored.  Only use
+    more workers when that is acceptable.  Restores to SQLite are always
+    done by a single worker, since SQLite allows only one writer.
+
+    The sqlite backup file is written with the :attr:`sqlite_bulk_pragmas`,
+    the indices are only created after the data has been loaded, and the
+    file is analyzed, and vacuumed if :attr:`sqlite_vacuum` is `True`.  When
+    restoring, the :attr:`sqlite_read_pragmas` are applied to the backup file.
+
+    When restoring to PostgreSQL, the data is loaded with `COPY FROM STDIN`
+    if :attr:`postgresql_copy` is `True` and the driver supports it, while the
+    triggers of the table are disabled, and the sequences are reset in a
+    single statement once all tables have been restored.  The values are
+    converted by the bind processors of the column types before they are
+    written, tables with a column type that cannot be converted this way are
+    loaded with regular inserts.
+
+    When :attr:`incremental` is `True`, a manifest is stored in the backup
+    file, with the row count, the maximum primary key and a checksum of each
+    range of :attr:`range_size` primary key values of each table.  Such a
+    backup can be used as the base of later backups, which only contain the
+    rows of the ranges that changed, and are restored by replaying the base
+    and the deltas that followed.  Tables without a single integer primary
+    key are handled as a single range.  Incremental backups are always made
+    by a single worker.
+
+    When :attr:`compression` is set, the backup file is compressed in chunks
+    of :attr:`chunk_size` bytes while it is stored, and decompressed in
+    chunks when it is restored.  The compression is detected from the header
+    of the file, so uncompressed backup files can still be restored.  By
+    default backups are not compressed, as they keep their `.db` name, and a
+    zstd backup can only be restored where the zstandard package is
+    installed.
     """
+
+    batch_size = 10000
+    workers = 1
+    # pragmas applied to the backup file while it is written, the file
+    # does not need to survive a crash during the backup
+    sqlite_bulk_pragmas = [('page_size', 4096),
+                           ('journal_mode', 'OFF'),
+                           ('synchronous', 'OFF'),
+                           ('locking_mode', 'EXCLUSIVE'),
+                           ('temp_store', 'MEMORY'),
+                           ('cache_size', -200000)]
+    # pragmas applied to the backup file while it is restored
+    sqlite_read_pragmas = [('cache_size', -200000),
+                           ('temp_store', 'MEMORY'),
+                           ('query_only', 1)]
+    sqlite_vacuum = False
+    incremental = False
+    range_size = 10000
+    manifest_table_name = u'camelot_backup_manifest'
+    # None, 'gzip', 'zstd' or 'auto', zstd requires the zstandard package,
+    # 'auto' uses zstd when it is installed and gzip otherwise
+    compression = None
+    compression_level = 6
+    chunk_size = 64*1024
+    postgresql_copy = True
+    # the triggers disabled while a table is restored to PostgreSQL : None,
+    # 'USER' or 'ALL', disabling all triggers requires superuser privileges.
+    # 'USER' keeps the foreign key checks, which is why tables are always
+    # restored after the tables they refer to.
+    postgresql_disabled_triggers = 'USER'
     
-    def __init__(self, filename, storage=None, metadata=None):
+    def __init__(self, filename, storage=None, metadata=None, previous=None):
         """Backup and restore to a file using it as an sqlite database.
         :param filename: the name of the file in which to store the backup, this
         can be either a local file or the name of a file in the storage.
@@ -60,10 +144,16 @@ class BackupMechanism(object):
         :param metadata: the metadata of the database to be backed up or restored,
             this defaults to the `metadata` object of :module:`camelot.core.sql`.
             This metadata object should not contain any dialect specific constructs.
+        :param previous: a list with the names of the backup files that
+            precede this backup, starting with the base backup.  When a
+            backup is made, only the ranges that changed since the last
+            file of this list are stored.  When a restore is done, the files
+            of this list are replayed before this backup.
         """
         self.filename = six.text_type(filename)
         self.storage = storage
         self.metadata = metadata or default_metadata
+        self.previous = [six.text_type(f) for f in (previous or [])]
 
     @classmethod
     def get_filename_prefix(cls):
@@ -156,11 +246,14 @@ class BackupMechanism(object):
             os.remove(self.filename)
         to_engine = create_engine( u'sqlite:///%s'%temp_file_name, poolclass=NullPool)
         to_connection = to_engine.connect()
+        self.apply_pragmas(to_connection, self.sqlite_bulk_pragmas)
         to_meta_data = MetaData()
         #
-        # Only copy tables, to prevent issues with indices and constraints
+        # Only copy tables, to prevent issues with indices and constraints,
+        # the indices are created after the data has been copied
         #
         from_and_to_tables = []
+        indices = []
         for from_table in from_meta_data.sorted_tables:
             if self.backup_table_filter(from_table):
                 to_table = from_table.tometadata(to_meta_data)
@@ -168,20 +261,82 @@ class BackupMechanism(object):
                 to_table.constraints = set()
                 to_table.primary_key = []
                 to_table.foreign_keys = set()
+                indices.extend(to_table.indexes)
+                to_table.indexes = set()
                 from_and_to_tables.append((from_table, to_table))
         to_meta_data.create_all(to_connection)
 
         number_of_tables = len(from_and_to_tables)
-        from_connection = from_engine.connect()
-        with from_connection.begin():
-            for i,(from_table, to_table) in enumerate(from_and_to_tables):
-                yield (i, number_of_tables + 1, _('Copy data of table %s')%from_table.name)
-                self.copy_table_data(from_table, to_table,
-                                     from_connection, to_connection)
+        previous_manifest = {}
+        if len(self.previous):
+            yield (0, number_of_tables + 1, _('Read manifest of previous backup') )
+            previous_manifest = self.read_backup_manifest(self.previous[-1])
+        if self.incremental or len(self.previous):
+            manifest = {}
+            from_connection = from_engine.connect()
+            with from_connection.begin():
+                for i,(from_table, to_table) in enumerate(from_and_to_tables):
+                    yield (i, number_of_tables + 1, _('Copy changed data of table %s')%from_table.name)
+                    with to_connection.begin():
+                        for rows in self.copy_table_ranges(from_table, to_table,
+                                                           from_connection, to_connection,
+                                                           previous_manifest.get(from_table.name, {}),
+                                                           manifest.setdefault(from_table.name, {})):
+                            yield (i, number_of_tables + 1, _('Copied %i rows of table %s')%(rows, from_table.name))
+            from_connection.close()
+            with to_connection.begin():
+                self.write_manifest(to_connection, manifest)
+        elif self.workers > 1:
+            #
+            # the tables are read in parallel, and written in this thread,
+            # since sqlite does not allow concurrent writes
+            #
+            tasks = [(i, functools.partial(self.read_table_data, from_engine, from_table))
+                     for i, (from_table, _to_table) in enumerate(from_and_to_tables)]
+            tables_completed = 0
+            rows_copied = collections.defaultdict(int)
+            with to_connection.begin():
+                for i, table_data in self.run_parallel(tasks):
+                    from_table, to_table = from_and_to_tables[i]
+                    if table_data is None:
+                        tables_completed += 1
+                        continue
+                    to_connection.execute(to_table.insert(), table_data)
+                    rows_copied[i] += len(table_data)
+                    yield (tables_completed, number_of_tables + 1, _('Copied %i rows of table %s')%(rows_copied[i], from_table.name))
+        else:
+            from_connection = from_engine.connect()
+            with from_connection.begin():
+                for i,(from_table, to_table) in enumerate(from_and_to_tables):
+                    yield (i, number_of_tables + 1, _('Copy data of table %s')%from_table.name)
+                    # each table is copied in a single transaction
+                    with to_connection.begin():
+                        for rows in self.copy_table_data(from_table, to_table,
+                                                         from_connection, to_connection) or []:
+                            yield (i, number_of_tables + 1, _('Copied %i rows of table %s')%(rows, from_table.name))
+            from_connection.close()
+        yield (number_of_tables, number_of_tables + 1, _('Create indices') )
+        for index in indices:
+            index.create(to_connection)
+        yield (number_of_tables, number_of_tables + 1, _('Analyze backup') )
+        to_connection.execute('ANALYZE')
+        if self.sqlite_vacuum:
+            to_connection.execute('VACUUM')
         yield (number_of_tables, number_of_tables + 1, _('Store backup at requested location') )
         to_connection.close()
         to_engine.dispose()
-        if not self.storage:
+        if self.compression is not None:
+            chunks = self.compress_file(temp_file_name)
+            if not self.storage:
+                logger.info(u'compress backup file to its final location')
+                with open(self.filename, 'wb') as backup_file:
+                    for chunk in chunks:
+                        backup_file.write(chunk)
+            else:
+                logger.info(u'compress backup file in to storage with name %s'%self.filename)
+                self.storage.checkin_chunks( chunks, self.filename )
+            os.remove( temp_file_name )
+        elif not self.storage:
             logger.info(u'move backup file to its final location')
             shutil.move(temp_file_name, self.filename)
         else:
@@ -206,24 +361,35 @@ class BackupMechanism(object):
         #
         # Proceed with the restore
         #
-        import os
-        from camelot.core.files.storage import StoredFile
         from sqlalchemy import create_engine
         from sqlalchemy import MetaData
         from sqlalchemy.pool import NullPool
 
         yield (0, 0, _('Open backup file'))
-        if self.storage:
-            if not self.storage.exists(self.filename):
-                raise Exception('Backup file does not exist')
-            stored_file = StoredFile(self.storage, self.filename)
-            filename = self.storage.checkout( stored_file )
-        else:
-            if not os.path.exists(self.filename):
-                raise Exception('Backup file does not exist')
-            filename = self.filename
+        temporary_files = []
+        filename = self.get_local_filename(self.filename, temporary_files)
         from_engine = create_engine('sqlite:///%s'%filename, poolclass=NullPool )
         from_connection = from_engine.connect()
+        #
+        # an incremental backup is restored from the base backup and
+        # the deltas that followed, each range comes from the last file
+        # in which it changed
+        #
+        range_owners = None
+        chain_connections = []
+        if len(self.previous):
+            manifests = []
+            for previous_filename in self.previous:
+                yield (0, 0, _('Open backup file %s')%previous_filename)
+                previous_engine = create_engine('sqlite:///%s'%self.get_local_filename(previous_filename, temporary_files),
+                                                poolclass=NullPool)
+                previous_connection = previous_engine.connect()
+                self.apply_pragmas(previous_connection, self.sqlite_read_pragmas)
+                manifests.append(self.read_manifest(previous_connection, previous_filename))
+                chain_connections.append(previous_connection)
+            manifests.append(self.read_manifest(from_connection, self.filename))
+            chain_connections.append(from_connection)
+            range_owners = self.get_range_owners(manifests)
 
         yield (0, 0, _('Analyzing database structure'))
         from_meta_data = MetaData()
@@ -233,6 +399,19 @@ class BackupMechanism(object):
             if self.restore_table_filter(to_table):
                 to_table.tometadata(from_meta_data)
 
+        parallel = self.workers > 1 and range_owners is None and \
+            to_engine.url.get_dialect().name != 'sqlite'
+        if parallel:
+            for step in self.restore_parallel(from_engine, from_connection,
+                                              from_meta_data, to_engine,
+                                              to_tables):
+                yield step
+            from_connection.close()
+            from_engine.dispose()
+            self.remove_temporary_files(temporary_files)
+            yield (1, 1, _('Restore completed'))
+            return
+
         with to_engine.begin() as to_connection:
             yield (0, 0, _('Prepare database for restore'))
             self.prepare_schema_for_restore(from_connection, to_connection)
@@ -245,35 +424,656 @@ class BackupMechanism(object):
                 yield (i, steps, _('Delete data from table %s')%to_table.name)
                 self.delete_table_data(to_table, to_connection)
     
-            for i,to_table in enumerate(to_tables):
-                if to_table.name in from_meta_data.tables:
-                    yield (number_of_tables+i, steps, _('Copy data from table %s')%to_table.name)
-                    self.copy_table_data(from_meta_data.tables[to_table.name], to_table,
-                                         from_connection, to_connection)
+            #
+            # the connection to the backup file is passed to the schema
+            # hooks, so the read pragmas only apply while copying
+            #
+            with self.pragmas_applied(from_connection, self.sqlite_read_pragmas):
+                for i,to_table in enumerate(to_tables):
+                    if to_table.name in from_meta_data.tables:
+                        yield (number_of_tables+i, steps, _('Copy data from table %s')%to_table.name)
+                        from_table = from_meta_data.tables[to_table.name]
+                        if range_owners is None:
+                            copied = self.copy_table_data(from_table, to_table,
+                                                          from_connection, to_connection)
+                        else:
+                            copied = self.restore_table_ranges(from_table, to_table,
+                                                               chain_connections, to_connection,
+                                                               range_owners.get(to_table.name, {}))
+                        for rows in copied or []:
+                            yield (number_of_tables+i, steps, _('Copied %i rows of table %s')%(rows, to_table.name))
                     
             yield (number_of_tables * 2 + 1, steps, _('Update schema after restore'))
+            self.update_sequences(to_tables, to_connection)
             self.update_schema_after_restore(from_connection, to_connection)
+        for connection in chain_connections[:-1]:
+            connection.close()
+            connection.engine.dispose()
         from_connection.close()
         from_engine.dispose()
+        self.remove_temporary_files(temporary_files)
         
         yield (1, 1, _('Restore completed'))
 
+    def get_local_filename(self, filename, temporary_files):
+        """:return: the name of a local file with the content of the backup
+        file `filename`, checked out of the storage and decompressed if needed
+
+        :param temporary_files: a list to which the names of the temporary
+            files are appended, these should be removed with
+            :meth:`remove_temporary_files` once the backup file is closed.
+        """
+        import os
+        import tempfile
+        from camelot.core.files.storage import StoredFile
+        if self.storage:
+            if not self.storage.exists(filename):
+                raise Exception('Backup file does not exist')
+            stored_file = StoredFile(self.storage, filename)
+            stream = self.storage.checkout_stream( stored_file )
+        else:
+            if not os.path.exists(filename):
+                raise Exception('Backup file does not exist')
+            stream = open(filename, 'rb')
+        with stream:
+            data = stream.read(4)
+            decompressor = self.get_decompressor(data)
+            if decompressor is None:
+                if self.storage:
+                    return self.storage.checkout( stored_file )
+                return filename
+            file_descriptor, temp_file_name = tempfile.mkstemp(suffix='.db')
+            temporary_files.append(temp_file_name)
+            logger.info(u'decompress backup file to %s'%temp_file_name)
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                while len(data):
+                    temp_file.write(decompressor.decompress(data))
+                    data = stream.read(self.chunk_size)
+                if hasattr(decompressor, 'flush'):
+                    temp_file.write(decompressor.flush())
+        return temp_file_name
+
+    def remove_temporary_files(self, temporary_files):
+        import os
+        for temp_file_name in temporary_files:
+            os.remove(temp_file_name)
+        del temporary_files[:]
+
+    def get_compression(self):
+        """:return: the compression used for new backup files, `'auto'`
+            is resolved to `'zstd'` or `'gzip'`"""
+        if self.compression == 'auto':
+            try:
+                self._import_zstandard()
+            except UserException:
+                return 'gzip'
+            return 'zstd'
+        return self.compression
+
+    def get_compressor(self):
+        """:return: an object with `compress` and `flush` methods that
+            compresses with :meth:`get_compression`"""
+        compression = self.get_compression()
+        if compression == 'gzip':
+            return zlib.compressobj(self.compression_level, zlib.DEFLATED,
+                                    16 + zlib.MAX_WBITS)
+        elif compression == 'zstd':
+            return self._import_zstandard().ZstdCompressor(level=self.compression_level).compressobj()
+        raise Exception('Unknown compression %s'%compression)
+
+    def get_decompressor(self, header):
+        """
+        :param header: the first 4 bytes of a backup file
+        :return: an object with a `decompress` method to decompress the file,
+            or `None` if the file is not compressed
+        """
+        if header[:2] == b'\x1f\x8b':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif header[:4] == b'\x28\xb5\x2f\xfd':
+            return self._import_zstandard().ZstdDecompressor().decompressobj()
+        return None
+
+    def _import_zstandard(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise UserException(_('zstd compression is not available'),
+                                resolution=_('Install the zstandard package'))
+        return zstandard
+
+    def compress_file(self, filename):
+        """:return: a generator over the compressed chunks of a file"""
+        compressor = self.get_compressor()
+        with open(filename, 'rb') as uncompressed_file:
+            while True:
+                data = uncompressed_file.read(self.chunk_size)
+                if not len(data):
+                    break
+                compressed_data = compressor.compress(data)
+                if len(compressed_data):
+                    yield compressed_data
+        yield compressor.flush()
+
+    def get_manifest_table(self, meta_data):
+        """:return: the table in which the manifest is stored in the backup
+        file"""
+        return schema.Table(self.manifest_table_name, meta_data,
+                            schema.Column('table_name', types.Unicode(256)),
+                            schema.Column('range_start', types.BigInteger()),
+                            schema.Column('row_count', types.Integer()),
+                            schema.Column('max_primary_key', types.BigInteger()),
+                            schema.Column('checksum', types.Unicode(32)))
+
+    def write_manifest(self, to_connection, manifest):
+        """Store the manifest in the backup file
+
+        :param manifest: a `dict` with for each table name a `dict` with for
+            each range start a tuple `(row_count, max_primary_key, checksum)`
+        """
+        manifest_table = self.get_manifest_table(schema.MetaData())
+        manifest_table.create(to_connection)
+        table_data = []
+        for table_name, ranges in six.iteritems(manifest):
+            for range_start, (row_count, max_primary_key, checksum) in six.iteritems(ranges):
+                table_data.append({'table_name': table_name,
+                                   'range_start': range_start,
+                                   'row_count': row_count,
+                                   'max_primary_key': max_primary_key,
+                                   'checksum': checksum})
+                if len(table_data) >= self.batch_size:
+                    to_connection.execute(manifest_table.insert(), table_data)
+                    table_data = []
+        if len(table_data):
+            to_connection.execute(manifest_table.insert(), table_data)
+
+    def read_manifest(self, from_connection, filename):
+        """:return: the manifest stored in a backup file, in the format used
+            by :meth:`write_manifest`"""
+        if not from_connection.dialect.has_table(from_connection, self.manifest_table_name):
+            raise Exception('Backup file %s has no manifest'%filename)
+        manifest_table = self.get_manifest_table(schema.MetaData())
+        manifest = collections.defaultdict(dict)
+        for row in from_connection.execute(sql.select([manifest_table])):
+            manifest[row.table_name][row.range_start] = (row.row_count,
+                                                         row.max_primary_key,
+                                                         row.checksum)
+        return dict(manifest)
+
+    def read_backup_manifest(self, filename):
+        """:return: the manifest stored in the backup file `filename`"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import NullPool
+        temporary_files = []
+        engine = create_engine('sqlite:///%s'%self.get_local_filename(filename, temporary_files),
+                               poolclass=NullPool)
+        connection = engine.connect()
+        try:
+            return self.read_manifest(connection, filename)
+        finally:
+            connection.close()
+            engine.dispose()
+            self.remove_temporary_files(temporary_files)
+
+    def get_range_owners(self, manifests):
+        """
+        :param manifests: the manifests of a chain of backup files, starting
+            with the base backup
+        :return: a `dict` with for each table name a `dict` with for each
+            range start the index of the file in the chain that holds the
+            rows of that range.
+        """
+        owners = {}
+        previous_manifest = {}
+        for i, manifest in enumerate(manifests):
+            new_owners = {}
+            for table_name, ranges in six.iteritems(manifest):
+                previous_ranges = previous_manifest.get(table_name, {})
+                table_owners = owners.get(table_name, {})
+                new_owners[table_name] = dict(
+                    (range_start, table_owners[range_start]
+                     if previous_ranges.get(range_start) == description else i)
+                    for range_start, description in six.iteritems(ranges)
+                )
+            owners = new_owners
+            previous_manifest = manifest
+        return owners
+
+    def get_range_column(self, table):
+        """:return: the column used to divide a table in ranges of
+            :attr:`range_size` primary key values, or `None` if the table
+            is handled as a single range"""
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) == 1 and isinstance(primary_key[0].type, types.Integer):
+            return primary_key[0]
+        return None
+
+    def fetch_rows(self, connection, query):
+        """:return: a generator over the rows of a query, fetched in batches
+            of :attr:`batch_size` rows"""
+        result = connection.execution_options(stream_results=True).execute(query)
+        try:
+            while True:
+                table_data = result.fetchmany(self.batch_size)
+                if not len(table_data):
+                    break
+                for row in table_data:
+                    yield row
+        finally:
+            result.close()
+
+    def copy_table_ranges(self, from_table, to_table, from_connection, to_connection,
+                          previous_ranges, ranges):
+        """Copy the ranges of a table that changed since the previous backup.
+
+        :param previous_ranges: the ranges of the table in the manifest of the
+            previous backup
+        :param ranges: a `dict` in which the ranges of the table are stored
+        :return: a generator that yields the number of rows copied
+        """
+        range_column = self.get_range_column(from_table)
+        if range_column is None:
+            checksum = hashlib.md5()
+            row_count = 0
+            for row in self.fetch_rows(from_connection, sql.select([from_table])):
+                checksum.update(repr(tuple(row)).encode('utf-8'))
+                row_count += 1
+            ranges[0] = (row_count, None, checksum.hexdigest())
+            if previous_ranges.get(0) != ranges[0]:
+                for rows in self.copy_table_data(from_table, to_table,
+                                                 from_connection, to_connection) or []:
+                    yield rows
+            return
+        query = sql.select([from_table]).order_by(range_column)
+        range_size = self.range_size
+        rows_copied = 0
+        for range_start, rows in itertools.groupby(self.fetch_rows(from_connection, query),
+                                                   lambda row:(row[range_column]//range_size)*range_size):
+            rows = list(rows)
+            checksum = hashlib.md5()
+            for row in rows:
+                checksum.update(repr(tuple(row)).encode('utf-8'))
+            ranges[range_start] = (len(rows), rows[-1][range_column], checksum.hexdigest())
+            if previous_ranges.get(range_start) != ranges[range_start]:
+                to_connection.execute(to_table.insert(), rows)
+                rows_copied += len(rows)
+                yield rows_copied
+
+    def restore_table_ranges(self, from_table, to_table, from_connections, to_connection,
+                             owners):
+        """Copy the ranges of a table from the files of a chain of backups
+
+        :param from_connections: a connection to each file in the chain
+        :param owners: a `dict` with for each range start the index of the
+            file that holds the rows of the range
+        :return: a generator that yields the number of rows copied
+        """
+        range_column = self.get_range_column(to_table)
+        ranges_by_file = collections.defaultdict(list)
+        for range_start, i in six.iteritems(owners):
+            ranges_by_file[i].append(range_start)
+        rows_copied = 0
+        self.disable_triggers(to_table, to_connection)
+        for i, range_starts in sorted(six.iteritems(ranges_by_file)):
+            if range_column is None:
+                queries = [sql.select([from_table])]
+            else:
+                #
+                # adjacent ranges are read with a single query
+                #
+                from_column = from_table.columns[range_column.name]
+                intervals = []
+                for range_start in sorted(range_starts):
+                    if len(intervals) and intervals[-1][1] == range_start:
+                        intervals[-1][1] = range_start + self.range_size
+                    else:
+                        intervals.append([range_start, range_start + self.range_size])
+                queries = [sql.select([from_table]).where(sql.and_(from_column >= start,
+                                                                   from_column < end))
+                           for start, end in intervals]
+            for query in queries:
+                rows = self.fetch_rows(from_connections[i], query)
+                while True:
+                    table_data = list(itertools.islice(rows, self.batch_size))
+                    if not len(table_data):
+                        break
+                    self.insert_table_data(to_table, to_connection, table_data)
+                    rows_copied += len(table_data)
+                    yield rows_copied
+        self.enable_triggers(to_table, to_connection)
+
+    def apply_pragmas(self, connection, pragmas):
+        """Apply pragmas to a connection to an sqlite database
+
+        :param pragmas: a list of `(name, value)` tuples
+        """
+        if connection.engine.url.get_dialect().name != 'sqlite':
+            return
+        for name, value in pragmas:
+            connection.execute('PRAGMA %s = %s'%(name, value))
+
+    @contextlib.contextmanager
+    def pragmas_applied(self, connection, pragmas):
+        """Context manager that applies pragmas to a connection to an sqlite
+        database, and resets them to their previous values on exit.
+
+        :param pragmas: a list of `(name, value)` tuples
+        """
+        previous_pragmas = []
+        if connection.engine.url.get_dialect().name == 'sqlite':
+            for name, _value in pragmas:
+                previous_pragmas.append((name, connection.execute('PRAGMA %s'%name).scalar()))
+        self.apply_pragmas(connection, pragmas)
+        try:
+            yield
+        finally:
+            self.apply_pragmas(connection, previous_pragmas)
+
+    def restore_parallel(self, from_engine, from_connection, from_meta_data,
+                         to_engine, to_tables):
+        """Restore the tables with :attr:`workers` tables at the same time.
+        The tables are restored in waves, a wave only contains tables that
+        refer to tables of previous waves.
+
+        Since each table is restored in its own transaction, the data of the
+        tables that were already restored is deleted again when the restore
+        of a table fails, leaving the database empty instead of partially
+        restored.
+
+        :return: a generator of progress tuples
+        """
+        with to_engine.begin() as to_connection:
+            yield (0, 0, _('Prepare database for restore'))
+            self.prepare_schema_for_restore(from_connection, to_connection)
+
+            number_of_tables = len(to_tables)
+            steps = number_of_tables * 2 + 2
+
+            for i,to_table in enumerate(reversed(to_tables)):
+                yield (i, steps, _('Delete data from table %s')%to_table.name)
+                self.delete_table_data(to_table, to_connection)
+
+        tables_completed = 0
+        restored_tables = [t for t in to_tables if t.name in from_meta_data.tables]
+        try:
+            for wave in self.get_table_waves(restored_tables):
+                tasks = [(to_table, functools.partial(self.restore_table_data,
+                                                      from_engine,
+                                                      from_meta_data.tables[to_table.name],
+                                                      to_engine,
+                                                      to_table)) for to_table in wave]
+                for to_table, rows in self.run_parallel(tasks):
+                    if rows is None:
+                        tables_completed += 1
+                        continue
+                    yield (number_of_tables + tables_completed, steps,
+                           _('Copied %i rows of table %s')%(rows, to_table.name))
+        except Exception:
+            #
+            # the tables of the waves that were started might have been
+            # committed, including the tables of the failing wave
+            #
+            logger.error('Restore failed, delete the data of the restored tables',
+                         exc_info=True)
+            with to_engine.begin() as to_connection:
+                for to_table in reversed(to_tables):
+                    self.delete_table_data(to_table, to_connection)
+            raise
+
+        with to_engine.begin() as to_connection:
+            yield (number_of_tables * 2 + 1, steps, _('Update schema after restore'))
+            self.update_sequences(restored_tables, to_connection)
+            self.update_schema_after_restore(from_connection, to_connection)
+
+    def get_table_waves(self, tables):
+        """Group tables in waves that can be copied at the same time.
+
+        :param tables: a list of tables, sorted by dependency
+        :return: a list of lists of tables, tables only refer to tables in
+            previous waves.
+        """
+        levels = {}
+        for table in tables:
+            level = 0
+            for foreign_key in table.foreign_keys:
+                try:
+                    referred_table = foreign_key.column.table
+                except Exception:
+                    continue
+                if referred_table is not table and referred_table in levels:
+                    level = max(level, levels[referred_table] + 1)
+            levels[table] = level
+        waves = []
+        for table in tables:
+            while len(waves) <= levels[table]:
+                waves.append([])
+            waves[levels[table]].append(table)
+        return waves
+
+    def read_table_data(self, from_engine, from_table):
+        """Read the data of a table on a new connection
+
+        :return: a generator of lists with at most :attr:`batch_size` rows
+        """
+        from_connection = from_engine.connect()
+        try:
+            with from_connection.begin():
+                query = sql.select([from_table])
+                result = from_connection.execution_options(stream_results=True).execute(query)
+                try:
+                    while True:
+                        table_data = result.fetchmany(self.batch_size)
+                        if not len(table_data):
+                            break
+                        yield table_data
+                finally:
+                    result.close()
+        finally:
+            from_connection.close()
+
+    def restore_table_data(self, from_engine, from_table, to_engine, to_table):
+        """Copy the data of a table on new connections, within its own
+        transaction
+
+        :return: a generator that yields the number of rows copied
+        """
+        from_connection = from_engine.connect()
+        self.apply_pragmas(from_connection, self.sqlite_read_pragmas)
+        try:
+            with to_engine.begin() as to_connection:
+                for rows in self.copy_table_data(from_table, to_table,
+                                                 from_connection, to_connection) or []:
+                    yield rows
+        finally:
+            from_connection.close()
+
+    def run_parallel(self, tasks):
+        """Run tasks in :attr:`workers` threads.
+
+        :param tasks: a list of `(key, function)` tuples, where each function
+            returns a generator.
+        :return: a generator of `(key, value)` tuples for each value yielded by
+            the tasks, and `(key, None)` when a task is finished.  Exceptions
+            raised in the tasks are raised in the calling thread.
+        """
+        pending = collections.deque(tasks)
+        results = six.moves.queue.Queue(maxsize=self.workers * 2)
+        stop = threading.Event()
+        lock = threading.Lock()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except six.moves.queue.Full:
+                    pass
+            return False
+
+        def worker():
+            while not stop.is_set():
+                with lock:
+                    if not pending:
+                        break
+                    key, function = pending.popleft()
+                try:
+                    for value in function():
+                        if not put((key, value, None)):
+                            return
+                except Exception as e:
+                    put((key, None, e))
+                    return
+                put((key, None, None))
+
+        threads = [threading.Thread(target=worker) for _i in range(min(self.workers, len(pending)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            remaining = len(tasks)
+            while remaining:
+                key, value, exception = results.get()
+                if exception is not None:
+                    raise exception
+                if value is None:
+                    remaining -= 1
+                yield key, value
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
     def delete_table_data(self, to_table, to_connection):
         """This method might be subclassed to turn off/on foreign key checks"""
         to_connection.execute(to_table.delete())
 
     def copy_table_data(self, from_table, to_table, from_connection, to_connection):
+        """Copy the data of a table in batches of :attr:`batch_size` rows.  The
+        rows are fetched with a server side cursor when the database supports
+        it.
+
+        :return: a generator that yields the number of rows copied after
+            each batch
+        """
         query = sql.select([from_table])
+        result = from_connection.execution_options(stream_results=True).execute(query)
+        rows_copied = 0
+        self.disable_triggers(to_table, to_connection)
+        try:
+            while True:
+                table_data = result.fetchmany(self.batch_size)
+                if not len(table_data):
+                    break
+                self.insert_table_data(to_table, to_connection, table_data)
+                rows_copied += len(table_data)
+                yield rows_copied
+        finally:
+            result.close()
+        self.enable_triggers(to_table, to_connection)
+
+    def insert_table_data(self, to_table, to_connection, table_data):
+        """Insert a batch of rows in a table, with `COPY FROM STDIN` when
+        the table is in a PostgreSQL database.
+        """
+        if self.postgresql_copy and to_connection.engine.url.get_dialect().name == 'postgresql':
+            column_names = list(table_data[0].keys())
+            encoders = [self._get_copy_encoder(to_table.columns[name].type, to_connection.dialect)
+                        for name in column_names]
+            cursor = to_connection.connection.cursor()
+            if hasattr(cursor, 'copy_expert') and None not in encoders:
+                preparer = to_connection.dialect.identifier_preparer
+                stream = io.BytesIO()
+                for row in table_data:
+                    line = u'\t'.join(encode(value) for encode, value in zip(encoders, row))
+                    stream.write(line.encode('utf-8'))
+                    stream.write(b'\n')
+                stream.seek(0)
+                statement = u"COPY %s (%s) FROM STDIN WITH (ENCODING 'UTF8')"%(
+                    preparer.format_table(to_table),
+                    u', '.join(preparer.quote(name) for name in column_names))
+                try:
+                    cursor.copy_expert(statement, stream)
+                finally:
+                    cursor.close()
+                return
+            cursor.close()
+        to_connection.execute(to_table.insert(), table_data)
+
+    def _get_copy_encoder(self, column_type, dialect):
+        """:return: a function that turns a value of a column into the text
+            format of the PostgreSQL COPY statement, after it has been
+            processed by the bind processor of the column type, or `None`
+            if the value cannot be converted"""
+
+        def escape(text):
+            return text.replace(u'\\', u'\\\\').replace(u'\t', u'\\t').replace(u'\n', u'\\n').replace(u'\r', u'\\r')
+
+        def encode_binary(value):
+            return u'\\\\x' + binascii.hexlify(bytes(value)).decode('ascii')
+
+        def encode_float(value):
+            if value != value:
+                return u'NaN'
+            if value in (float('inf'), float('-inf')):
+                return u'Infinity' if value > 0 else u'-Infinity'
+            return six.text_type(repr(value))
+
+        def encode(value):
+            if isinstance(value, bool):
+                return u't' if value else u'f'
+            elif isinstance(value, float):
+                return encode_float(value)
+            elif isinstance(value, (datetime.date, datetime.time)):
+                return value.isoformat()
+            elif isinstance(value, datetime.timedelta):
+                return u'%i days %i seconds %i microseconds'%(value.days, value.seconds, value.microseconds)
+            elif isinstance(value, six.binary_type) and not isinstance(value, six.text_type):
+                return escape(value.decode('utf-8'))
+            return escape(six.text_type(value))
+
+        impl_type = column_type.dialect_impl(dialect)
+        storage_type = impl_type
+        while isinstance(storage_type, types.TypeDecorator):
+            storage_type = storage_type.impl
+        if isinstance(storage_type, types.LargeBinary):
+            # the bind processor of the driver wraps binary values
+            if storage_type is not impl_type:
+                return None
+            return lambda value: u'\\N' if value is None else encode_binary(value)
+        processor = impl_type.bind_processor(dialect)
+        if processor is None:
+            return lambda value: u'\\N' if value is None else encode(value)
+
+        def encode_processed(value):
+            value = processor(value)
+            return u'\\N' if value is None else encode(value)
+
+        return encode_processed
+
+    def disable_triggers(self, to_table, to_connection):
+        """Disable the triggers of a PostgreSQL table while it is restored"""
+        if self.postgresql_disabled_triggers and to_connection.engine.url.get_dialect().name == 'postgresql':
+            to_connection.execute(u'ALTER TABLE %s DISABLE TRIGGER %s'%(
+                to_connection.dialect.identifier_preparer.format_table(to_table),
+                self.postgresql_disabled_triggers))
+
+    def enable_triggers(self, to_table, to_connection):
+        if self.postgresql_disabled_triggers and to_connection.engine.url.get_dialect().name == 'postgresql':
+            to_connection.execute(u'ALTER TABLE %s ENABLE TRIGGER %s'%(
+                to_connection.dialect.identifier_preparer.format_table(to_table),
+                self.postgresql_disabled_triggers))
+
+    def update_sequences(self, to_tables, to_connection):
+        """Set the sequences of the tables after their data has been
+        restored, with a single statement"""
         to_dialect = to_connection.engine.url.get_dialect().name
-        table_data = [row for row in from_connection.execute(query).fetchall()]
-        if len(table_data):
-            to_connection.execute(to_table.insert(), table_data)
-            if to_dialect == 'postgresql':
+        if to_dialect == 'postgresql':
+            setvals = []
+            for to_table in to_tables:
                 for column in to_table.columns:
                     if isinstance(column.type, types.Integer) and column.autoincrement==True and column.primary_key==True:
                         column_name = column.name
                         table_name = to_table.name
                         seq_name = table_name + "_" + column_name + "_seq"
-                        to_connection.execute("select setval('%s', max(%s)) from %s" % (seq_name, column_name, table_name))
-
-
+                        setvals.append("setval('%s', (select max(%s) from %s))" % (seq_name, column_name, table_name))
+            if len(setvals):
+                to_connection.execute("select %s" % ', '.join(setvals))
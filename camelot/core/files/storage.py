@@ -115,8 +115,13 @@ class Storage( object ):
   The methods of this class don't verify if they are called on the model
   thread, because these classes can be used server side or in a non-gui
   script as well.
+
+  Streams are copied in chunks of `chunk_size` bytes, so a file never has to
+  fit in memory.
     """
 
+    chunk_size = 64*1024
+
     def __init__( self, upload_to = '', 
                   stored_file_implementation = StoredFile,
                   root = None ):
@@ -229,15 +234,37 @@ class Storage( object ):
         self.available()
         import shutil
         import os
-        to_path = os.path.join( self.upload_to, filename or os.path.basename( local_path ) )
+        to_path = self._get_checkin_path( filename or os.path.basename( local_path ) )
+        logger.debug( u'copy file from %s to %s', local_path, to_path )
+        shutil.copy( local_path, to_path )
+        return self.stored_file_implementation( self, os.path.basename( to_path ) )
+
+    def checkin_chunks( self, chunks, filename ):
+        """Check a file into the storage, of which the content is produced
+        in chunks, and return a StoredFile
+
+        :param chunks: an iterator over the chunks of bytes to store
+        :param filename: a hint for the filename to be given to the checked
+            in file, as in :meth:`checkin`
+        """
+        self.available()
+        import os
+        to_path = self._get_checkin_path( filename )
+        logger.debug( u'checkin chunks to %s', to_path )
+        with open( to_path, 'wb' ) as file:
+            for chunk in chunks:
+                file.write( chunk )
+        return self.stored_file_implementation( self, os.path.basename( to_path ) )
+
+    def _get_checkin_path( self, filename ):
+        import os
+        to_path = os.path.join( self.upload_to, filename )
         if os.path.exists(to_path):
             # only if the default to_path exists, we'll give it a new name
-            root, extension = os.path.splitext( filename or os.path.basename( local_path ) )
+            root, extension = os.path.splitext( filename )
             ( handle, to_path ) = self._create_tempfile( extension, root )
             os.close( handle )
-        logger.debug( u'copy file from %s to %s', local_path, to_path )
-        shutil.copy( local_path, to_path )
-        return self.stored_file_implementation( self, os.path.basename( to_path ) )
+        return to_path
 
     def checkin_stream( self, prefix, suffix, stream ):
         """Check the datastream in as a file into the storage
@@ -260,10 +287,11 @@ class Storage( object ):
         """
         self.available()
         import os
+        import shutil
         ( handle, to_path ) = self._create_tempfile( suffix, prefix )
         logger.debug(u'checkin stream to %s'%to_path)
         file = os.fdopen( handle, 'wb' )
-        file.write( stream.read() )
+        shutil.copyfileobj( stream, file, self.chunk_size )
         file.flush()
         file.close()
         return self.stored_file_implementation( self, os.path.basename( to_path ) )
@@ -33,13 +33,24 @@ of changes.
 This module contains the `memento_types` variable, which is a list of different
 types of changes that can be tracked.  Add elements to this list to add custom
 tracking of changes
+
+The `memento_encoding` variable holds the encoding used to store the previous
+attributes of a change.  Replace it to store them in another format.
 """
 
+import atexit
+import base64
 import collections
 import datetime
+import decimal
+import itertools
+import json
 import logging
+import threading
+import time
+import zlib
 
-from sqlalchemy import sql, orm, exc
+from sqlalchemy import sql, orm, exc, event, types
 
 import six
 
@@ -52,6 +63,125 @@ memento_types = [ (1, 'before_update'),
                   ]
                                                         
 LOGGER = logging.getLogger( 'camelot.core.memento' )
+
+class JsonEncoding( object ):
+    """Encodes the previous attributes of a change as JSON, with tags for the
+    values that have no JSON representation, such as dates, decimals and
+    tuples.  Values of other types are tagged and pickled.
+
+    Encoded values start with a marker, values without this marker are
+    decoded as pickles, to be able to read history stored before this
+    encoding was used.
+
+    :param compression_threshold: the length in bytes from which the JSON
+        is compressed with zlib, `None` to never compress
+    """
+
+    marker = b'CJ1'
+    compressed_marker = b'CZ1'
+
+    def __init__( self, compression_threshold = 512 ):
+        self.compression_threshold = compression_threshold
+
+    def _encode_value( self, value ):
+        if value is None or isinstance( value, ( six.text_type, bool, float ) + six.integer_types ):
+            return value
+        if isinstance( value, datetime.datetime ):
+            if value.tzinfo is None:
+                return { '__datetime': value.isoformat() }
+        elif isinstance( value, datetime.date ):
+            return { '__date': value.isoformat() }
+        elif isinstance( value, datetime.time ):
+            if value.tzinfo is None:
+                return { '__time': value.isoformat() }
+        elif isinstance( value, datetime.timedelta ):
+            return { '__timedelta': [ value.days, value.seconds, value.microseconds ] }
+        elif isinstance( value, decimal.Decimal ):
+            return { '__decimal': six.text_type( value ) }
+        elif isinstance( value, six.binary_type ):
+            return { '__bytes': base64.b64encode( value ).decode( 'ascii' ) }
+        elif isinstance( value, tuple ):
+            return { '__tuple': [ self._encode_value( v ) for v in value ] }
+        elif isinstance( value, list ):
+            return [ self._encode_value( v ) for v in value ]
+        elif isinstance( value, dict ):
+            return { '__dict': [ [ self._encode_value( k ), self._encode_value( v ) ] for k, v in six.iteritems( value ) ] }
+        return { '__pickle': base64.b64encode( six.moves.cPickle.dumps( value, 2 ) ).decode( 'ascii' ) }
+
+    @staticmethod
+    def _parse_date( text ):
+        # parse the isoformat without strptime, to support years before 1900
+        year, month, day = text.split( '-' )
+        return datetime.date( int( year ), int( month ), int( day ) )
+
+    @staticmethod
+    def _parse_time( text ):
+        # isoformat leaves out the microseconds when they are 0
+        text, _sep, fraction = text.partition( '.' )
+        hour, minute, second = text.split( ':' )
+        return datetime.time( int( hour ), int( minute ), int( second ),
+                              int( fraction.ljust( 6, '0' ) ) if fraction else 0 )
+
+    def _decode_value( self, value ):
+        if isinstance( value, list ):
+            return [ self._decode_value( v ) for v in value ]
+        elif not isinstance( value, dict ):
+            return value
+        tag, tagged = next( six.iteritems( value ) )
+        if tag == '__datetime':
+            date_text, _sep, time_text = tagged.partition( 'T' )
+            return datetime.datetime.combine( self._parse_date( date_text ),
+                                              self._parse_time( time_text ) )
+        elif tag == '__date':
+            return self._parse_date( tagged )
+        elif tag == '__time':
+            return self._parse_time( tagged )
+        elif tag == '__timedelta':
+            return datetime.timedelta( *tagged )
+        elif tag == '__decimal':
+            return decimal.Decimal( tagged )
+        elif tag == '__bytes':
+            return base64.b64decode( tagged )
+        elif tag == '__tuple':
+            return tuple( self._decode_value( v ) for v in tagged )
+        elif tag == '__dict':
+            return dict( ( self._decode_value( k ), self._decode_value( v ) ) for k, v in tagged )
+        elif tag == '__pickle':
+            return six.moves.cPickle.loads( base64.b64decode( tagged ) )
+        raise Exception( 'Unknown memento encoding tag %s'%tag )
+
+    def encode( self, previous_attributes ):
+        """:return: the previous attributes encoded as bytes"""
+        encoded = json.dumps( dict( ( k, self._encode_value( v ) ) for k, v in six.iteritems( previous_attributes ) ),
+                              separators = ( ',', ':' ) ).encode( 'utf-8' )
+        if self.compression_threshold is not None and len( encoded ) >= self.compression_threshold:
+            return self.compressed_marker + zlib.compress( encoded )
+        return self.marker + encoded
+
+    def is_encoded( self, data ):
+        """:return: `True` if the data was encoded by this encoding"""
+        return data[:3] in ( self.marker, self.compressed_marker )
+
+    def decode( self, data ):
+        """:return: the previous attributes, decoded from bytes encoded by
+            this encoding or pickled"""
+        data = bytes( data )
+        if data[:3] == self.marker:
+            encoded = data[3:]
+        elif data[:3] == self.compressed_marker:
+            encoded = zlib.decompress( data[3:] )
+        else:
+            return six.moves.cPickle.loads( data )
+        return dict( ( k, self._decode_value( v ) ) for k, v in six.iteritems( json.loads( encoded.decode( 'utf-8' ) ) ) )
+
+memento_encoding = JsonEncoding()
+
+def memento_insert( memento_table ):
+    """:return: an insert statement for rows of the memento table, with their
+        previous attributes already encoded by the `memento_encoding` in the
+        `encoded_attributes` key of each row"""
+    encoded = sql.bindparam( 'encoded_attributes', type_ = types.LargeBinary )
+    return memento_table.insert().values( { memento_table.c.previous_attributes: encoded } )
             
 #
 # lightweight data structure to present object changes to the memento
@@ -69,6 +199,24 @@ memento_change = collections.namedtuple( 'memento_change',
                                            'previous_attributes', 
                                            'memento_type' ] )
 
+#
+# policy to move changes out of the memento table into the archive
+#
+# :param model: a string with the name of the model, or `None` for the models
+#     without a policy of their own
+# :param max_age: a `datetime.timedelta`, changes older than this are archived
+#
+retention_policy = collections.namedtuple( 'retention_policy',
+                                           [ 'model', 'max_age' ] )
+
+#
+# an archived change, in the same format as a row of the query on the
+# memento table in `get_changes`
+#
+archived_change = collections.namedtuple( 'archived_change',
+                                          [ 'id', 'at', 'by', 'memento_type',
+                                            'previous_attributes' ] )
+
 class Change( object ):
     
     def __init__( self, memento, row ):
@@ -81,10 +229,120 @@ class Change( object ):
             self.changes = u', '.join( ugettext('%s was %s')%(k,six.text_type(v)) for k,v in six.iteritems(row.previous_attributes) )
         self.memento_type = row.memento_type
         
+class MementoWriter( object ):
+    """Writes rows to the memento table on a background thread, with its own
+    connection.  The rows are buffered and written with a single insert
+    statement, at most `flush_interval` milliseconds after they were
+    registered, or as soon as `buffer_size` rows are buffered.
+
+    :param engine: the engine used to connect to the database
+    :param flush_interval: the number of milliseconds to wait for more rows
+        before writing them
+    :param buffer_size: the number of rows after which they are written
+        without waiting
+    """
+
+    _stop = object()
+
+    def __init__( self, engine, flush_interval = 500, buffer_size = 1000 ):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self._queue = six.moves.queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put( self, rows ):
+        """Buffer rows to be written to the memento table
+        :param rows: a list of dicts with the values of the memento columns
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread( target = self._run,
+                                                 name = 'memento writer' )
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register( self.close )
+        self._queue.put( rows )
+
+    def flush( self ):
+        """Block until all rows that were put are written"""
+        if self._thread is not None:
+            written = threading.Event()
+            self._queue.put( written )
+            written.wait()
+
+    def close( self ):
+        """Write the buffered rows and stop the background thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put( self._stop )
+            thread.join()
+
+    def _write( self, connection, rows ):
+        from camelot.core.orm.query_cache import query_cache
+        from camelot.model.memento import Memento
+        if not len( rows ):
+            return
+        memento_table = orm.class_mapper( Memento ).mapped_table
+        try:
+            with connection.begin():
+                connection.execute( memento_insert( memento_table ), rows )
+        except Exception as e:
+            LOGGER.error( 'Programming Error, could not write history', exc_info = e )
+        query_cache.bump( Memento )
+
+    def _run( self ):
+        connection = None
+        rows, deadline = [], None
+        try:
+            while True:
+                timeout = None
+                if deadline is not None:
+                    timeout = max( 0, deadline - time.time() )
+                try:
+                    item = self._queue.get( timeout = timeout )
+                except six.moves.queue.Empty:
+                    item = None
+                if isinstance( item, list ):
+                    rows.extend( item )
+                    if deadline is None:
+                        deadline = time.time() + self.flush_interval / 1000.0
+                    if len( rows ) < self.buffer_size:
+                        continue
+                #
+                # a failing batch is dropped, the thread keeps running and
+                # those waiting for a flush are always released
+                #
+                try:
+                    if connection is None:
+                        connection = self.engine.connect()
+                    self._write( connection, rows )
+                except Exception as e:
+                    LOGGER.error( 'Could not write history', exc_info = e )
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                finally:
+                    rows, deadline = [], None
+                    if isinstance( item, threading.Event ):
+                        item.set()
+                if item is self._stop:
+                    break
+        finally:
+            if connection is not None:
+                connection.close()
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
 class SqlMemento( object ):
     """Default Memento system, which uses :class:`camelot.model.memento.Memento`
     to track changes into a database table.  The tracking of changes happens 
     outside the session, but using the same connection as the session.
+    The changes of a call to :meth:`register_changes` are written with a
+    single insert statement.
     
     Reimplement this class to create a custom system to track changes.
     
@@ -94,12 +352,25 @@ class SqlMemento( object ):
     
     :param memento_types: a list with all types of changes that can be tracked
         and their identifier used to store them
+    :param writer: a :class:`MementoWriter`, if given, the changes are
+        written by the writer, on its own connection, instead of on the
+        connection of the session.
+    :param flush_on_commit: when a writer is used, wait until the changes
+        are written when the transaction of the session commits.
+    :param retention_policies: a list of `retention_policy` tuples, used
+        by :meth:`archive_changes` to move old changes to the archive.  The
+        changes in the archive are still returned by :meth:`get_changes`.
     """
 
-    def __init__( self, memento_types = memento_types ):
+    def __init__( self, memento_types = memento_types, writer = None,
+                  flush_on_commit = False, retention_policies = [] ):
         self.memento_types = memento_types
         self.memento_type_by_id = dict( (i,t) for i,t in memento_types )
         self.memento_id_by_type = dict( (t,i) for i,t in memento_types )
+        self.writer = writer
+        self.flush_on_commit = flush_on_commit
+        self.retention_policies = retention_policies
+        self._archive_available = None
         
     def _get_memento_table( self ):
         """:return: the :class:`sqlalchemy:sqlalchemy.schema.Table` to which to 
@@ -107,6 +378,12 @@ class SqlMemento( object ):
         from camelot.model.memento import Memento
         return orm.class_mapper( Memento ).mapped_table
     
+    def _get_archive_table( self ):
+        """:return: the :class:`sqlalchemy:sqlalchemy.schema.Table` to which
+        changes are archived"""
+        from camelot.model.memento import MementoArchive
+        return orm.class_mapper( MementoArchive ).mapped_table
+
     def _get_authentication_table( self ):
         """:return: the :class:`sqlalchemy:sqlalchemy.schema.Table` in 
         which the authentication id and username are stored"""
@@ -125,31 +402,106 @@ class SqlMemento( object ):
         need to be stored in the memento table.
         """
         from camelot.core.orm import Session
+        from camelot.core.orm.query_cache import query_cache
         from camelot.model.memento import Memento
         authentication_id = self._get_authentication_id()
-        connection = Session().connection(mapper=orm.class_mapper( Memento ))
-        session = orm.Session(bind=connection, autocommit=True)
-        mementos = []
+        creation_date = datetime.datetime.now()
+        rows = []
         for m in memento_changes:
             if len( m.primary_key ) == 1:
-                mementos.append( Memento( model=m.model,
-                                          primary_key=m.primary_key[0],
-                                          previous_attributes=m.previous_attributes,
-                                          memento_type=self.memento_id_by_type.get(m.memento_type, None),
-                                          authentication_id=authentication_id,
-                                          _session=session ) )
-        if len( mementos ):
-            try:
-                session.flush()
-            except exc.DatabaseError as e:
-                LOGGER.error( 'Programming Error, could not flush history', exc_info = e )                
+                encoded_attributes = None
+                if m.previous_attributes is not None:
+                    try:
+                        encoded_attributes = memento_encoding.encode( m.previous_attributes )
+                    except Exception as e:
+                        LOGGER.error( 'Programming Error, could not encode history of %s %s'%( m.model, m.primary_key[0] ),
+                                      exc_info = e )
+                        continue
+                rows.append( dict( model=m.model,
+                                   primary_key=m.primary_key[0],
+                                   creation_date=creation_date,
+                                   encoded_attributes=encoded_attributes,
+                                   memento_type=self.memento_id_by_type.get(m.memento_type, None),
+                                   authentication_id=authentication_id ) )
+        if not len( rows ):
+            return
+        session = Session()
+        if self.writer is not None:
+            self.writer.put( rows )
+            if self.flush_on_commit:
+                self._flush_on_commit( session )
+            return
+        connection = session.connection(mapper=orm.class_mapper( Memento ))
+        try:
+            connection.execute( memento_insert( self._get_memento_table() ), rows )
+        except exc.StatementError as e:
+            LOGGER.error( 'Programming Error, could not flush history', exc_info = e )                
+        query_cache.bump( Memento )
+
+    def _flush_on_commit( self, session ):
+        """Flush the writer when the transaction of the session commits, or
+        immediately when the session is not within a transaction"""
+        transaction = session.transaction
+        if transaction is None:
+            self.writer.flush()
+            return
+        key = ( 'memento_flush_on_commit', id( self ) )
+        if session.info.get( key ) is not transaction:
+            session.info[key] = transaction
+            event.listen( session, 'after_commit',
+                          lambda session:self.writer.flush(), once=True )
     
+    def migrate_encoding( self, connection, batch_size = 1000 ):
+        """Encode the previous attributes of the rows in the memento table
+        that were stored with another encoding with the `memento_encoding`.
+
+        :param connection: the connection on which to migrate the rows, the
+            caller is responsible for the transaction
+        :return: a generator that yields the number of rows migrated after
+            each batch
+        """
+        memento_table = self._get_memento_table()
+        memento_c = memento_table.columns
+        raw_attributes = sql.type_coerce( memento_c.previous_attributes, types.LargeBinary )
+        update = memento_table.update().where( memento_c.id == sql.bindparam( 'memento_id' ) )
+        update = update.values( { memento_c.previous_attributes: sql.bindparam( 'encoded', type_ = types.LargeBinary ) } )
+        last_id, migrated = None, 0
+        while True:
+            query = sql.select( [ memento_c.id, raw_attributes.label( 'raw' ) ] )
+            if last_id is not None:
+                query = query.where( memento_c.id > last_id )
+            query = query.order_by( memento_c.id ).limit( batch_size )
+            rows = connection.execute( query ).fetchall()
+            if not len( rows ):
+                break
+            last_id = rows[-1].id
+            updates = [ dict( memento_id = row.id,
+                              encoded = memento_encoding.encode( memento_encoding.decode( row.raw ) ) )
+                        for row in rows if row.raw is not None and not memento_encoding.is_encoded( bytes( row.raw ) ) ]
+            if len( updates ):
+                connection.execute( update, updates )
+                migrated += len( updates )
+            yield migrated
+
+    def _get_changes_filter( self, model, primary_key, from_datetime, to_datetime ):
+        memento_c = self._get_memento_table().columns
+        clauses = [ memento_c.model == model,
+                    memento_c.primary_key == primary_key[0] ]
+        if from_datetime is not None:
+            clauses.append( memento_c.creation_date >= from_datetime )
+        if to_datetime is not None:
+            clauses.append( memento_c.creation_date < to_datetime )
+        return sql.and_( *clauses )
+
     def get_changes( self, 
                      model, 
                      primary_key, 
                      current_attributes,
                      from_datetime = datetime.datetime(2000,1,1),
-                     depth = {} ):
+                     depth = {},
+                     to_datetime = None,
+                     offset = 0,
+                     limit = None ):
         """Query the memento system for changes made to an object.
         
         :param model: a string with the name of the model
@@ -160,23 +512,297 @@ class SqlMemento( object ):
             reconstructed.
         :param depth: reserved for future usage to query the history of
             object trees.
+        :param to_datetime: if not `None`, only the changes before this
+            `datetime` are returned.
+        :param offset: the number of changes to skip
+        :param limit: if not `None`, the maximum number of changes to return
         :return: generator of `change_object` tuples in reverse order, meaning the
             last change will be first generated.
         """
-        memento_c = self._get_memento_table().columns
+        memento_table = self._get_memento_table()
+        memento_c = memento_table.columns
         authentication_table = self._get_authentication_table()
         authentication_c = authentication_table.columns
-        authentication_query = sql.select( [authentication_c.username], 
-                                           authentication_c.id == memento_c.authentication_id )
         query = sql.select( [ memento_c.id.label('id'),
                               memento_c.creation_date.label('at'),
-                              authentication_query.as_scalar().label('by'),
+                              authentication_c.username.label('by'),
                               memento_c.memento_type.label('memento_type'),
-                              memento_c.previous_attributes ] )
-        query = query.where( sql.and_( memento_c.model == model,
-                                       memento_c.primary_key == primary_key[0] ) )
-        query = query.order_by( memento_c.creation_date.desc() )
-        for row in authentication_table.bind.execute( query ):
+                              memento_c.previous_attributes ],
+                            from_obj = [ memento_table.outerjoin( authentication_table,
+                                                                  authentication_c.id == memento_c.authentication_id ) ] )
+        query = query.where( self._get_changes_filter( model, primary_key, from_datetime, to_datetime ) )
+        query = query.order_by( memento_c.creation_date.desc(), memento_c.id.desc() )
+        if offset:
+            query = query.offset( offset )
+        if limit is not None:
+            query = query.limit( limit )
+        rows = authentication_table.bind.execute( query ).fetchall()
+        for row in rows:
             yield Change( self, row )
+        if limit is not None and len( rows ) >= limit:
+            return
+        #
+        # the archived changes are older than the changes in the memento
+        # table, so they follow the live changes
+        #
+        archived_changes = self._get_archived_changes( model, primary_key, from_datetime, to_datetime )
+        if not len( archived_changes ):
+            return
+        archive_offset = 0
+        if offset and not len( rows ):
+            archive_offset = max( 0, offset - self._get_live_change_count( model, primary_key, from_datetime, to_datetime ) )
+        archived_changes = archived_changes[archive_offset:]
+        if limit is not None:
+            archived_changes = archived_changes[:limit - len( rows )]
+        for row in archived_changes:
+            if row.previous_attributes is not None:
+                row = row._replace( previous_attributes = memento_encoding.decode( row.previous_attributes ) )
+            yield Change( self, row )
+
+    def _get_live_change_count( self, model, primary_key, from_datetime, to_datetime ):
+        memento_table = self._get_memento_table()
+        query = sql.select( [ sql.func.count() ], from_obj = [ memento_table ] )
+        query = query.where( self._get_changes_filter( model, primary_key, from_datetime, to_datetime ) )
+        return self._get_authentication_table().bind.execute( query ).scalar()
+
+    def _has_archive( self ):
+        if self._archive_available is None:
+            archive_table = self._get_archive_table()
+            self._archive_available = archive_table.bind.has_table( archive_table.name )
+        return self._archive_available
+
+    def _get_archive_filter( self, model, primary_key, from_datetime, to_datetime ):
+        archive_c = self._get_archive_table().columns
+        clauses = [ archive_c.model == model,
+                    archive_c.first_primary_key <= primary_key[0],
+                    archive_c.last_primary_key >= primary_key[0] ]
+        if from_datetime is not None:
+            clauses.append( archive_c.last_date >= from_datetime )
+        if to_datetime is not None:
+            clauses.append( archive_c.first_date < to_datetime )
+        return sql.and_( *clauses )
+
+    def _get_archived_changes( self, model, primary_key, from_datetime, to_datetime,
+                               archive_ids = None ):
+        """:param archive_ids: if not `None`, only the changes in the archive
+            rows with these ids are returned
+        :return: a list of `archived_change` tuples in reverse order, with
+            the encoded previous attributes"""
+        if not self._has_archive():
+            return []
+        archive_c = self._get_archive_table().columns
+        query = sql.select( [ archive_c.changes ] )
+        query = query.where( self._get_archive_filter( model, primary_key, from_datetime, to_datetime ) )
+        if archive_ids is not None:
+            query = query.where( archive_c.id.in_( archive_ids ) )
+        authentication_table = self._get_authentication_table()
+        changes = []
+        for archive in authentication_table.bind.execute( query ):
+            for change_id, change_primary_key, at, memento_type, authentication_id, previous_attributes in \
+                json.loads( zlib.decompress( bytes( archive.changes ) ).decode( 'utf-8' ) ):
+                if change_primary_key != primary_key[0]:
+                    continue
+                at = datetime.datetime.strptime( at, '%Y-%m-%dT%H:%M:%S.%f' )
+                if from_datetime is not None and at < from_datetime:
+                    continue
+                if to_datetime is not None and at >= to_datetime:
+                    continue
+                if previous_attributes is not None:
+                    previous_attributes = base64.b64decode( previous_attributes )
+                changes.append( archived_change( change_id, at, authentication_id,
+                                                 memento_type, previous_attributes ) )
+        authentication_ids = set( change.by for change in changes if change.by is not None )
+        usernames = {}
+        if len( authentication_ids ):
+            authentication_c = authentication_table.columns
+            query = sql.select( [ authentication_c.id, authentication_c.username ] )
+            query = query.where( authentication_c.id.in_( authentication_ids ) )
+            usernames = dict( tuple( row ) for row in authentication_table.bind.execute( query ) )
+        changes = [ change._replace( by = usernames.get( change.by ) ) for change in changes ]
+        changes.sort( key = lambda change:( change.at, change.id ), reverse = True )
+        return changes
+
+    def _get_retention_filter( self, now ):
+        """:return: the clause that selects the changes that should be archived
+            according to the retention policies, `None` if there are no
+            policies"""
+        memento_c = self._get_memento_table().columns
+        models = [ policy.model for policy in self.retention_policies if policy.model is not None ]
+        clauses = []
+        for policy in self.retention_policies:
+            clause = memento_c.creation_date < now - policy.max_age
+            if policy.model is not None:
+                clause = sql.and_( memento_c.model == policy.model, clause )
+            elif len( models ):
+                clause = sql.and_( sql.not_( memento_c.model.in_( models ) ), clause )
+            clauses.append( clause )
+        if len( clauses ):
+            return sql.or_( *clauses )
+
+    def archive_changes( self, batch_size = 1000, now = None ):
+        """Move the changes selected by the retention policies from the
+        memento table to the archive, in batches of `batch_size` changes.
+        Each batch is moved in its own transaction.
+
+        :param now: the `datetime` from which the age of changes is counted,
+            defaults to the current time.
+        :return: a generator of `(completed, total, description)` tuples
+        """
+        from camelot.core.orm.query_cache import query_cache
+        from camelot.model.memento import Memento
+        retention_filter = self._get_retention_filter( now or datetime.datetime.now() )
+        if retention_filter is None:
+            return
+        memento_table = self._get_memento_table()
+        memento_c = memento_table.columns
+        archive_table = self._get_archive_table()
+        raw_attributes = sql.type_coerce( memento_c.previous_attributes, types.LargeBinary )
+        query = sql.select( [ memento_c.id,
+                              memento_c.model,
+                              memento_c.primary_key,
+                              memento_c.creation_date,
+                              memento_c.memento_type,
+                              memento_c.authentication_id,
+                              raw_attributes.label( 'raw' ) ] )
+        query = query.where( retention_filter )
+        query = query.order_by( memento_c.model, memento_c.primary_key,
+                                memento_c.creation_date, memento_c.id )
+        query = query.limit( batch_size )
+        connection = memento_table.bind.connect()
+        try:
+            count_query = sql.select( [ sql.func.count() ], from_obj = [ memento_table ] )
+            total = connection.execute( count_query.where( retention_filter ) ).scalar()
+            archived = 0
+            yield ( archived, total, ugettext( 'Archive history' ) )
+            while archived < total:
+                with connection.begin():
+                    rows = connection.execute( query ).fetchall()
+                    if not len( rows ):
+                        break
+                    connection.execute( archive_table.insert(),
+                                        [ self._get_archive_row( model, list( object_rows ) ) for
+                                          ( model, _primary_key ), object_rows in
+                                          itertools.groupby( rows, lambda row:( row.model, row.primary_key ) ) ] )
+                    connection.execute( memento_table.delete().where( memento_c.id.in_( [ row.id for row in rows ] ) ) )
+                archived += len( rows )
+                query_cache.bump( Memento )
+                yield ( archived, total, ugettext( 'Archived %i of %i changes' )%( archived, total ) )
+        finally:
+            connection.close()
+
+    def _get_archive_row( self, model, rows ):
+        """:return: a `dict` with the values of the archive row that holds
+            the changes in `rows`"""
+        changes = []
+        for row in rows:
+            previous_attributes = None
+            if row.raw is not None:
+                previous_attributes = base64.b64encode( bytes( row.raw ) ).decode( 'ascii' )
+            changes.append( [ row.id,
+                              row.primary_key,
+                              row.creation_date.strftime( '%Y-%m-%dT%H:%M:%S.%f' ),
+                              row.memento_type,
+                              row.authentication_id,
+                              previous_attributes ] )
+        dates = [ row.creation_date for row in rows ]
+        return dict( model = model,
+                     first_primary_key = rows[0].primary_key,
+                     last_primary_key = rows[-1].primary_key,
+                     first_date = min( dates ),
+                     last_date = max( dates ),
+                     change_count = len( rows ),
+                     changes = zlib.compress( json.dumps( changes, separators = ( ',', ':' ) ).encode( 'utf-8' ) ) )
+
+    def get_change_count( self,
+                          model,
+                          primary_key,
+                          from_datetime = datetime.datetime(2000,1,1),
+                          to_datetime = None ):
+        """:return: the number of changes :meth:`get_changes` would return
+            without offset and limit.  Only the archived changes that are not
+            entirely within the requested period are decompressed to be
+            counted."""
+        change_count = self._get_live_change_count( model, primary_key, from_datetime, to_datetime )
+        if not self._has_archive():
+            return change_count
+        archive_c = self._get_archive_table().columns
+        query = sql.select( [ archive_c.id,
+                              archive_c.first_primary_key,
+                              archive_c.last_primary_key,
+                              archive_c.first_date,
+                              archive_c.last_date,
+                              archive_c.change_count ] )
+        query = query.where( self._get_archive_filter( model, primary_key, from_datetime, to_datetime ) )
+        partial_archive_ids = []
+        for archive in self._get_authentication_table().bind.execute( query ):
+            if archive.first_primary_key == archive.last_primary_key and \
+               ( from_datetime is None or archive.first_date >= from_datetime ) and \
+               ( to_datetime is None or archive.last_date < to_datetime ):
+                change_count += archive.change_count
+            else:
+                partial_archive_ids.append( archive.id )
+        if len( partial_archive_ids ):
+            change_count += len( self._get_archived_changes( model, primary_key,
+                                                             from_datetime, to_datetime,
+                                                             partial_archive_ids ) )
+        return change_count
+
+    def get_change_collection( self, model, primary_key, **kwargs ):
+        """:return: a :class:`ChangeCollection` with the changes made to an
+            object, the keyword arguments are passed to the collection"""
+        return ChangeCollection( self, model, primary_key, **kwargs )
+
+class ChangeCollection( object ):
+    """A sequence of the changes made to an object, that queries the changes
+    in pages of `page_size` changes when they are accessed.  This sequence
+    can be displayed in a collection proxy without loading all changes.
+    """
+
+    def __init__( self, memento, model, primary_key, page_size = 100,
+                  from_datetime = datetime.datetime(2000,1,1),
+                  to_datetime = None ):
+        self.memento = memento
+        self.model = model
+        self.primary_key = primary_key
+        self.page_size = page_size
+        self.from_datetime = from_datetime
+        self.to_datetime = to_datetime
+        self._count = None
+        self._pages = {}
+
+    def __len__( self ):
+        if self._count is None:
+            self._count = self.memento.get_change_count( self.model,
+                                                         self.primary_key,
+                                                         from_datetime = self.from_datetime,
+                                                         to_datetime = self.to_datetime )
+        return self._count
+
+    def __getitem__( self, index ):
+        if index < 0:
+            index += len( self )
+        if index < 0 or index >= len( self ):
+            raise IndexError( index )
+        page_number, page_index = divmod( index, self.page_size )
+        page = self._pages.get( page_number )
+        if page is None:
+            page = list( self.memento.get_changes( self.model,
+                                                   self.primary_key,
+                                                   {},
+                                                   from_datetime = self.from_datetime,
+                                                   to_datetime = self.to_datetime,
+                                                   offset = page_number * self.page_size,
+                                                   limit = self.page_size ) )
+            self._pages[page_number] = page
+        if page_index >= len( page ):
+            raise IndexError( index )
+        return page[page_index]
+
+    def __iter__( self ):
+        for index in six.moves.range( len( self ) ):
+            try:
+                yield self[index]
+            except IndexError:
+                return
 
 
@@ -0,0 +1,231 @@
+#  ============================================================================
+#
+#  Copyright (C) 2007-2016 Conceptive Engineering bvba.
+#  www.conceptive.be / info@conceptive.be
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#      * Redistributions of source code must retain the above copyright
+#        notice, this list of conditions and the following disclaimer.
+#      * Redistributions in binary form must reproduce the above copyright
+#        notice, this list of conditions and the following disclaimer in the
+#        documentation and/or other materials provided with the distribution.
+#      * Neither the name of Conceptive Engineering nor the
+#        names of its contributors may be used to endorse or promote products
+#        derived from this software without specific prior written permission.
+#  
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+#  ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+#  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#  LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+#  ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  ============================================================================
+
+"""Cache of the results of queries on entities that rarely change, such as
+lookup tables.  The cache keeps the primary keys of the objects returned by a
+query, using the compiled statement and its parameters as a key.  When the
+query is executed again, the objects are taken from the identity map of the
+session instead of from the database.
+
+A cached result depends on all tables used in its statement, including the
+tables of joins and of subqueries in its filters.  The cached results that
+depend on the tables of an entity are discarded when an object of that entity
+is created, updated or deleted through the signal handler, or when the
+version of the entity is bumped explicitly ::
+
+    query_cache.bump(Country)
+"""
+
+import collections
+import logging
+
+import six
+
+from sqlalchemy import inspect, orm
+from sqlalchemy.sql.util import find_tables
+
+from ..qt import QtCore
+from ..threading import synchronized
+
+LOGGER = logging.getLogger('camelot.core.orm.query_cache')
+
+class QueryCache(QtCore.QObject):
+    """Least recently used cache of query results.
+
+    :param max_entries: the maximum number of query results kept in the cache,
+        the results of each page of a table are a separate entry.
+    """
+
+    def __init__(self, max_entries=200):
+        super(QueryCache, self).__init__()
+        self._mutex = QtCore.QMutex()
+        self._versions = collections.defaultdict(int)
+        self._entries = collections.OrderedDict()
+        self._connected = False
+        self.max_entries = max_entries
+
+    @synchronized
+    def key(self, entity, statement, name):
+        """
+        :param entity: the class of the cached result
+        :param statement: the sql statement that is executed, the cached
+            result depends on all tables used in it
+        :param name: the name of the kind of result cached
+        :return: the key of the statement in the cache
+        """
+        if not self._connected:
+            from camelot.view.remote_signals import get_signal_handler
+            get_signal_handler().connect_signals(self)
+            self._connected = True
+        tables = set(find_tables(statement, check_columns=True))
+        compiled = statement.compile()
+        return (tuple((table, self._versions[table]) for table in
+                      sorted(tables, key=lambda table:table.fullname)),
+                entity,
+                name,
+                six.text_type(compiled),
+                repr(sorted(compiled.params.items())))
+
+    @synchronized
+    def get(self, key):
+        """:return: the cached result or `None` if there is no result"""
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self._entries[key] = value
+        return value
+
+    @synchronized
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @synchronized
+    def bump(self, entity=None):
+        """Increase the version of an entity, discarding all cached results
+        of queries that depend on it.
+
+        :param entity: the class of the entity, if `None` is given, the
+            results of all entities are discarded.
+        """
+        if entity is None:
+            for table in list(six.iterkeys(self._versions)):
+                self._versions[table] += 1
+            self._entries.clear()
+            return
+        mapper = inspect(entity, raiseerr=False)
+        if mapper is None:
+            return
+        tables = set(mapper.tables)
+        for table in tables:
+            self._versions[table] += 1
+        for key in list(six.iterkeys(self._entries)):
+            if any(table in tables for table, _version in key[0]):
+                del self._entries[key]
+
+    def get_or_execute(self, entity, statement, name, execute):
+        """
+        :param entity: the class of which the result depends
+        :param statement: the sql statement to execute
+        :param name: the name of the kind of result cached
+        :param execute: a function without arguments that executes the
+            statement and returns the result to cache
+        :return: the cached result, or the result of execute if there is
+            no cached result
+        """
+        key = self.key(entity, statement, name)
+        value = self.get(key)
+        if value is None:
+            value = execute()
+            self.set(key, value)
+        return value
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_update(self, sender, entity):
+        self.bump(type(entity))
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_delete(self, sender, entity):
+        self.bump(type(entity))
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_create(self, sender, entity):
+        self.bump(type(entity))
+
+query_cache = QueryCache()
+
+class CachedQuery(orm.Query):
+    """A query of which the primary keys of the resulting objects are kept in
+    the :data:`query_cache`.  Only queries for the objects of a single entity
+    without loader options are cached, other queries, such as queries for
+    individual columns, are always executed.
+    """
+
+    def _cached_entity(self):
+        descriptions = self.column_descriptions
+        if len(descriptions) != 1:
+            return None
+        # objects taken from the identity map are not loaded with the
+        # options of the query
+        if len(self._with_options):
+            return None
+        entity = descriptions[0]['type']
+        if descriptions[0]['expr'] is not entity:
+            return None
+        return entity
+
+    def _get_objects(self, mapper, primary_keys):
+        """
+        :return: the list of objects with the given primary keys, or `None`
+            if they could not be retrieved with a single query
+        """
+        session = self.session
+        objects, missing = [], []
+        for primary_key in primary_keys:
+            identity_key = mapper.identity_key_from_primary_key(primary_key)
+            obj = session.identity_map.get(identity_key)
+            if obj is None:
+                missing.append(primary_key)
+            objects.append(obj)
+        if len(missing):
+            if len(mapper.primary_key) != 1:
+                return None
+            primary_key_column = mapper.primary_key[0]
+            query = session.query(mapper).filter(
+                primary_key_column.in_([pk[0] for pk in missing]))
+            loaded = dict((mapper.primary_key_from_instance(o)[0], o) for o in query)
+            if len(loaded) != len(set(pk[0] for pk in missing)):
+                return None
+            objects = [loaded[pk[0]] if obj is None else obj for pk, obj in zip(primary_keys, objects)]
+        return objects
+
+    def __iter__(self):
+        entity = self._cached_entity()
+        # a query that streams its results is not read into the cache
+        if entity is None or self._yield_per or \
+           self._execution_options.get('stream_results'):
+            return super(CachedQuery, self).__iter__()
+        mapper = orm.class_mapper(entity)
+        key = query_cache.key(entity, self.statement, 'primary_keys')
+        primary_keys = query_cache.get(key)
+        if primary_keys is not None:
+            objects = self._get_objects(mapper, primary_keys)
+            if objects is not None:
+                return iter(objects)
+        objects = list(super(CachedQuery, self).__iter__())
+        query_cache.set(key, [tuple(mapper.primary_key_from_instance(o)) for o in objects])
+        return iter(objects)
+
+    def count(self):
+        entity = self._cached_entity()
+        if entity is None:
+            return super(CachedQuery, self).count()
+        return query_cache.get_or_execute(entity, self.statement, 'count',
+                                          super(CachedQuery, self).count)
@@ -35,6 +35,7 @@ in the development cycle.
 """
 
 from camelot.core.orm import Entity, Session
+from camelot.core.orm.query_cache import query_cache
 from camelot.core.utils import ugettext_lazy as _
 from camelot.admin.action import Action
 from camelot.admin.entity_admin import EntityAdmin
@@ -88,6 +89,7 @@ class Translation( Entity ):
         list_display = ['source', 'language', 'value']#, 'uid']
         list_filter = ['language']
         list_actions = [ExportAsPO()]
+        cache_query = True
         field_attributes = { 'language':{ 'default':default_language } }
 
     @classmethod
@@ -127,6 +129,7 @@ class Translation( Entity ):
                                                               language = language )
                         cls._cache[( source, language )] = source
                         session.flush( [registered_translation] )
+                        query_cache.bump( cls )
                         logger.debug( 'registed %s with id %s' % ( source, registered_translation.id ) )
                 return source
             return translation
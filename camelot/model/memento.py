@@ -40,13 +40,14 @@ import datetime
 
 import six
 
-from sqlalchemy import schema, orm
-from sqlalchemy.types import Unicode, Integer, DateTime, PickleType
+from sqlalchemy import schema, orm, types
+from sqlalchemy.types import Unicode, Integer, DateTime, LargeBinary
 
 from camelot.admin.action import list_filter
 from camelot.admin.entity_admin import EntityAdmin
 from camelot.admin.object_admin import ObjectAdmin
 from camelot.admin.not_editable_admin import not_editable_admin
+from camelot.core import memento
 from camelot.core.orm import Entity, ManyToOne
 from camelot.core.utils import ugettext_lazy as _
 from camelot.view.controls import delegates
@@ -54,6 +55,44 @@ from camelot.types import PrimaryKey
 
 from .authentication import AuthenticationMechanism
 
+class PreviousAttributes( types.TypeDecorator ):
+    """Stores a dict with previous attributes with the encoding in
+    :data:`camelot.core.memento.memento_encoding`.  Pickled values, stored
+    before this type was used, can still be read.
+    """
+
+    impl = types.LargeBinary
+
+    def bind_processor( self, dialect ):
+
+        impl_processor = self.impl.bind_processor( dialect )
+        if not impl_processor:
+            impl_processor = lambda x:x
+
+        def processor( value ):
+            if value is not None:
+                value = memento.memento_encoding.encode( value )
+            return impl_processor( value )
+
+        return processor
+
+    def result_processor( self, dialect, coltype = None ):
+
+        impl_processor = self.impl.result_processor( dialect, coltype )
+        if not impl_processor:
+            impl_processor = lambda x:x
+
+        def processor( value ):
+            value = impl_processor( value )
+            if value is not None:
+                return memento.memento_encoding.decode( value )
+            return value
+
+        return processor
+
+    def __repr__( self ):
+        return 'PreviousAttributes()'
+
 class PreviousAttribute( object ):
     """Helper class to display previous attributes"""
     
@@ -70,6 +109,8 @@ class Memento( Entity ):
     of changes and enable restore to that previous state"""
     
     __tablename__ = 'memento'
+    __table_args__ = ( schema.Index( 'ix_memento_model_primary_key_creation_date',
+                                     'model', 'primary_key', 'creation_date' ), )
     
     model = schema.Column( Unicode( 256 ), index = True, nullable = False )
     primary_key = schema.Column(PrimaryKey(), index=True, nullable=False)
@@ -81,7 +122,7 @@ class Memento( Entity ):
     memento_type = schema.Column( Integer, 
                                   nullable = False,
                                   index = True )    
-    previous_attributes = orm.deferred( schema.Column( PickleType() ) )
+    previous_attributes = orm.deferred( schema.Column( PreviousAttributes() ) )
     
     @property
     def previous( self ):
@@ -104,4 +145,29 @@ class Memento( Entity ):
         
     Admin = not_editable_admin( Admin )
 
+class MementoArchive( Entity ):
+    """Changes moved out of the memento table by the retention policies of
+    :class:`camelot.core.memento.SqlMemento`.  Each row holds a compressed
+    batch of changes of a single object, with their number in
+    `change_count`, so they can be counted without decompressing them."""
+
+    __tablename__ = 'memento_archive'
+    __table_args__ = ( schema.Index( 'ix_memento_archive_model_primary_key',
+                                     'model', 'first_primary_key', 'last_primary_key' ), )
+
+    model = schema.Column( Unicode( 256 ), nullable = False )
+    first_primary_key = schema.Column( PrimaryKey(), nullable = False )
+    last_primary_key = schema.Column( PrimaryKey(), nullable = False )
+    first_date = schema.Column( DateTime(), nullable = False )
+    last_date = schema.Column( DateTime(), nullable = False )
+    change_count = schema.Column( Integer(), nullable = False )
+    changes = orm.deferred( schema.Column( LargeBinary() ) )
+
+    class Admin( EntityAdmin ):
+        verbose_name = _( 'Archived history' )
+        verbose_name_plural = _( 'Archived history' )
+        list_display = ['model', 'first_date', 'last_date', 'change_count']
+        list_filter = [list_filter.ComboBoxFilter('model')]
+
+    Admin = not_editable_admin( Admin )
 
@@ -46,6 +46,7 @@ from sqlalchemy import orm, schema, sql, ForeignKey
 from camelot.admin.entity_admin import EntityAdmin
 from camelot.core.orm import ( Entity, using_options, Field, ManyToMany,  
                                ManyToOne, OneToMany, ColumnProperty )
+from camelot.core.orm.query_cache import query_cache
 from camelot.core.utils import ugettext_lazy as _
 import camelot.types
 from camelot.view.controls import delegates
@@ -85,6 +86,7 @@ class Country( GeographicBoundary ):
         if not country:
             country = Country( code = code, name = name )
             orm.object_session( country ).flush()
+            query_cache.bump( cls )
         return country
 
     class Admin( EntityAdmin ):
@@ -92,6 +94,7 @@ class Country( GeographicBoundary ):
         verbose_name = _('Country')
         verbose_name_plural = _('Countries')
         list_display = ['name', 'code']
+        cache_query = True
 
 class City( GeographicBoundary ):
     """A subclass of GeographicBoundary used to store the name, the postal code
@@ -115,6 +118,7 @@ class City( GeographicBoundary ):
         if not city:
             city = City( code = code, name = name, country = country )
             orm.object_session( city ).flush()
+            query_cache.bump( cls )
         return city
 
     class Admin( EntityAdmin ):
@@ -122,6 +126,7 @@ class City( GeographicBoundary ):
         verbose_name_plural = _('Cities')
         form_size = ( 700, 150 )
         list_display = ['code', 'name', 'country']
+        cache_query = True
 
 class Address( Entity ):
     """The Address to be given to a Party (a Person or an Organization)"""
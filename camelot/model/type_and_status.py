@@ -95,6 +95,7 @@ class StatusTypeMixin(TypeMixin):
 
 class TypeAdmin(EntityAdmin):
     list_display = ['code', 'description']
+    cache_query = True
     form_display = ['code', 'description']
     field_attributes = {'code': {'name': _('Code')},
                         'description': {'name': _('Description')}
@@ -458,9 +459,10 @@ class StatusFilter(list_filter.GroupBoxFilter):
 
         target = classification_fa.get('target')
         if target is not None:
-            choices = [(st, st.code) for st in target.query.all()]
+            values, more = self.get_values(model_context, [target], lambda:target.query)
+            choices = [(st, st.code) for st in values]
         else:
-            choices = classification_fa['choices']
+            choices, more = classification_fa['choices'], False
 
         state.modes = []
         modes = []
@@ -489,6 +491,9 @@ class StatusFilter(list_filter.GroupBoxFilter):
                                                verbose_name=ugettext('None'),
                                                checked=True)
             modes.append(none_mode)
+        if more:
+            modes.append(list_filter.FilterMode(value=list_filter.More,
+                                                verbose_name=ugettext('More...')))
 
         state.modes = modes
         state.verbose_name = self.attributes['name']
@@ -596,7 +601,8 @@ class TypeFilter(list_filter.GroupBoxFilter):
         self.attributes = admin.get_field_attributes(self.attribute)
         type_type = self.attributes['target']
 
-        choices = [(t, t.code) for t in type_type.query.all()]
+        values, more = self.get_values(model_context, [type_type], lambda:type_type.query)
+        choices = [(t, t.code) for t in values]
 
         state.modes = []
         modes = []
@@ -620,6 +626,9 @@ class TypeFilter(list_filter.GroupBoxFilter):
                                                verbose_name=ugettext('None'),
                                                checked=True)
             modes.append(none_mode)
+        if more:
+            modes.append(list_filter.FilterMode(value=list_filter.More,
+                                                verbose_name=ugettext('More...')))
 
         state.modes = modes
         state.verbose_name = self.attributes['name']
@@ -27,15 +27,18 @@
 #
 #  ============================================================================
 
+import collections
 from functools import update_wrapper, partial
 
 import six
 
 from ....core.qt import QtGui, QtCore, Qt, QtWidgets, py_to_variant, variant_to_py
+from ....core.threading import synchronized
 
 from ....admin.action import field_action
 from camelot.view.model_thread import post, object_thread
-from camelot.view.search import create_entity_search_query_decorator
+from camelot.view.search import (create_entity_search_query_decorator,
+                                 entity_matches, refines)
 from camelot.view.remote_signals import get_signal_handler
 from camelot.view.controls.decorated_line_edit import DecoratedLineEdit
 from camelot.core.utils import ugettext as _
@@ -45,6 +48,120 @@ from .customeditor import CustomEditor, set_background_color_palette
 import logging
 logger = logging.getLogger('camelot.view.controls.editors.many2oneeditor')
 
+class CompletionService(QtCore.QObject):
+    """Search the completions for the text typed in the editors of the
+    objects of an admin.  A single service is shared by all editors of the
+    same admin, use :meth:`get_service` to get it.
+
+    The completions found for recent texts are cached.  When the completions
+    for a text were complete, because there were fewer than the limit, the
+    completions for a longer text are filtered from them without a query.
+
+    :param admin: the admin of the objects to complete
+    :param cache_size: the number of texts for which the completions are kept
+    """
+
+    limit = 20
+
+    _services = dict()
+
+    def __init__(self, admin, cache_size=50):
+        super(CompletionService, self).__init__()
+        self._mutex = QtCore.QMutex()
+        self.admin = admin
+        self.cache_size = cache_size
+        self._completions = collections.OrderedDict()
+        get_signal_handler().connect_signals(self)
+
+    @classmethod
+    def get_service(cls, admin):
+        """Get the completion service for an admin, to be called in the gui
+        thread"""
+        service = cls._services.get(admin)
+        if service is None:
+            service = cls(admin)
+            cls._services[admin] = service
+        return service
+
+    @synchronized
+    def clear(self):
+        self._completions.clear()
+
+    @synchronized
+    def _get(self, text):
+        completions = self._completions.pop(text, None)
+        if completions is not None:
+            self._completions[text] = completions
+        return completions
+
+    @synchronized
+    def _set(self, text, completions):
+        self._completions.pop(text, None)
+        self._completions[text] = completions
+        while len(self._completions) > self.cache_size:
+            self._completions.popitem(last=False)
+
+    @synchronized
+    def _complete_prefixes(self, text, substring_terms):
+        """:return: the cached completions that contain all completions
+        of text, from the shortest to the longest list"""
+        prefixes = []
+        for prefix, (objects, complete) in six.iteritems(self._completions):
+            if complete and refines(prefix, text, substring_terms):
+                prefixes.append(objects)
+        prefixes.sort(key=len)
+        return prefixes
+
+    def complete(self, text):
+        """Search the completions for a text, to be called in the model
+        thread.
+
+        :return: a list with the search identifiers of the objects found
+        """
+        completions = self._get(text)
+        if completions is None:
+            search_decorator = create_entity_search_query_decorator(
+                self.admin, text
+            )
+            if search_decorator is None:
+                return []
+            objects = None
+            for prefix_objects in self._complete_prefixes(text, search_decorator.substring_terms):
+                objects = []
+                for obj, _identifiers in prefix_objects:
+                    match = entity_matches(self.admin, obj, text)
+                    if match is None:
+                        objects = None
+                        break
+                    if match:
+                        objects.append(obj)
+                if objects is not None:
+                    break
+            if objects is None:
+                query = search_decorator(self.admin.get_query())
+                objects = list(query.limit(self.limit))
+            completions = (
+                [(obj, self.admin.get_search_identifiers(obj)) for obj in objects],
+                len(objects) < self.limit
+            )
+            self._set(text, completions)
+        return [identifiers for _obj, identifiers in completions[0]]
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_update(self, sender, entity):
+        if isinstance(entity, self.admin.entity):
+            self.clear()
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_delete(self, sender, entity):
+        if isinstance(entity, self.admin.entity):
+            self.clear()
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_create(self, sender, entity):
+        if isinstance(entity, self.admin.entity):
+            self.clear()
+
 class Many2OneEditor( CustomEditor ):
     """Widget for editing many 2 one relations"""
 
@@ -92,6 +209,8 @@ class Many2OneEditor( CustomEditor ):
         self._entity_representation = ''
         self.obj = None
         self._last_highlighted_entity_getter = None
+        self._completion_service = None
+        self._completion_generation = 0
 
         self.layout = QtWidgets.QHBoxLayout()
         self.layout.setSpacing(0)
@@ -119,6 +238,17 @@ class Many2OneEditor( CustomEditor ):
         self.completer.highlighted[QtCore.QModelIndex].connect(self.completion_highlighted)
         self.search_input.setCompleter(self.completer)
 
+        #
+        # The completion timer reduces the number of searches for
+        # completions, by waiting for the next keystroke before starting
+        # the search
+        #
+        timer = QtCore.QTimer(self)
+        timer.setInterval(150)
+        timer.setSingleShot(True)
+        timer.setObjectName('completion_timer')
+        timer.timeout.connect(self.start_search_completions)
+
         # Setup layout
         self.layout.addWidget(self.search_input)
         self.setLayout(self.layout)
@@ -137,13 +267,31 @@ class Many2OneEditor( CustomEditor ):
 
     def textEdited(self, text):
         self._last_highlighted_entity_getter = None
+        timer = self.findChild(QtCore.QTimer, 'completion_timer')
+        if timer is not None:
+            timer.start()
+
+    @QtCore.qt_slot()
+    def start_search_completions(self):
+        assert object_thread( self )
         text = six.text_type( self.search_input.text() )
+        if self._completion_service is None:
+            self._completion_service = CompletionService.get_service(self.admin)
+        # searches that did not start yet when a new search is started are
+        # skipped
+        self._completion_generation += 1
+
+        def create_search_completion(generation, text):
 
-        def create_search_completion(text):
-            return lambda: self.search_completions(text)
+            def search_completion():
+                if generation != self._completion_generation:
+                    return None
+                return self.search_completions(text)
+
+            return search_completion
 
         post(
-            create_search_completion(six.text_type(text)),
+            create_search_completion(self._completion_generation, text),
             self.display_search_completions
         )
         self.completer.complete()
@@ -153,20 +301,17 @@ class Many2OneEditor( CustomEditor ):
 
         :return: a list of tuples of (dict_of_object_representation, object)
         """
-        search_decorator = create_entity_search_query_decorator(
-            self.admin, text
-        )
-        if search_decorator:
-            sresult = [
-                self.admin.get_search_identifiers(e)
-                for e in search_decorator(self.admin.get_query()).limit(20)
-            ]
-            return text, sresult
-        return text, []
+        service = self._completion_service or CompletionService.get_service(self.admin)
+        return text, service.complete(text)
 
     def display_search_completions(self, prefix_and_completions):
         assert object_thread( self )
+        # the completions of a superseded search
+        if prefix_and_completions is None:
+            return
         prefix, completions = prefix_and_completions
+        if prefix != six.text_type( self.search_input.text() ):
+            return
         self.completions_model.setCompletions(completions)
         self.completer.setCompletionPrefix(prefix)
         self.completer.complete()
@@ -33,14 +33,43 @@ Widgets that represent Filter Actions
 
 import six
 
-from ...admin.action.list_filter import All
+from ...admin.action import State
+from ...admin.action.list_filter import All, More
 from ...core.utils import ugettext
 from ...core.qt import QtCore, QtGui, QtWidgets, py_to_variant, variant_to_py
+from ..model_thread import post
 from .action_widget import AbstractActionWidget
 
 class AbstractFilterWidget(AbstractActionWidget):
     """Overwrite some methods to avoid to many state updates"""
 
+    # when True, the state of the filter is only requested once the number
+    # of rows in the table is known, so the table is shown before the values
+    # of the filter are queried.
+    lazy_state = False
+
+    def init(self, action, gui_context):
+        if not self.lazy_state:
+            AbstractActionWidget.init(self, action, gui_context)
+            return
+        self.action = action
+        self.gui_context = gui_context
+        self.state = State()
+        self._state_requested = False
+        gui_context.item_view.model().layoutChanged.connect(self.request_state)
+
+    @QtCore.qt_slot()
+    def request_state(self, mode_name=None):
+        """Request the state of the filter to the model thread, this is
+        done only once, unless all values are requested through the `More`
+        mode"""
+        if self._state_requested and (mode_name is None):
+            return
+        self._state_requested = True
+        model_context = self.gui_context.create_model_context()
+        model_context.mode_name = mode_name
+        post(self.action.get_state, self.set_state, args=(model_context,))
+
     def current_row_changed(self, _current_row):
         pass
         
@@ -64,6 +93,8 @@ class GroupBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
     """A box containing a filter that can be applied on a table view, this filter is
     based on the distinct values in a certain column"""
 
+    lazy_state = True
+
     def __init__(self, action, gui_context, parent):
         QtGui.QGroupBox.__init__(self, parent)
         layout = QtWidgets.QVBoxLayout()
@@ -72,6 +103,7 @@ class GroupBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
         self.setLayout( layout )
         self.setFlat(True)
         self.modes = None
+        self._button_layout = None
         group = QtGui.QButtonGroup(self)
         group.setExclusive(action.exclusive)
         # connect to the signal of the group instead of the individual buttons,
@@ -89,7 +121,7 @@ class GroupBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
 
     @QtCore.qt_slot(bool)
     def all_button_toggled(self, checked):
-        for button in self.findChildren(self.button_type):
+        for button in self.findChild(QtGui.QButtonGroup).buttons():
             button.setChecked(checked)
         self.group_button_clicked(0)
 
@@ -103,17 +135,25 @@ class GroupBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
             all_button.blockSignals(False)
         self.run_action()
 
+    @QtCore.qt_slot()
+    def more_button_clicked(self):
+        self.request_state(More)
+
     def get_value(self):
+        # the state is not yet available, use the default
+        if self.modes is None:
+            return [self.action.default]
         values = []
         group = self.findChild(QtGui.QButtonGroup)
         all_checked = True
-        for button in self.findChildren(self.button_type):
-            if button.objectName() != 'all_button':
-                if button.isChecked():
-                    button_id = group.id(button)
-                    values.append(self.modes[button_id].name)
-                else:
-                    all_checked = False
+        # the buttons of a previous state might not yet be deleted, so only
+        # the buttons in the group are considered
+        for button in group.buttons():
+            if button.isChecked():
+                button_id = group.id(button)
+                values.append(self.modes[button_id].name)
+            else:
+                all_checked = False
         # shortcut, to make sure no actual filtering is done when
         # all options are checked
         if all_checked:
@@ -125,22 +165,44 @@ class GroupBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
         self.setTitle(six.text_type(state.verbose_name))
         group = self.findChild(QtGui.QButtonGroup)
         layout = self.layout()
-        button_layout = QtWidgets.QVBoxLayout()
+        # keep the choices of the user when all values are presented
+        checked = None
+        if self._button_layout is not None:
+            checked = self.get_value()
+            while True:
+                item = self._button_layout.takeAt(0)
+                if item is None:
+                    break
+                button = item.widget()
+                if isinstance(button, QtWidgets.QAbstractButton):
+                    group.removeButton(button)
+                button.setParent(None)
+                button.deleteLater()
+        else:
+            self._button_layout = QtWidgets.QVBoxLayout()
+            layout.addLayout(self._button_layout)
         self.modes = state.modes
 
         for i, mode in enumerate(state.modes):
+            if mode.name == More:
+                button = QtWidgets.QPushButton(six.text_type(mode.verbose_name), self)
+                button.setFlat(True)
+                button.clicked.connect(self.more_button_clicked)
+                self._button_layout.addWidget(button)
+                continue
             button = self.button_type(six.text_type(mode.verbose_name), self)
-            button_layout.addWidget(button)
+            self._button_layout.addWidget(button)
             group.addButton(button, i)
-            if mode.checked:
-                button.setChecked(True)
-
-        layout.addLayout(button_layout)
-        self.setLayout(layout)
+            if checked is None:
+                button.setChecked(mode.checked)
+            else:
+                button.setChecked((All in checked) or (mode.name in checked))
 
 class ComboBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
     """Flter widget based on a QGroupBox"""
 
+    lazy_state = True
+
     def __init__(self, action, gui_context, parent):
         QtGui.QGroupBox.__init__(self, parent)
         AbstractFilterWidget.init(self, action, gui_context)
@@ -158,24 +220,47 @@ class ComboBoxFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
         self.setTitle(six.text_type(state.verbose_name))
         combobox = self.findChild(QtWidgets.QComboBox)
         if combobox is not None:
+            # keep the choice of the user when all values are presented
+            current_value = None
+            if combobox.count():
+                current_value = self.get_value()[0]
+            combobox.blockSignals(True)
+            combobox.clear()
             current_index = 0
             for i, mode in enumerate(state.modes):
-                if mode.checked == True:
+                if current_value is None:
+                    if mode.checked == True:
+                        current_index = i
+                elif mode.name == current_value:
                     current_index = i
                 combobox.insertItem(i,
                                     six.text_type(mode.verbose_name),
                                     py_to_variant(mode))
             combobox.setCurrentIndex(current_index)
+            combobox.blockSignals(False)
+            self._current_index = current_index
 
     def get_value(self):
         combobox = self.findChild(QtWidgets.QComboBox)
-        if combobox is not None:
+        if (combobox is not None) and combobox.count():
             index = combobox.currentIndex()
             mode = variant_to_py(combobox.itemData(index))
             return [mode.name]
+        # the state is not yet available, use the default
+        return [self.action.default]
 
     @QtCore.qt_slot(int)
     def group_button_clicked(self, index):
+        combobox = self.findChild(QtWidgets.QComboBox)
+        mode = variant_to_py(combobox.itemData(index))
+        if mode.name == More:
+            # go back to the previous choice while all values are requested
+            combobox.blockSignals(True)
+            combobox.setCurrentIndex(self._current_index)
+            combobox.blockSignals(False)
+            self.request_state(More)
+            return
+        self._current_index = index
         self.run_action()
 
 class OperatorFilterWidget(QtGui.QGroupBox, AbstractFilterWidget):
@@ -41,10 +41,13 @@ from camelot.view.controls.view import AbstractView
 from camelot.view.controls.user_translatable_label import UserTranslatableLabel
 from camelot.view.model_thread import post
 from camelot.view.model_thread import object_thread
+from camelot.view.remote_signals import get_signal_handler
+from camelot.view.search import IncrementalSearch
 from camelot.view import register
 from ...core.qt import QtCore, QtGui, QtModel, QtWidgets, Qt, variant_to_py
 from .actionsbox import ActionsBox
 from .delegates.delegatemanager import DelegateManager
+from .filter_widget import AbstractFilterWidget
 from .inheritance import SubclassTree
 from .search import SimpleSearchControl
 
@@ -561,9 +564,12 @@ class TableView(AbstractView):
         self.setLayout(widget_layout)
         self.widget_layout = widget_layout
         self.search_filter = lambda q: q
+        self._search = IncrementalSearch(self.admin)
         shortcut = QtGui.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Find),
                                    self)
         shortcut.activated.connect(self.activate_search)
+        # previous search results become invalid when objects are changed
+        get_signal_handler().connect_signals(self)
 
         self.gui_context.admin = self.admin
         self.gui_context.view = self
@@ -614,6 +620,22 @@ class TableView(AbstractView):
         if model is not None:
             model.set_value(value)
             self.rebuild_query()
+            if not isinstance(model, QueryTableProxy):
+                self.request_filter_states()
+
+    def request_filter_states(self):
+        """Request the state of the lazy filters, the model does not signal
+        a layout change when the number of rows of a new value remains the
+        same"""
+        for i in range(self.filters_layout.count()):
+            filters_widget = self.filters_layout.itemAt(i).widget()
+            if not isinstance(filters_widget, ActionsBox):
+                continue
+            if filters_widget.objectName() != 'filters':
+                continue
+            for filter_widget in filters_widget.get_action_widgets():
+                if isinstance(filter_widget, AbstractFilterWidget) and filter_widget.lazy_state:
+                    filter_widget.request_state()
 
     @QtCore.qt_slot(object)
     def set_admin(self, admin):
@@ -649,6 +671,7 @@ class TableView(AbstractView):
         # when a new header is set, the old one can no longer cancel its
         # search
         self.search_filter = lambda q: q
+        self._search = IncrementalSearch(self.admin)
         header = self.header_widget(self.gui_context, self)
         header.setObjectName('header_widget')
         self.widget_layout.insertWidget(0, header)
@@ -672,25 +695,51 @@ class TableView(AbstractView):
         event.accept()
 
     @QtCore.qt_slot(object)
-    def _set_query(self, query):
+    def _set_query(self, search_result):
         assert object_thread(self)
+        # the query of a superseded search
+        if search_result is None:
+            return
+        search, generation, query, rows = search_result
+        if search.is_superseded(generation):
+            return
         if isinstance(self.table.model(), QueryTableProxy):
             # apply the filters on the query, to activate the default filter
             filters_widget = self.findChild(ActionsBox, 'filters')
             if filters_widget is not None:
                 for filter_widget in filters_widget.get_action_widgets():
                     filter_widget.run_action()
-            self.table.model().set_value(query)
+            self.table.model().set_value(query, rows)
+            self.request_filter_states()
         self.table.clearSelection()
 
     @QtCore.qt_slot()
     def refresh(self):
         """Refresh the whole view"""
         assert object_thread(self)
+        post(self._search.clear)
         model = self.get_model()
         if model is not None:
             model.refresh()
 
+    def _clear_search(self, entity):
+        """Forget previous search results when an object of the displayed
+        entity changed"""
+        if isinstance(entity, self.admin.entity):
+            post(self._search.clear)
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_update(self, sender, entity):
+        self._clear_search(entity)
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_delete(self, sender, entity):
+        self._clear_search(entity)
+
+    @QtCore.qt_slot(object, object)
+    def handle_entity_create(self, sender, entity):
+        self._clear_search(entity)
+
     @QtCore.qt_slot()
     def rebuild_query(self):
         """resets the table model query"""
@@ -702,11 +751,23 @@ class TableView(AbstractView):
         if not isinstance(self.table.model(), QueryTableProxy):
             return
 
+        # each rebuild supersedes the previous ones, whose requests are
+        # skipped in the model thread when they did not start yet
+        search = self._search
+        generation = search.start()
+        search_filter = self.search_filter
+        model = self.table.model()
+
         def rebuild_query():
+            if search.is_superseded(generation):
+                return None
             query = self.admin.get_query()
-            if self.search_filter:
-                query = self.search_filter(query)
-            return query
+            if search_filter:
+                query = search_filter(query)
+            if search.is_superseded(generation):
+                return None
+            rows = search.count(model.decorate_query(query), model.count_query)
+            return (search, generation, query, rows)
 
         post(rebuild_query, self._set_query)
 
@@ -714,10 +775,10 @@ class TableView(AbstractView):
     def startSearch(self, text):
         """rebuilds query based on filtering text"""
         assert object_thread(self)
-        from camelot.view.search import create_entity_search_query_decorator
         logger.debug('search %s' % text)
-        self.search_filter = create_entity_search_query_decorator(
-            self.admin, six.text_type(text))
+        search = self._search
+        text = six.text_type(text)
+        self.search_filter = lambda q: search.decorate_query(q, text)
         self.rebuild_query()
 
     @QtCore.qt_slot()
@@ -726,6 +787,7 @@ class TableView(AbstractView):
         assert object_thread(self)
         logger.debug('cancel search')
         self.search_filter = lambda q: q
+        post(self._search.clear)
         self.rebuild_query()
 
     def set_columns(self, columns):
@@ -0,0 +1,290 @@
+#  ============================================================================
+#
+#  Copyright (C) 2007-2016 Conceptive Engineering bvba.
+#  www.conceptive.be / info@conceptive.be
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#      * Redistributions of source code must retain the above copyright
+#        notice, this list of conditions and the following disclaimer.
+#      * Redistributions in binary form must reproduce the above copyright
+#        notice, this list of conditions and the following disclaimer in the
+#        documentation and/or other materials provided with the distribution.
+#      * Neither the name of Conceptive Engineering nor the
+#        names of its contributors may be used to endorse or promote products
+#        derived from this software without specific prior written permission.
+#  
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+#  ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+#  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#  LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+#  ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  ============================================================================
+"""Utility classes to export data from Camelot to files"""
+
+import codecs
+import csv
+import datetime
+import os
+import re
+import tempfile
+import zipfile
+
+import six
+
+from xml.sax.saxutils import escape, quoteattr
+
+# characters that are not allowed in xml documents
+_illegal_xml_characters = re.compile( u'[\x00-\x08\x0b\x0c\x0e-\x1f]' )
+
+_epoch = datetime.datetime( 1899, 12, 30 )
+
+def column_reference( column ):
+    """:return: the name of a column in a spreadsheet, column starts at 0"""
+    name = ''
+    column += 1
+    while column:
+        column, remainder = divmod( column - 1, 26 )
+        name = chr( ord( 'A' ) + remainder ) + name
+    return name
+
+class UnicodeWriter( object ):
+    """A CSV writer which will write rows of unicode strings to the binary
+    stream "f", encoded in the given encoding."""
+
+    def __init__( self, f, dialect = csv.excel, encoding = 'utf-8', **kwds ):
+        self.stream = f
+        self.encoding = encoding
+        if six.PY3:
+            self.text_stream = codecs.getwriter( encoding )( f )
+            self.writer = csv.writer( self.text_stream, dialect = dialect, **kwds )
+        else:
+            self.writer = csv.writer( f, dialect = dialect, **kwds )
+
+    def writerows( self, rows ):
+        if six.PY3:
+            self.writer.writerows( rows )
+        else:
+            self.writer.writerows( [ [ s.encode( self.encoding ) for s in row ] for row in rows ] )
+
+class XlsxWriter( object ):
+    """Write a spreadsheet with a single sheet in the xlsx format, row by
+    row.  The rows are written to a temporary file as they come, so the
+    memory usage does not depend on the number of rows.
+
+    The column widths should be set before the first row is written, the
+    styles can be added at any time before the writer is closed.
+
+    :param filename: the name of the xlsx file to create
+    :param sheet_name: the name of the sheet in the file
+    """
+
+    _content_types = ( u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       u'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                       u'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                       u'<Default Extension="xml" ContentType="application/xml"/>'
+                       u'<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                       u'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                       u'<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                       u'</Types>' )
+
+    _relations = ( u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                   u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   u'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                   u'</Relationships>' )
+
+    _workbook = ( u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  u'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                  u'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                  u'<sheets><sheet name=%s sheetId="1" r:id="rId1"/></sheets>'
+                  u'</workbook>' )
+
+    _workbook_relations = ( u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                            u'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                            u'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+                            u'<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+                            u'</Relationships>' )
+
+    def __init__( self, filename, sheet_name = 'Sheet1' ):
+        self.filename = filename
+        self.sheet_name = sheet_name
+        self._styles = [ None ]
+        self._style_indexes = {}
+        self._widths = None
+        self._started = False
+        handle, self._sheet_filename = tempfile.mkstemp( suffix = '.xml' )
+        self._sheet = os.fdopen( handle, 'wb' )
+        self._write( u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     u'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">' )
+
+    def _write( self, text ):
+        self._sheet.write( text.encode( 'utf-8' ) )
+
+    def add_style( self,
+                   font_name = 'Arial',
+                   font_size = 10,
+                   bold = False,
+                   fill_color = None,
+                   borders = (),
+                   num_format = None ):
+        """Register a cell style.
+
+        :param fill_color: an rgb string such as 'C0C0C0' or `None`
+        :param borders: a tuple with the sides that have a thin border,
+            eg. `('left', 'top')`
+        :param num_format: the number format of the cell
+        :return: the index of the style, to be used when writing cells
+        """
+        key = ( font_name, font_size, bold, fill_color, tuple( borders ), num_format )
+        try:
+            return self._style_indexes[ key ]
+        except KeyError:
+            index = len( self._styles )
+            self._styles.append( key )
+            self._style_indexes[ key ] = index
+            return index
+
+    def set_column_widths( self, widths ):
+        """:param widths: a list with the width of each column in characters"""
+        if self._started:
+            raise Exception( 'Column widths should be set before writing rows' )
+        self._widths = widths
+
+    def _start( self ):
+        if self._widths:
+            self._write( u'<cols>' )
+            for i, width in enumerate( self._widths ):
+                self._write( u'<col min="%i" max="%i" width="%.2f" customWidth="1"/>'%( i+1, i+1, width ) )
+            self._write( u'</cols>' )
+        self._write( u'<sheetData>' )
+        self._started = True
+
+    def _cell( self, reference, value, style ):
+        style_attribute = u' s="%i"'%style if style else u''
+        if value is None or value == '':
+            return u'<c r="%s"%s/>'%( reference, style_attribute )
+        if isinstance( value, bool ):
+            return u'<c r="%s"%s t="b"><v>%i</v></c>'%( reference, style_attribute, value )
+        if isinstance( value, datetime.datetime ):
+            delta = value - _epoch
+            value = delta.days + delta.seconds / 86400.0
+        elif isinstance( value, datetime.date ):
+            value = ( value - _epoch.date() ).days
+        elif isinstance( value, datetime.time ):
+            value = ( value.hour * 3600 + value.minute * 60 + value.second ) / 86400.0
+        if isinstance( value, six.integer_types ):
+            return u'<c r="%s"%s><v>%i</v></c>'%( reference, style_attribute, value )
+        if isinstance( value, float ) and value - value == 0:
+            return u'<c r="%s"%s><v>%s</v></c>'%( reference, style_attribute, repr( value ) )
+        text = escape( _illegal_xml_characters.sub( u'', six.text_type( value ) ) )
+        return u'<c r="%s"%s t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>'%( reference, style_attribute, text )
+
+    def write_row( self, row, cells ):
+        """Write a row, rows should be written in increasing order.
+
+        :param row: the index of the row, starting at 0
+        :param cells: a list of `(value, style)` tuples, one for each column
+        """
+        if not self._started:
+            self._start()
+        row_number = row + 1
+        self._write( u'<row r="%i">%s</row>'%( row_number, u''.join(
+            self._cell( u'%s%i'%( column_reference( i ), row_number ), value, style )
+            for i, ( value, style ) in enumerate( cells ) ) ) )
+
+    def _styles_xml( self ):
+        fonts = []
+        fills = [ None, 'gray125' ]
+        borders = [ () ]
+        num_formats = []
+        xfs = []
+        for key in self._styles:
+            if key is None:
+                xfs.append( ( 0, 0, 0, 0 ) )
+                continue
+            font_name, font_size, bold, fill_color, border, num_format = key
+            font = ( font_name, font_size, bold )
+            if font not in fonts:
+                fonts.append( font )
+            if fill_color not in fills:
+                fills.append( fill_color )
+            if border not in borders:
+                borders.append( border )
+            num_format_id = 0
+            if num_format is not None:
+                if num_format not in num_formats:
+                    num_formats.append( num_format )
+                num_format_id = 164 + num_formats.index( num_format )
+            xfs.append( ( num_format_id, fonts.index( font ) + 1,
+                          fills.index( fill_color ), borders.index( border ) ) )
+        parts = [ u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  u'<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">' ]
+        if num_formats:
+            parts.append( u'<numFmts count="%i">'%len( num_formats ) )
+            for i, num_format in enumerate( num_formats ):
+                parts.append( u'<numFmt numFmtId="%i" formatCode=%s/>'%( 164 + i, quoteattr( num_format ) ) )
+            parts.append( u'</numFmts>' )
+        parts.append( u'<fonts count="%i"><font><sz val="10"/><name val="Arial"/></font>'%( len( fonts ) + 1 ) )
+        for font_name, font_size, bold in fonts:
+            parts.append( u'<font>%s<sz val="%i"/><name val=%s/></font>'%( u'<b/>' if bold else u'',
+                                                                          font_size,
+                                                                          quoteattr( font_name ) ) )
+        parts.append( u'</fonts><fills count="%i">'%len( fills ) )
+        for fill in fills:
+            if fill is None:
+                parts.append( u'<fill><patternFill patternType="none"/></fill>' )
+            elif fill == 'gray125':
+                parts.append( u'<fill><patternFill patternType="gray125"/></fill>' )
+            else:
+                parts.append( u'<fill><patternFill patternType="solid"><fgColor rgb="FF%s"/></patternFill></fill>'%fill )
+        parts.append( u'</fills><borders count="%i">'%len( borders ) )
+        for border in borders:
+            parts.append( u'<border>' )
+            for side in ( 'left', 'right', 'top', 'bottom' ):
+                if side in border:
+                    parts.append( u'<%s style="thin"><color auto="1"/></%s>'%( side, side ) )
+                else:
+                    parts.append( u'<%s/>'%side )
+            parts.append( u'<diagonal/></border>' )
+        parts.append( u'</borders><cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>' )
+        parts.append( u'<cellXfs count="%i">'%len( xfs ) )
+        for num_format_id, font_id, fill_id, border_id in xfs:
+            parts.append( u'<xf numFmtId="%i" fontId="%i" fillId="%i" borderId="%i" xfId="0"'
+                          u' applyNumberFormat="1" applyFont="1" applyFill="1" applyBorder="1"/>'%( num_format_id, font_id, fill_id, border_id ) )
+        parts.append( u'</cellXfs></styleSheet>' )
+        return u''.join( parts )
+
+    def close( self ):
+        """Finish the sheet and write the xlsx file"""
+        if not self._started:
+            self._start()
+        self._write( u'</sheetData></worksheet>' )
+        self._sheet.close()
+        try:
+            archive = zipfile.ZipFile( self.filename, 'w', zipfile.ZIP_DEFLATED )
+            try:
+                archive.writestr( '[Content_Types].xml', self._content_types.encode( 'utf-8' ) )
+                archive.writestr( '_rels/.rels', self._relations.encode( 'utf-8' ) )
+                archive.writestr( 'xl/workbook.xml', ( self._workbook%quoteattr( self.sheet_name ) ).encode( 'utf-8' ) )
+                archive.writestr( 'xl/_rels/workbook.xml.rels', self._workbook_relations.encode( 'utf-8' ) )
+                archive.writestr( 'xl/styles.xml', self._styles_xml().encode( 'utf-8' ) )
+                archive.write( self._sheet_filename, 'xl/worksheets/sheet1.xml' )
+            finally:
+                archive.close()
+        finally:
+            self.discard()
+
+    def discard( self ):
+        """Close and remove the temporary file with the sheet, this should
+        be called when the xlsx file is not written because of an error"""
+        if self._sheet_filename is None:
+            return
+        self._sheet.close()
+        os.remove( self._sheet_filename )
+        self._sheet_filename = None
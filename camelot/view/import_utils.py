@@ -29,7 +29,10 @@
 
 """Utility classes to import files into Camelot"""
 
+import codecs
 import csv
+import datetime
+import itertools
 import logging
 import string
 
@@ -57,26 +60,48 @@ class RowData(object):
 
     since the imported file might contain less columns than expected in
     some rows, the RowData object returns None for not existing attributes
+
+    The data is stored in a list, the attributes are only translated to
+    an index in this list when accessed.
     
     :param row_data: a list containing the data
         [column_0_data, column_1_data, ...] for a single row
     """
 
+    __slots__ = ('id', 'values')
+
     def __init__(self, row_number, row_data):
         self.id = row_number + 1
-        i = 0
-        for i, data in enumerate(row_data):
-            self.__setattr__('column_%i' % i, data)
-        self.columns = i + 1
+        self.values = list(row_data)
+
+    @property
+    def columns(self):
+        return max(len(self.values), 1)
 
     def __getattr__(self, attr_name):
+        if attr_name.startswith('column_'):
+            try:
+                return self[int(attr_name[7:])]
+            except ValueError:
+                pass
         return None
 
+    def __setattr__(self, attr_name, value):
+        if attr_name.startswith('column_'):
+            i = int(attr_name[7:])
+            if i >= len(self.values):
+                self.values.extend([None] * (i + 1 - len(self.values)))
+            self.values[i] = value
+        else:
+            super(RowData, self).__setattr__(attr_name, value)
+
     def __len__(self):
         return self.columns
 
     def __getitem__(self, i):
-        return getattr(self, 'column_%i'%i)
+        if i < len(self.values):
+            return self.values[i]
+        return None
 
 def column_name(column):
     """Create a column name starting from an index starting at 0
@@ -243,7 +268,8 @@ class UnicodeReader( six.Iterator ):
         return self
     
 class XlsReader( six.Iterator ):
-    """Read an XLS/XLSX file and iterator over its lines.
+    """Read an XLS/XLSX file and iterator over its lines.  For XLSX files,
+    the :class:`XlsxReader` reads the file without loading it completely.
     
     The iterator returns each line of the excel as a list of strings.
     
@@ -329,9 +355,385 @@ class XlsReader( six.Iterator ):
         else:
             raise StopIteration()
 
+    def progress( self ):
+        return ( self.current_row, self.sheet.nrows )
+
     def __iter__( self ):
         return self
-    
+
+def _local_name( tag ):
+    """:return: the tag of an xml element without its namespace"""
+    return tag.rsplit( '}', 1 )[-1]
+
+def _column_index( reference ):
+    """:return: the index of the column of a cell reference such as 'AB12',
+    starting at 0"""
+    index = 0
+    for c in reference:
+        if c.isdigit():
+            break
+        index = index * 26 + ord( c.upper() ) - ord( 'A' ) + 1
+    return index - 1
+
+class XlsxReader( six.Iterator ):
+    """Read an XLSX file and iterate over its lines, without loading the whole
+    workbook in memory.
+
+    The sheet is parsed incrementally, while the shared strings and the
+    number formats are resolved once when the file is opened.  The lines
+    are returned in the same way as the :class:`XlsReader` does.
+
+    :param filename: the name of the xlsx file
+    """
+
+    builtin_formats = { 0: 'General', 1: '0', 2: '0.00', 3: '#,##0',
+                        4: '#,##0.00', 9: '0%', 10: '0.00%', 11: '0.00E+00',
+                        12: '# ?/?', 13: '# ??/??', 14: 'mm-dd-yy',
+                        15: 'd-mmm-yy', 16: 'd-mmm', 17: 'mmm-yy',
+                        18: 'h:mm AM/PM', 19: 'h:mm:ss AM/PM', 20: 'h:mm',
+                        21: 'h:mm:ss', 22: 'm/d/yy h:mm', 37: '#,##0 ;(#,##0)',
+                        38: '#,##0 ;[Red](#,##0)', 39: '#,##0.00;(#,##0.00)',
+                        40: '#,##0.00;[Red](#,##0.00)', 45: 'mm:ss',
+                        46: '[h]:mm:ss', 47: 'mmss.0', 48: '##0.0E+0', 49: '@' }
+
+    builtin_date_formats = set( [ 14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47 ] )
+
+    def __init__( self, filename ):
+        import zipfile
+        self.archive = zipfile.ZipFile( filename )
+        self.date_format = local_date_format()
+        self.locale = QtCore.QLocale()
+        self.epoch = datetime.datetime( 1899, 12, 30 )
+        sheet_path = self._read_workbook()
+        self.shared_strings = self._read_shared_strings()
+        self.formats = self._read_styles()
+        self.current_row = 0
+        self.nrows = 0
+        self.ncols = 0
+        self._rows = self._read_rows( sheet_path )
+
+    def _iterparse( self, path, events = ('end',) ):
+        try:
+            from xml.etree import cElementTree as ElementTree
+        except ImportError:
+            from xml.etree import ElementTree
+        return ElementTree.iterparse( self.archive.open( path ), events )
+
+    def _read_workbook( self ):
+        """:return: the path of the first sheet in the archive"""
+        sheet_id = None
+        for _event, element in self._iterparse( 'xl/workbook.xml' ):
+            tag = _local_name( element.tag )
+            if tag == 'workbookPr':
+                if element.get( 'date1904' ) in ( '1', 'true' ):
+                    self.epoch = datetime.datetime( 1904, 1, 1 )
+            elif tag == 'sheet' and sheet_id is None:
+                for key, value in element.items():
+                    if _local_name( key ) == 'id':
+                        sheet_id = value
+        if sheet_id is not None:
+            for _event, element in self._iterparse( 'xl/_rels/workbook.xml.rels' ):
+                if element.get( 'Id' ) == sheet_id:
+                    target = element.get( 'Target' )
+                    if target.startswith( '/' ):
+                        return target[1:]
+                    return 'xl/' + target
+        return 'xl/worksheets/sheet1.xml'
+
+    def _read_shared_strings( self ):
+        """:return: the list of shared strings"""
+        shared_strings = []
+        if 'xl/sharedStrings.xml' not in self.archive.namelist():
+            return shared_strings
+        for _event, element in self._iterparse( 'xl/sharedStrings.xml' ):
+            if _local_name( element.tag ) == 'si':
+                # phonetic runs are not part of the text
+                texts = [ t.text or u'' for t in element.iter() 
+                          if _local_name( t.tag ) == 't' ]
+                for phonetic in [ e for e in element if _local_name( e.tag ) == 'rPh' ]:
+                    for t in phonetic.iter():
+                        if _local_name( t.tag ) == 't':
+                            texts.remove( t.text or u'' )
+                shared_strings.append( u''.join( texts ) )
+                element.clear()
+        return shared_strings
+
+    def _read_styles( self ):
+        """:return: a list with for each cell style a tuple
+        `(is_date, precision)`"""
+        import re
+        custom_formats = {}
+        formats = []
+        if 'xl/styles.xml' not in self.archive.namelist():
+            return formats
+        in_cell_xfs = False
+        for event, element in self._iterparse( 'xl/styles.xml', ('start', 'end') ):
+            tag = _local_name( element.tag )
+            if tag == 'cellXfs':
+                in_cell_xfs = ( event == 'start' )
+            elif event == 'end' and tag == 'numFmt':
+                custom_formats[ int( element.get( 'numFmtId' ) ) ] = element.get( 'formatCode' )
+            elif event == 'end' and tag == 'xf' and in_cell_xfs:
+                format_id = int( element.get( 'numFmtId', 0 ) )
+                format_string = custom_formats.get( format_id,
+                                                    self.builtin_formats.get( format_id ) )
+                if format_id in self.builtin_date_formats:
+                    is_date = True
+                elif format_string is None or format_id in self.builtin_formats:
+                    is_date = False
+                else:
+                    stripped = re.sub( r'"[^"]*"|\[[^\]]*\]|\\.', '', format_string )
+                    is_date = re.search( '[dmyhs]', stripped, re.IGNORECASE ) is not None
+                # xlsx files read with xlrd had no format information, and
+                # used '0.00', keep this for the general format
+                if format_string in ( None, 'General' ):
+                    format_string = '0.00'
+                precision = max( 0, format_string.split( ';' )[0].count( '0' ) - 1 )
+                formats.append( ( is_date, precision ) )
+        return formats
+
+    def _cell_value( self, cell_type, style, value ):
+        """:return: the string representation of a cell"""
+        if cell_type in ( 's', 'str', 'inlineStr' ):
+            if cell_type == 's':
+                return self.shared_strings[ int( value ) ]
+            return value
+        if value is None or cell_type == 'e':
+            return ''
+        if cell_type == 'b':
+            if value == '1':
+                return 'true'
+            return 'false'
+        if cell_type == 'd':
+            dt = QtCore.QDate.fromString( value[:10], 'yyyy-MM-dd' )
+            return six.text_type( dt.toString( self.date_format ) )
+        is_date, precision = False, 2
+        if style < len( self.formats ):
+            is_date, precision = self.formats[ style ]
+        number = float( value )
+        if is_date:
+            # this only handles dates, no datetime or time
+            py_date = self.epoch + datetime.timedelta( days = number )
+            dt = QtCore.QDate( py_date.year, py_date.month, py_date.day )
+            return six.text_type( dt.toString( self.date_format ) )
+        return six.text_type( self.locale.toString( number,
+                                                    format = 'f',
+                                                    precision = precision ) )
+
+    def _read_rows( self, sheet_path ):
+        sheet_data = None
+        for event, element in self._iterparse( sheet_path, ('start', 'end') ):
+            tag = _local_name( element.tag )
+            if event == 'start':
+                if tag == 'sheetData':
+                    sheet_data = element
+                continue
+            if tag == 'dimension':
+                last_cell = element.get( 'ref', '' ).split( ':' )[-1]
+                row_digits = last_cell.lstrip( string.ascii_letters )
+                if row_digits.isdigit():
+                    self.nrows = int( row_digits )
+                    self.ncols = _column_index( last_cell ) + 1
+            elif tag == 'row':
+                row_number = int( element.get( 'r', self.current_row + 1 ) ) - 1
+                # empty rows are not in the file
+                while self.current_row < row_number:
+                    self.current_row += 1
+                    yield [ '' ] * self.ncols
+                vector = [ '' ] * self.ncols
+                column = 0
+                for cell in element:
+                    if _local_name( cell.tag ) != 'c':
+                        continue
+                    reference = cell.get( 'r' )
+                    if reference is not None:
+                        column = _column_index( reference )
+                    cell_type = cell.get( 't', 'n' )
+                    value = None
+                    for child in cell:
+                        child_tag = _local_name( child.tag )
+                        if child_tag == 'v':
+                            value = child.text
+                        elif child_tag == 'is':
+                            value = u''.join( t.text or u'' for t in child.iter() 
+                                              if _local_name( t.tag ) == 't' )
+                    while len( vector ) <= column:
+                        vector.append( '' )
+                    vector[ column ] = self._cell_value( cell_type,
+                                                         int( cell.get( 's', 0 ) ),
+                                                         value )
+                    column += 1
+                self.current_row += 1
+                if sheet_data is not None:
+                    sheet_data.clear()
+                yield vector
+
+    def progress( self ):
+        return ( self.current_row, max( self.nrows, self.current_row ) )
+
+    def close( self ):
+        self.archive.close()
+
+    def __next__( self ):
+        return six.next( self._rows )
+
+    def __iter__( self ):
+        return self
+
+def detect_encoding( stream, sample_size = 64*1024, block_size = 4096 ):
+    """Detect the encoding of a binary stream by feeding at most
+    `sample_size` bytes to the detector, the stream is positioned at the
+    start after detection.
+
+    :return: the name of the encoding, 'utf-8' if it could not be detected
+    """
+    from chardet.universaldetector import UniversalDetector
+    detector = UniversalDetector()
+    read = 0
+    while read < sample_size and not detector.done:
+        block = stream.read( block_size )
+        if not block:
+            break
+        read += len( block )
+        detector.feed( block )
+    detector.close()
+    stream.seek( 0 )
+    return detector.result['encoding'] or 'utf-8'
+
+class FileReader( six.Iterator ):
+    """Stream the rows of a csv, xls or xlsx file, without reading the whole
+    file in memory.
+
+    The iterator returns each line of the file as a list of strings.
+
+    :param filename: the name of the file
+    :param sample_size: the number of bytes used to detect the encoding of a
+        csv file
+    """
+
+    def __init__( self, filename, sample_size = 64*1024 ):
+        import os.path
+        self.stream = None
+        extension = os.path.splitext( filename )[-1]
+        if extension == '.xlsx':
+            self.reader = XlsxReader( filename )
+            self.encoding = None
+        elif extension == '.xls':
+            self.reader = XlsReader( filename )
+            self.encoding = None
+        else:
+            self.stream = open( filename, 'rb' )
+            self.size = os.fstat( self.stream.fileno() ).st_size
+            self.encoding = detect_encoding( self.stream, sample_size )
+            text_stream = codecs.getreader( self.encoding )( self.stream )
+            self.reader = UnicodeReader( text_stream, encoding = self.encoding )
+
+    def progress( self ):
+        """:return: a tuple `(done, total)` with an estimate of the part of
+        the file that has been read"""
+        if self.stream is None:
+            return self.reader.progress()
+        return ( self.stream.tell(), self.size )
+
+    def close( self ):
+        if self.stream is not None:
+            self.stream.close()
+        elif isinstance( self.reader, XlsxReader ):
+            self.reader.close()
+
+    def __next__( self ):
+        return six.next( self.reader )
+
+    def __iter__( self ):
+        return self
+
+def chunks( iterable, size ):
+    """Split an iterable in lists of at most `size` elements"""
+    iterator = iter( iterable )
+    while True:
+        chunk = list( itertools.islice( iterator, size ) )
+        if not chunk:
+            break
+        yield chunk
+
+def convert_rows( converters, rows ):
+    """Convert and validate the data of rows to import.  This function is
+    used in the worker processes of :func:`convert_chunks`, so its
+    arguments should be picklable.
+
+    :param converters: a list of tuples `(column, field, from_string, nullable)`
+        for each field to import, where from_string might be `None`
+    :param rows: a list of tuples `(row_number, values)`
+    :return: a tuple `(values, errors)`, where `values` is a list with for
+        each row a list of `(field, value)` tuples and errors is a list with
+        the row numbers of the invalid rows.
+    """
+    converted = []
+    errors = []
+    for row_number, row_values in rows:
+        row_converted = []
+        valid = True
+        for column, field, from_string, nullable in converters:
+            value = None
+            if from_string is not None:
+                string_value = None
+                if column < len( row_values ):
+                    string_value = row_values[column]
+                try:
+                    value = from_string( string_value )
+                except Exception:
+                    valid = False
+                # 0 is valid
+                if value != 0 and not value and not nullable:
+                    valid = False
+            row_converted.append( ( field, value ) )
+        if valid:
+            converted.append( row_converted )
+        else:
+            errors.append( row_number )
+    return converted, errors
+
+def convert_chunks( converters, row_chunks, processes = None ):
+    """Convert and validate chunks of `RowData` objects with
+    :func:`convert_rows`.
+
+    When `processes` is given, and the converters can be pickled, the chunks
+    are converted in a pool of worker processes, otherwise they are converted
+    in the current thread.  Only a limited number of chunks is submitted to
+    the pool at the same time, so the chunks can be read lazily.
+
+    :return: a generator of tuples `(values, errors)` in the order of
+        the chunks.
+    """
+    import collections
+    import pickle
+    pool = None
+    if processes:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            pickle.dumps( converters )
+            pool = ProcessPoolExecutor( processes )
+        except ImportError:
+            logger.warn( 'concurrent.futures not available, converting in a single process' )
+        except Exception as e:
+            logger.warn( 'converters cannot be used in a process pool', exc_info = e )
+    if pool is None:
+        for chunk in row_chunks:
+            yield convert_rows( converters, [ ( row.id, row.values ) for row in chunk ] )
+        return
+    try:
+        pending = collections.deque()
+        for chunk in row_chunks:
+            pending.append( pool.submit( convert_rows,
+                                         converters,
+                                         [ ( row.id, row.values ) for row in chunk ] ) )
+            if len( pending ) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown( wait = False )
+
 class RowDataAdmin(object):
     """Decorator that transforms the Admin of the class to be imported to an
     Admin of the RowData objects to be used when previewing and validating the
@@ -352,6 +754,7 @@ class RowDataAdmin(object):
     def __init__(self, admin, column_mappings):
         self.admin = admin
         self._new_field_attributes = {}
+        self._column_indexes = {}
         self._columns = []
         for column_mapping in column_mappings:
             field_name = 'column_%i'%column_mapping.column
@@ -360,10 +763,15 @@ class RowDataAdmin(object):
                 fa = self.new_field_attributes(original_field)
                 self._columns.append( (field_name, fa) )
                 self._new_field_attributes[field_name] = fa
+                self._column_indexes[field_name] = column_mapping.column
 
     def get_columns(self):
         return self._columns
 
+    def get_column_index(self, field_name):
+        """:return: the index in the row data of the column mapped to a field"""
+        return self._column_indexes[field_name]
+
     def get_verbose_identifier(self, obj):
         return six.text_type()
 
@@ -435,7 +843,7 @@ class RowDataAdmin(object):
     def get_dynamic_field_attributes(self, obj, field_names):
         for field_name in field_names:
             attributes = self.get_field_attributes(field_name)
-            string_value = getattr(obj, field_name)
+            string_value = obj[self.get_column_index(field_name)]
             valid = True
             value = None
             if 'from_string' in attributes:
@@ -146,6 +146,12 @@ class EmptyRowData( object ):
 
 empty_row_data = EmptyRowData()
 
+def is_lazy_sequence( collection ):
+    """:return: `True` if the collection is a sequence that loads its
+        objects when they are accessed, such as a ChangeCollection, and should
+        not be iterated as a whole"""
+    return not isinstance( collection, (list, tuple) ) and hasattr( collection, '__len__' )
+
 class SortingRowMapper( dict ):
     """Class mapping rows of a collection 1:1 without sorting
     and filtering, unless a mapping has been defined explicitly"""
@@ -372,7 +378,11 @@ position in the query.
     def _update_unflushed_rows( self ):
         """Verify all rows to see if some of them should be added to the
         unflushed rows"""
-        for i, e in enumerate( self.get_collection() ):
+        collection = self.get_collection()
+        if is_lazy_sequence( collection ):
+            # a lazy sequence only contains objects from the database
+            return
+        for i, e in enumerate( collection ):
             if hasattr(e, 'id') and not e.id:
                 self.unflushed_rows.add( i )
 
@@ -401,7 +411,11 @@ position in the query.
         # in the list, since this will drive the cache nuts
         if len(self._rowcount_requests) == 0:
             # this is the last request on its way, do the counting now
-            rows = len( set( self.get_collection() ) )
+            collection = self.get_collection()
+            if is_lazy_sequence( collection ):
+                rows = len( collection )
+            else:
+                rows = len( set( collection ) )
         else:
             # other row count reqests are on their way, do nothing now
             rows = None
@@ -446,9 +460,24 @@ position in the query.
     def get_value(self):
         return self._collection
 
-    def get_collection( self ):
+    def get_collection( self, yield_per = None ):
+        """
+        :param yield_per: a hint on how many objects should be fetched at
+            the same time, in which case an iterator might be returned
+            instead of the collection itself.
+        """
         return self._collection
 
+    def get_objects( self, first_row, last_row, yield_per = None ):
+        """
+        :param yield_per: a hint on how many objects should be fetched at
+            the same time
+        :return: a generator over the objects in the rows from `first_row`
+            up to and including `last_row`
+        """
+        for row in six.moves.range( first_row, last_row + 1 ):
+            yield self._get_object( row )
+
     def handleRowUpdate( self, row ):
         """Handles the update of a row when this row might be out of date"""
         assert object_thread( self )
@@ -648,7 +677,12 @@ position in the query.
         def create_sort(column, order):
 
             def sort():
-                unsorted_collection = [(i,o) for i,o in enumerate(self.get_collection())]
+                collection = self.get_collection()
+                if is_lazy_sequence( collection ):
+                    # a lazy sequence keeps its own order, since sorting
+                    # would load all its objects
+                    return len( collection )
+                unsorted_collection = [(i,o) for i,o in enumerate(collection)]
                 field_name = self._columns[column][0]
                 
                 # handle the case of one of the values being None
@@ -38,6 +38,7 @@ import six
 from sqlalchemy import orm, sql
 from sqlalchemy.exc import InvalidRequestError
 
+from ...core.orm.query_cache import CachedQuery, query_cache
 from ...core.qt import QtCore, Qt
 from ..model_thread import object_thread, post
 from .collection_proxy import CollectionProxy
@@ -72,6 +73,14 @@ class QueryTableProxy(CollectionProxy):
         query = self._query
         if query is None:
             return None
+        return self.decorate_query(query)
+
+    def decorate_query(self, query):
+        """
+        :param query: a `Query` on the entity of the admin
+        :return: the query with the sorting and the filters of this proxy
+            applied
+        """
         if self._sort_decorator is None:
             self._set_sort_decorator()
             
@@ -80,6 +89,22 @@ class QueryTableProxy(CollectionProxy):
             query = filter_.decorate_query(query, value)
         query = self._sort_decorator(query)
         return query
+
+    def count_query(self, query):
+        """
+        :param query: a `Query` on the entity of the admin
+        :return: the number of rows in the query
+        """
+        # manipulate the query to circumvent the use of subselects and order by
+        # clauses
+        mapper = orm.class_mapper(self.admin.entity)
+        select = query.order_by(None).as_scalar()
+        select = select.with_only_columns([sql.func.count(mapper.primary_key[0])])
+        count = lambda:query.session.execute(select, mapper=mapper).scalar()
+        if isinstance(query, CachedQuery):
+            return query_cache.get_or_execute(self.admin.entity, select,
+                                              'count', count)
+        return count()
     
     def _update_unflushed_rows( self ):
         """Does nothing since all rows returned by a query are flushed"""
@@ -121,31 +146,29 @@ class QueryTableProxy(CollectionProxy):
             if self._query is None:
                 rows = 0
             else:
-                # manipulate the query to circumvent the use of subselects and order by
-                # clauses
-                query = self.get_query()
-                mapper = orm.class_mapper(self.admin.entity)
-                select = query.order_by(None).as_scalar()
-                select = select.with_only_columns([sql.func.count(mapper.primary_key[0])])
-                count = query.session.execute(select, mapper=mapper).scalar()
-                rows = count + len(self._appended_rows)
+                rows = self.count_query(self.get_query()) + len(self._appended_rows)
         else:
             # other row count reqests are on their way, do nothing now
             rows = None
         return rows
 
-    def set_value(self, query):
+    def set_value(self, query, rows=None):
         """
         :param query: the `Query` to display
+        :param rows: the number of rows in the query, when it is already
+            known, in which case no count query is needed.
         """
         assert object_thread( self )
         self._query = query
-        self.refresh()
+        if rows is None:
+            self.refresh()
+        else:
+            self._refresh_content(rows + len(self._appended_rows))
             
     def get_value(self):
         return self._query
 
-    def get_collection(self):
+    def get_collection(self, yield_per=None):
         """In case the collection is requested of a QueryProxy, we will return
         a collection getter for a collection that reuses the data already queried by
         the collection proxy, and available in the cache.
@@ -160,11 +183,62 @@ class QueryTableProxy(CollectionProxy):
            query proxy, and once to fill the returned collection), the same object might appear
            in a different row.  eg when a form is opened in a table view, the form contains 
            another record than the selected row in the table.
+
+        When `yield_per` is given, a generator is returned that fetches `yield_per`
+        objects at a time.
         """
         
         if self._query is None:
             return []
+        if yield_per is not None:
+            return self._yield_collection(yield_per)
         return self.get_query().all()
+
+    def _yield_collection(self, yield_per):
+        """Iterate over the objects in the query, without loading all of them
+        in memory.  Since `yield_per` cannot be combined with eager loading of
+        collections, fall back to fetching chunks of rows in that case.
+        """
+        query = self.get_query()
+        try:
+            iterator = iter(query.yield_per(yield_per))
+        except InvalidRequestError:
+            iterator = None
+        if iterator is not None:
+            for obj in iterator:
+                yield obj
+            return
+        offset = 0
+        while True:
+            objects = query.offset(offset).limit(yield_per).all()
+            for obj in objects:
+                yield obj
+            if len(objects) < yield_per:
+                break
+            offset += yield_per
+
+    def get_objects(self, first_row, last_row, yield_per=None):
+        """Fetch the objects in the rows that are not in the cache in chunks of
+        `yield_per` rows, instead of one query per row"""
+        if (yield_per is None) or (self._query is None):
+            for obj in super(QueryTableProxy, self).get_objects(first_row, last_row):
+                yield obj
+            return
+        self._clean_appended_rows()
+        rows_in_query = (self._rows - len(self._appended_rows))
+        row = first_row
+        last_query_row = min(last_row, rows_in_query - 1)
+        while row <= last_query_row:
+            limit = min(yield_per, last_query_row - row + 1)
+            try:
+                objects = [self.edit_cache.get_entity_at_row(r) for r in six.moves.range(row, row + limit)]
+            except KeyError:
+                objects = self.get_query().offset(row).limit(limit).all()
+            for obj in objects:
+                yield obj
+            row += limit
+        for row in six.moves.range(max(first_row, rows_in_query), min(last_row, self._rows - 1) + 1):
+            yield self._appended_rows[row - rows_in_query]
     
     def _set_sort_decorator( self, column=None, order=None ):
         """set the sort decorator attribute of this model to a function that
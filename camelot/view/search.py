@@ -30,6 +30,7 @@
 """
 Helper functions to search through a collection of entities
 """
+import collections
 import datetime
 import decimal
 import logging
@@ -39,10 +40,205 @@ LOGGER = logging.getLogger('camelot.view.search')
 import six
 
 from camelot.types import virtual_address
-from sqlalchemy import sql
+from sqlalchemy import orm, sql
 
 import camelot.types
 
+#
+# The kinds of columns in which can be searched, and as such the kinds of
+# values a search term can represent
+#
+TEXT = 'text'
+ADDRESS = 'address'
+CODE = 'code'
+BOOL = 'bool'
+INT = 'int'
+DATE = 'date'
+DAYS = 'days'
+FLOAT = 'float'
+
+# the kinds of columns in which a search is a substring match
+substring_kinds = (TEXT, ADDRESS)
+
+def column_kind(column):
+    """
+    :param column: the column or the instrumented attribute in which to search
+    :return: the kind of the column, or `None` if the column cannot be
+        searched
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    # @todo : this should use the from_string field attribute, without
+    #         looking at the sql code
+    type_class = column.type.__class__
+    if issubclass(type_class, (camelot.types.Color,
+                               camelot.types.File,
+                               camelot.types.Enumeration)):
+        return None
+    elif issubclass(type_class, camelot.types.Code):
+        return CODE
+    elif issubclass(python_type, virtual_address):
+        return ADDRESS
+    elif issubclass(type_class, camelot.types.Image):
+        return None
+    elif issubclass(python_type, bool):
+        return BOOL
+    elif issubclass(python_type, int):
+        return INT
+    elif issubclass(python_type, datetime.date):
+        return DATE
+    elif issubclass(python_type, datetime.timedelta):
+        return DAYS
+    elif issubclass(python_type, (float, decimal.Decimal)):
+        return FLOAT
+    elif issubclass(python_type, six.string_types):
+        return TEXT
+    return None
+
+class SearchTerm(object):
+    """A single word of a search text, classified according to the kinds of
+    values it represents.
+
+    :param text: the word
+    :param kinds: the kinds of values for which the word should be parsed
+    """
+
+    def __init__(self, text, kinds):
+        from camelot.view import utils
+        parsers = {
+            BOOL: utils.bool_from_string,
+            INT: utils.int_from_string,
+            DATE: utils.date_from_string,
+            DAYS: lambda t: datetime.timedelta(days=utils.int_from_string(t)),
+            FLOAT: lambda t: float(utils.float_from_string(t)),
+        }
+        self.text = text
+        self.values = dict()
+        for kind in kinds:
+            parser = parsers.get(kind)
+            if parser is None:
+                continue
+            try:
+                self.values[kind] = parser(text)
+            except ( Exception, utils.ParsingError ):
+                pass
+
+class SearchColumn(object):
+    """A column in which can be searched.
+
+    :param column: the instrumented attribute of the column
+    :param kind: the kind of the column
+    """
+
+    def __init__(self, column, kind):
+        self.column = column
+        self.kind = kind
+        self.delta = None
+        if kind == FLOAT:
+            precision = column.type.precision
+            if isinstance(precision, (tuple)):
+                precision = precision[1]
+            self.delta = 0.1**( precision or 0 )
+
+    def accepts(self, term):
+        """
+        :return: `True` if a clause can be build to search for term in this
+            column
+        """
+        return (self.kind in (TEXT, ADDRESS, CODE)) or (self.kind in term.values)
+
+    def clause(self, term):
+        """
+        :param term: a :class:`SearchTerm` accepted by this column
+        :return: a where clause to search for term in this column
+        """
+        c = self.column
+        text = term.text
+        if self.kind == CODE:
+            codes = [u'%%%s%%'%s for s in text.split(c.type.separator)]
+            codes = codes + ['%']*(len(c.type.parts) - len(codes))
+            arg = c.like( codes )
+        elif self.kind == ADDRESS:
+            arg = c.like(virtual_address('%', '%'+text+'%'))
+        elif self.kind == TEXT:
+            arg = sql.operators.ilike_op(c, '%'+text+'%')
+        elif self.kind == FLOAT:
+            float_value = term.values[FLOAT]
+            arg = sql.and_(c>=float_value-self.delta, c<=float_value+self.delta)
+        else:
+            arg = (c==term.values[self.kind])
+        return sql.and_(c != None, arg)
+
+    def matches(self, value, term):
+        """Evaluate the clause for term in python, on the value of this
+        column for an object.
+
+        :param value: the value of the column
+        :param term: a :class:`SearchTerm` accepted by this column
+        :return: `True` or `False`, or `None` if the clause cannot be
+            evaluated in python
+        """
+        if value is None:
+            return False
+        text = term.text.lower()
+        if self.kind == CODE:
+            return None
+        elif (self.kind in (ADDRESS, TEXT)) and (u'%' in text or u'_' in text):
+            # wildcards in the like clause
+            return None
+        elif self.kind == ADDRESS:
+            return text in six.text_type(value[1]).lower()
+        elif self.kind == TEXT:
+            return text in six.text_type(value).lower()
+        elif self.kind == FLOAT:
+            return abs(float(value) - term.values[FLOAT]) <= self.delta
+        return value == term.values[self.kind]
+
+class SearchPlan(object):
+    """The fields of an admin in which can be searched, with the joins needed
+    to reach them and the kinds of the columns.  The resolution of a field is
+    done only once, when it is first searched.
+
+    :param admin: the admin of the entity that is searched
+    """
+
+    def __init__(self, admin):
+        self.admin = admin
+        self._fields = dict()
+
+    def get_field(self, field_name):
+        """
+        :param field_name: the name of a search field, possibly a path of
+            relations separated by dots
+        :return: a tuple with a list of instrumented attributes to join and a
+            list of :class:`SearchColumn` objects
+        """
+        try:
+            return self._fields[field_name]
+        except KeyError:
+            pass
+        joins, columns = [], []
+        target = self.admin.entity
+        related_admin = self.admin
+        for path_segment in field_name.split('.'):
+            # use the field attributes for the introspection, as these
+            # have detected hybrid properties
+            fa = related_admin.get_descriptor_field_attributes(path_segment)
+            instrumented_attribute = getattr(target, path_segment)
+            if fa.get('target', False):
+                joins.append(instrumented_attribute)
+                target = fa['target']
+                related_admin = related_admin.get_related_admin(target)
+            else:
+                kind = column_kind(instrumented_attribute)
+                if kind is not None:
+                    columns.append(SearchColumn(instrumented_attribute, kind))
+        field = (joins, columns)
+        self._fields[field_name] = field
+        return field
+
 def create_entity_search_query_decorator( admin, text ):
     """create a query decorator to search through a collection of entities
     :param admin: the admin interface of the entity
@@ -51,97 +247,37 @@ def create_entity_search_query_decorator( admin, text ):
     only the objects related to the requested text or None if no such decorator
     could be build
     """
-    from camelot.view import utils
-
     if len(text.strip()):
+        plan = admin.get_search_plan()
         # arguments for the where clause
         args = []
         # join conditions : list of join entities
         joins = []
-
-        def append_column( c, text, args ):
-            """add column c to the where clause using a clause that
-            is relevant for that type of column"""
-            arg = None
-            try:
-                python_type = c.type.python_type
-            except NotImplementedError:
-                return
-            # @todo : this should use the from_string field attribute, without
-            #         looking at the sql code
-            if issubclass(c.type.__class__, camelot.types.Color):
-                pass
-            elif issubclass(c.type.__class__, camelot.types.File):
-                pass
-            elif issubclass(c.type.__class__, camelot.types.Enumeration):
-                pass
-            elif issubclass(c.type.__class__, camelot.types.Code):
-                codes = [u'%%%s%%'%s for s in text.split(c.type.separator)]
-                codes = codes + ['%']*(len(c.type.parts) - len(codes))
-                arg = c.like( codes )
-            elif issubclass(python_type, virtual_address):
-                arg = c.like(virtual_address('%', '%'+text+'%'))
-            elif issubclass(c.type.__class__, camelot.types.Image):
-                pass
-            elif issubclass(python_type, bool):
-                try:
-                    arg = (c==utils.bool_from_string(text))
-                except ( Exception, utils.ParsingError ):
-                    pass
-            elif issubclass(python_type, int):
-                try:
-                    arg = (c==utils.int_from_string(text))
-                except ( Exception, utils.ParsingError ):
-                    pass
-            elif issubclass(python_type, datetime.date):
-                try:
-                    arg = (c==utils.date_from_string(text))
-                except ( Exception, utils.ParsingError ):
-                    pass
-            elif issubclass(python_type, datetime.timedelta):
-                try:
-                    days = utils.int_from_string(text)
-                    arg = (c==datetime.timedelta(days=days))
-                except ( Exception, utils.ParsingError ):
-                    pass
-            elif issubclass(python_type, (float, decimal.Decimal)):
-                try:
-                    float_value = utils.float_from_string(text)
-                    precision = c.type.precision
-                    if isinstance(precision, (tuple)):
-                        precision = precision[1]
-                    delta = 0.1**( precision or 0 )
-                    arg = sql.and_(c>=float_value-delta, c<=float_value+delta)
-                except ( Exception, utils.ParsingError ):
-                    pass
-            elif issubclass(python_type, six.string_types):
-                arg = sql.operators.ilike_op(c, '%'+text+'%')
-
-            if arg is not None:
-                arg = sql.and_(c != None, arg)
-                args.append(arg)
+        # the terms for which only substring matches were used
+        substring_terms = set()
 
         for t in text.split(' '):
+            fields = [plan.get_field(f) for f in admin.get_search_fields(t)]
+            kinds = set(c.kind for _joins, columns in fields for c in columns)
+            term = SearchTerm(t, kinds)
             subexp = []
-            for column_name in admin.get_search_fields(t):
-                path = column_name.split('.')
-                target = admin.entity
-                related_admin = admin
-                for path_segment in path:
-                    # use the field attributes for the introspection, as these
-                    # have detected hybrid properties
-                    fa = related_admin.get_descriptor_field_attributes(path_segment)
-                    instrumented_attribute = getattr(target, path_segment)
-                    if fa.get('target', False):
-                        joins.append(instrumented_attribute)
-                        target = fa['target']
-                        related_admin = related_admin.get_related_admin(target)
-                    else:
-                        append_column(instrumented_attribute, t, subexp)
-
+            substring_term = True
+            for field_joins, columns in fields:
+                for join in field_joins:
+                    # compare by identity, the == of an attribute creates
+                    # a clause
+                    if not any(join is j for j in joins):
+                        joins.append(join)
+                for column in columns:
+                    if column.accepts(term):
+                        subexp.append(column.clause(term))
+                        if column.kind not in substring_kinds:
+                            substring_term = False
             args.append(subexp)
+            if substring_term:
+                substring_terms.add(t)
 
-        def create_query_decorator(joins, args):
+        def create_query_decorator(joins, args, substring_terms):
             """Bind the join and args to a query decorator function"""
 
             def query_decorator(query):
@@ -156,8 +292,213 @@ def create_entity_search_query_decorator( admin, text ):
 
                 return query
 
+            # the terms that were only matched as substrings, as searching
+            # for a longer version of those terms will return a subset of
+            # the rows
+            query_decorator.substring_terms = frozenset(substring_terms)
             return query_decorator
 
-        return create_query_decorator(joins, args)
+        return create_query_decorator(joins, args, substring_terms)
+
+def entity_matches(admin, obj, text):
+    """Evaluate in python if an object would be found when searching for a
+    text, without querying the database.
+
+    :param admin: the admin interface of the entity
+    :param obj: the object
+    :param text: the text to search for
+    :return: `True` or `False`, or `None` if the search cannot be evaluated
+        in python
+    """
+    plan = admin.get_search_plan()
+    terms = text.split(' ')
+    for t in terms:
+        fields = [(f, plan.get_field(f)) for f in admin.get_search_fields(t)]
+        kinds = set(c.kind for _f, (_joins, columns) in fields for c in columns)
+        term = SearchTerm(t, kinds)
+        found = False
+        for field_name, (_joins, columns) in fields:
+            if not len(columns):
+                continue
+            if len(columns) > 1:
+                return None
+            column = columns[0]
+            if not column.accepts(term):
+                continue
+            values = [obj]
+            for path_segment in field_name.split('.'):
+                next_values = []
+                for value in values:
+                    value = getattr(value, path_segment, None)
+                    # follow one to many relations
+                    if isinstance(value, (list, set)) and column.kind != CODE:
+                        # in the query, all terms should match the same
+                        # joined row
+                        if len(terms) > 1:
+                            return None
+                        next_values.extend(value)
+                    else:
+                        next_values.append(value)
+                values = next_values
+            for value in values:
+                match = column.matches(value, term)
+                if match is None:
+                    return None
+                found = found or match
+        if not found:
+            return False
+    return True
+
+def refines(previous_text, text, substring_terms):
+    """
+    :param substring_terms: the terms of text that are only matched as
+        substrings
+    :return: `True` if the rows found when searching for text are a
+        subset of those found when searching for previous_text
+    """
+    previous_terms = previous_text.split(' ')
+    terms = text.split(' ')
+    if len(terms) < len(previous_terms):
+        return False
+    last = len(previous_terms) - 1
+    for i, previous_term in enumerate(previous_terms):
+        term = terms[i]
+        if term == previous_term:
+            continue
+        if (i == last) and term.startswith(previous_term) and \
+           (term in substring_terms):
+            continue
+        return False
+    return True
+
+class IncrementalSearch(object):
+    """Keeps track of the successive searches on the rows of an entity,
+    to avoid redoing the work of previous searches while the user is typing.
+
+    Each search is identified by a generation number, incremented in the
+    gui thread when a new search is started.  Once a search is started,
+    the model thread skips the requests of the searches it superseded.
+
+    When the new search text extends a previous one, the primary keys of
+    the previous result are used to restrict the new search.  Those keys
+    are only queried once a search that refines the previous one is started,
+    so a search that cannot be refined needs no extra query.  The number
+    of rows found for recent searches is cached, so returning to a previous
+    search text requires no count query.
+
+    :param admin: the admin of the entity that is searched
+    :param refine_limit: the maximum number of primary keys kept of a
+        search result to refine later searches.
+    :param cache_size: the number of search results to keep
+    """
+
+    def __init__(self, admin, refine_limit=500, cache_size=20):
+        self.admin = admin
+        self.refine_limit = refine_limit
+        self.cache_size = cache_size
+        self.generation = 0
+        # map the search text to the query of the rows found
+        self._queries = collections.OrderedDict()
+        # map the search text to the primary keys of the rows found, or None
+        # if there were too many rows
+        self._primary_keys = collections.OrderedDict()
+        # map the count statement to the number of rows found
+        self._counts = collections.OrderedDict()
+
+    def start(self):
+        """Start a new search, superseding all previous searches.  To be
+        called in the gui thread.
+
+        :return: the generation of the new search
+        """
+        self.generation += 1
+        return self.generation
+
+    def is_superseded(self, generation):
+        """
+        :return: `True` if a newer search has been started since the search
+            of this generation
+        """
+        return generation != self.generation
+
+    def clear(self):
+        """Forget all previous search results, for example when the data
+        might have changed"""
+        self._queries.clear()
+        self._primary_keys.clear()
+        self._counts.clear()
+
+    def _cache(self, cache, key, value):
+        cache.pop(key, None)
+        cache[key] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def decorate_query(self, query, text):
+        """Filter a query for the rows matching a search text, and keep track
+        of the result to refine the next searches.  To be called in the
+        model thread.
+
+        :param query: the query to filter
+        :param text: the search text
+        :return: the filtered query
+        """
+        decorator = create_entity_search_query_decorator(self.admin, text)
+        if decorator is None:
+            return query
+        query = decorator(query)
+        mapper = orm.class_mapper(self.admin.entity)
+        if len(mapper.primary_key) != 1:
+            return query
+        primary_key = mapper.primary_key[0]
+        candidates = [previous_text for previous_text in self._queries if
+                      refines(previous_text, text, decorator.substring_terms)]
+        refined_from = None
+        for previous_text in candidates:
+            primary_keys = self._primary_keys.get(previous_text)
+            if primary_keys is None:
+                continue
+            if (refined_from is None) or (len(primary_keys) < len(self._primary_keys[refined_from])):
+                refined_from = previous_text
+        if refined_from is None:
+            # query the keys of the most recent search that can be refined
+            # and of which the keys are not yet known
+            unknown_texts = [previous_text for previous_text in candidates if
+                             (previous_text != text) and (previous_text not in self._primary_keys)]
+            if len(unknown_texts):
+                previous_text = unknown_texts[-1]
+                key_query = self._queries[previous_text].with_entities(primary_key).order_by(None)
+                primary_keys = [row[0] for row in key_query.limit(self.refine_limit + 1)]
+                if len(primary_keys) > self.refine_limit:
+                    primary_keys = None
+                else:
+                    refined_from = previous_text
+                self._cache(self._primary_keys, previous_text, primary_keys)
+        if refined_from is not None:
+            LOGGER.debug('refine search %s from %s'%(text, refined_from))
+            primary_keys = self._primary_keys[refined_from]
+            if len(primary_keys):
+                query = query.filter(primary_key.in_(primary_keys))
+            else:
+                query = query.filter(sql.false())
+        self._cache(self._queries, text, query)
+        return query
+
+    def count(self, query, counter):
+        """Count the number of rows of a query, reusing the counts of recent
+        searches.  To be called in the model thread.
+
+        :param query: the query of which to count the rows
+        :param counter: a function that does the actual counting of the rows
+            when the count is not in the cache
+        :return: the number of rows
+        """
+        compiled = query.statement.compile()
+        key = (six.text_type(compiled), repr(sorted(compiled.params.items())))
+        count = self._counts.get(key)
+        if count is None:
+            count = counter(query)
+        self._cache(self._counts, key, count)
+        return count
 
 
@@ -114,53 +114,110 @@ def _insert_string(original, new, pos):
     '''Inserts new inside original at pos.'''
     return original[:pos] + new + original[pos:]
 
-def date_from_string(s):
-    s = s.strip()
-    if not s:
-        return None
-    f = local_date_format()
-    dt = QtCore.QDate.fromString(s, f)
-    if not dt.isValid():
-        #
-        # if there is a mismatch of 1 in length between format and
-        # string, prepend a 0, to handle the case of 1/11/2011
-        #
-        if len(f) == len(s) + 1:
-            s = '0' + s
-            dt = QtCore.QDate.fromString(s, f)
-    if not dt.isValid():
-        #
-        # try alternative separators
-        #
-        separators = u''.join([c for c in f if c not in string.ascii_letters])
-        if separators:
-            alternative_string = u''.join([(c if c in string.digits else separators[0]) for c in s])
-            dt = QtCore.QDate.fromString(alternative_string, f)
-    if not dt.isValid():
-        # try parsing without separators
+class _DateParser(object):
+    """Parser for dates in a specific format, the strings derived from the
+    format are created only once.
+
+    Strings that consist of only day, month and year digits, separated
+    as in the format, are parsed with a regular expression, all other
+    strings are passed to :meth:`QtCore.QDate.fromString`.
+    """
+
+    _patterns = {'d': r'([0-9]{1,2})', 'dd': r'([0-9]{2})',
+                 'M': r'([0-9]{1,2})', 'MM': r'([0-9]{2})',
+                 'yyyy': r'([0-9]{4})'}
+
+    def __init__(self, f):
+        self.format = f
+        self.separators = u''.join([c for c in f if c not in string.ascii_letters])
         # attention : using non ascii letters will fail on windows
         # string.letters then contains non ascii letters of which we don't know the
         # encoding, so we cannot convert them to unicode to compare them
-        only_letters_format = u''.join([c for c in f if c in string.ascii_letters])
-        only_letters_string = u''.join([c for c in s if c in (string.ascii_letters+string.digits)])
-        dt = QtCore.QDate.fromString(only_letters_string, only_letters_format)
+        self.only_letters_format = u''.join([c for c in f if c in string.ascii_letters])
+        self.no_year_format = u''.join([c for c in self.only_letters_format if c not in ['y']])
+        self.regex = None
+        self.groups = []
+        pattern = []
+        for token in re.findall(r'd+|M+|y+|[^a-zA-Z]+|[a-zA-Z]+', f):
+            if token in self._patterns:
+                pattern.append(self._patterns[token])
+                self.groups.append(token[0])
+            elif token[0] in string.ascii_letters or u"'" in token:
+                # day or month names, or quoted text
+                return
+            else:
+                pattern.append(re.escape(token))
+        if sorted(self.groups) == ['M', 'd', 'y']:
+            self.regex = re.compile(u''.join(pattern) + u'$')
+
+    def parse_digits(self, s):
+        """:return: a date, or `None` if the fast path cannot be used"""
+        if self.regex is None:
+            return None
+        match = self.regex.match(s)
+        if match is None:
+            return None
+        values = dict(zip(self.groups, (int(g) for g in match.groups())))
+        try:
+            return date(values['y'], values['M'], values['d'])
+        except ValueError:
+            return None
+
+    def parse(self, s):
+        f = self.format
+        parsed = self.parse_digits(s)
+        if parsed is not None:
+            return parsed
+        dt = QtCore.QDate.fromString(s, f)
+        if not dt.isValid():
+            #
+            # if there is a mismatch of 1 in length between format and
+            # string, prepend a 0, to handle the case of 1/11/2011
+            #
+            if len(f) == len(s) + 1:
+                s = '0' + s
+                dt = QtCore.QDate.fromString(s, f)
+        if not dt.isValid():
+            #
+            # try alternative separators
+            #
+            separators = self.separators
+            if separators:
+                alternative_string = u''.join([(c if c in string.digits else separators[0]) for c in s])
+                dt = QtCore.QDate.fromString(alternative_string, f)
         if not dt.isValid():
-            # try parsing without the year, and take the current year by default
-            only_letters_format = u''.join([c for c in only_letters_format if c not in ['y']])
-            dt = QtCore.QDate.fromString(only_letters_string, only_letters_format)
+            # try parsing without separators
+            only_letters_string = u''.join([c for c in s if c in _letters_and_digits])
+            dt = QtCore.QDate.fromString(only_letters_string, self.only_letters_format)
             if not dt.isValid():
-                raise ParsingError()
-#                # try parsing without year and month, and take the current year and month by default
-#                only_letters_format = u''.join([c for c in only_letters_format if c not in ['M']])
-#                dt = QDate.fromString(only_letters_string, only_letters_format)
-#                if not dt.isValid():
-#                    raise ParsingError()
-#                else:
-#                    today = date.today()
-#                    return date(today.year, today.month, dt.day())
-            else:
-                return date(date.today().year, dt.month(), dt.day())
-    return date(dt.year(), dt.month(), dt.day())
+                # try parsing without the year, and take the current year by default
+                dt = QtCore.QDate.fromString(only_letters_string, self.no_year_format)
+                if not dt.isValid():
+                    raise ParsingError()
+#                    # try parsing without year and month, and take the current year and month by default
+#                    only_letters_format = u''.join([c for c in only_letters_format if c not in ['M']])
+#                    dt = QDate.fromString(only_letters_string, only_letters_format)
+#                    if not dt.isValid():
+#                        raise ParsingError()
+#                    else:
+#                        today = date.today()
+#                        return date(today.year, today.month, dt.day())
+                else:
+                    return date(date.today().year, dt.month(), dt.day())
+        return date(dt.year(), dt.month(), dt.day())
+
+_letters_and_digits = frozenset(string.ascii_letters + string.digits)
+_date_parsers = {}
+
+def date_from_string(s):
+    s = s.strip()
+    if not s:
+        return None
+    f = local_date_format()
+    parser = _date_parsers.get(f)
+    if parser is None:
+        parser = _date_parsers[f] = _DateParser(f)
+    return parser.parse(s)
 
 def time_from_string(s):
     s = s.strip()
@@ -192,15 +249,26 @@ def int_from_string(s):
         value = int( value )
     return value
 
+_float_regexes = {}
+
 def float_from_string(s):
     if s == None:
         return None
     s = s.strip()
     if len(s) == 0:
         return None
-    locale = QtCore.QLocale()
+    qlocale = locale()
+    decimal_point = six.text_type(qlocale.decimalPoint())
+    regex = _float_regexes.get(decimal_point)
+    if regex is None:
+        # plain numbers without group separators or exponent are
+        # converted without the locale
+        regex = re.compile(u'-?[0-9]+(%s[0-9]+)?$'%re.escape(decimal_point))
+        _float_regexes[decimal_point] = regex
+    if regex.match(s) is not None:
+        return float(s.replace(decimal_point, u'.'))
     # floats in python are implemented as double in C
-    f, ok = locale.toDouble(s)
+    f, ok = qlocale.toDouble(s)
     if not ok:
         raise ParsingError()
     return f
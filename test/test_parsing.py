@@ -0,0 +1,121 @@
+#  ============================================================================
+#
+#  Copyright (C) 2007-2016 Conceptive Engineering bvba.
+#  www.conceptive.be / info@conceptive.be
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#      * Redistributions of source code must retain the above copyright
+#        notice, this list of conditions and the following disclaimer.
+#      * Redistributions in binary form must reproduce the above copyright
+#        notice, this list of conditions and the following disclaimer in the
+#        documentation and/or other materials provided with the distribution.
+#      * Neither the name of Conceptive Engineering nor the
+#        names of its contributors may be used to endorse or promote products
+#        derived from this software without specific prior written permission.
+#  
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+#  ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+#  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+#  (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+#  LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+#  ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#  ============================================================================
+
+"""Verify that the fast parsing paths in :mod:`camelot.view.utils` give the
+same result as the Qt functions they bypass."""
+
+import unittest
+
+from camelot.core.qt import QtCore
+from camelot.test import get_application
+from camelot.view import utils
+
+class DateParserTest(unittest.TestCase):
+    """Compare the regular expression path of the date parser with
+    :meth:`QtCore.QDate.fromString` and with the parser without regular
+    expression.
+    """
+
+    formats = [u'dd/MM/yyyy', u'd/M/yyyy', u'MM/dd/yyyy', u'M/d/yyyy',
+               u'yyyy-MM-dd', u'd.M.yyyy', u'dd.MM.yy', u'd/M/yy']
+
+    strings = [u'01/02/2011', u'1/2/2011', u'1/11/2011', u'11/1/2011',
+               u'31/12/1999', u'12/31/1999', u'29/02/2012', u'29/02/2011',
+               u'2011-02-01', u'2011-2-1', u'1.2.2011', u'01.02.11',
+               u'1/2/11', u'0/2/2011', u'32/1/2011', u'1/13/2011',
+               u'001/02/2011', u'01/02/20111', u'1/2', u'0102/2011']
+
+    def setUp(self):
+        self.app = get_application()
+
+    def parse(self, parser, s):
+        try:
+            return parser.parse(s)
+        except utils.ParsingError:
+            return None
+
+    def test_qt_equivalence(self):
+        for f in self.formats:
+            parser = utils._DateParser(f)
+            for s in self.strings:
+                parsed = parser.parse_digits(s)
+                if parsed is None:
+                    continue
+                qdate = QtCore.QDate.fromString(s, f)
+                self.assertTrue(qdate.isValid(), (f, s))
+                self.assertEqual((parsed.year, parsed.month, parsed.day),
+                                 (qdate.year(), qdate.month(), qdate.day()),
+                                 (f, s))
+
+    def test_fallback_equivalence(self):
+        for f in self.formats:
+            parser = utils._DateParser(f)
+            qt_parser = utils._DateParser(f)
+            qt_parser.regex = None
+            for s in self.strings:
+                self.assertEqual(self.parse(parser, s),
+                                 self.parse(qt_parser, s),
+                                 (f, s))
+
+class FloatParserTest(unittest.TestCase):
+    """Compare :func:`camelot.view.utils.float_from_string` with
+    :meth:`QtCore.QLocale.toDouble` for locales with a decimal point and
+    with a decimal comma.
+    """
+
+    locales = ['en_US', 'nl_BE', 'de_DE', 'fr_FR']
+
+    strings = [u'0', u'1', u'-1', u'+1', u'007', u'-0', u'1.5', u'-1.5',
+               u'1,5', u'-1,5', u'+1,5', u'+1.5', u'1.000', u'1,000',
+               u'1.000,5', u'1,000.5', u'1.000.000', u'1,000,000',
+               u'1 000,5', u'1e3', u'1,5e3', u'1.5e3', u'.5', u',5',
+               u'5.', u'5,', u'1.5.', u'--1', u'1-', u'abc']
+
+    def setUp(self):
+        self.app = get_application()
+        self.default_locale = utils._locale
+
+    def tearDown(self):
+        utils._locale = self.default_locale
+
+    def test_qt_equivalence(self):
+        for name in self.locales:
+            qlocale = QtCore.QLocale(name)
+            utils._locale = qlocale
+            for s in self.strings:
+                expected, ok = qlocale.toDouble(s)
+                if ok:
+                    self.assertEqual(utils.float_from_string(s), expected,
+                                     (name, s))
+                else:
+                    try:
+                        value = utils.float_from_string(s)
+                    except utils.ParsingError:
+                        continue
+                    self.fail('%s parsed as %s in %s'%(s, value, name))